@@ -1,12 +1,42 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, request, jsonify, send_file, g, has_app_context
 from flask_cors import CORS
 import sqlite3
 import os
+import base64
+import re
+import hashlib
+import threading
+import time
+from functools import wraps
 from datetime import datetime, timedelta
 import json
-import urllib.request
-import urllib.parse
-import json as _json
+
+from db import ConnectionPool
+from migrations import migrate
+from changes import table_revisions, changes_since, prune_change_log
+from events import EventHub
+from telegram_jobs import JobQueue, TelegramClient, prune_jobs
+from cashflow import (
+    add_cash_movement, movement, rebuild_nakit_akisi, record_cash_movements, reverse_cash_movements,
+)
+from employee_sales import prune_sales_buckets, rebuild_sales_buckets, record_sales, refresh_sales_windows, utc_today
+from product_activity import (
+    COUNTED_TYPES, prune_activity_buckets, rebuild_activity_buckets, record_activity, refresh_activity_windows,
+)
+from installments import allocate_payment, apply_allocations, release_installments, unpaid_installments
+from rollups import ROLLUP_COLUMNS, apply_islem, apply_islemler, metrics_from_rollup
+from response_cache import ResponseCache
+from json_stream import iter_rows, stream_items, stream_rows
+from compression import ResponseCompressor
+from static_files import StaticManifest
+from metrics import InstrumentedCursor, MetricsStore, begin_request
+from slow_queries import SlowQueryLog, read_only_connection
+from blob_store import BlobStore, collect_garbage, storage_report
+from sale_media import (
+    add_media, delete_media, find_media, import_legacy_media, list_media, make_variants, remove_legacy_media,
+    store_variants,
+)
+from chat_state import MemoryChatStateStore, SQLiteChatStateStore, expire_pending_photos
 
 # Load environment variables
 try:
@@ -19,69 +49,95 @@ except ImportError:
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
-# Set up static files serving if dist folder exists
-try:
-    static_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'dist')
-    if os.path.exists(static_folder):
-        app.static_folder = static_folder
-        app.static_url_path = ''
-except Exception:
-    pass  # Skip static serving if there's an issue
+# The built React app (dist/) is indexed once at startup and served from memory
+STATIC_ROOT = os.environ.get('STATIC_ROOT', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dist'))
+static_manifest = StaticManifest(STATIC_ROOT)
 
 # Database configuration
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'tukkan.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(os.path.dirname(__file__), 'media'))
+# Sale photos and their variants never change under the same name
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 86400))
+# Photo bytes are stored once per content hash; unreferenced blobs are reclaimed
+# MEDIA_GC_GRACE seconds after their last reference went away
+blob_store = BlobStore(os.path.join(MEDIA_ROOT, 'blobs'))
+MEDIA_GC_GRACE = float(os.environ.get('MEDIA_GC_GRACE', 3600))
+# Statements slower than SLOW_QUERY_MS are logged with their query plan (0 = off)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, lambda: read_only_connection(DATABASE_PATH))
+# InstrumentedCursor charges SQL statements and their time to the request being served
+db_pool = ConnectionPool(DATABASE_PATH, max_size=DB_POOL_SIZE,
+                         cursor_factory=slow_query_log.cursor_factory if slow_query_log.enabled else InstrumentedCursor)
+# Serialized GET responses, revalidated against change_log revisions (see track_changes)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+# gzip/brotli for JSON and text responses above COMPRESS_MIN_SIZE bytes
+response_compressor = ResponseCompressor(
+    min_size=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+    gzip_level=int(os.environ.get('COMPRESS_GZIP_LEVEL', 6)),
+    brotli_level=int(os.environ.get('COMPRESS_BROTLI_LEVEL', 4)),
+)
+# Per-route request metrics; each worker adds its samples to metric_samples every
+# METRICS_FLUSH_INTERVAL seconds so /api/metrics/prom covers all of them
+request_metrics = MetricsStore(lambda: db_pool.acquire(),
+                               flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', 10)))
+# Change notifications for /api/events, tailed from change_log. Past EVENTS_MAX_SUBSCRIBERS
+# streams per worker clients are sent back to polling (default: 500 under gevent, 32 with threads)
+EVENTS_MAX_SUBSCRIBERS = os.environ.get('EVENTS_MAX_SUBSCRIBERS')
+event_hub = EventHub(lambda: db_pool.acquire(),
+                     max_subscribers=int(EVENTS_MAX_SUBSCRIBERS) if EVENTS_MAX_SUBSCRIBERS else None)
 # Telegram config
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_SECRET_TOKEN = os.environ.get('TELEGRAM_SECRET_TOKEN', '')
 BOT_ACCESS_PASSWORD = os.environ.get('BOT_ACCESS_PASSWORD', '')
-
-# Simple in-process chat state cache (optional). For production, persist in DB/Redis
-chat_states = {}
+# Point TELEGRAM_API_BASE at a local fake server to exercise the bot offline
+TELEGRAM_API_BASE = os.environ.get('TELEGRAM_API_BASE', 'https://api.telegram.org')
+TELEGRAM_WORKERS = int(os.environ.get('TELEGRAM_WORKERS', 2))
+telegram = TelegramClient(TELEGRAM_BOT_TOKEN, api_base=TELEGRAM_API_BASE)
+# Outgoing Telegram calls run here, off the webhook request
+telegram_jobs = JobQueue(lambda: db_pool.acquire(), workers=TELEGRAM_WORKERS)
+
+# Chat state lives in the chat_states table so every worker sees the same
+# verification and pending photo; CHAT_STATE_BACKEND=memory keeps it per process
+CHAT_STATE_BACKEND = os.environ.get('CHAT_STATE_BACKEND', 'sqlite')
+CHAT_STATE_PENDING_TTL = float(os.environ.get('CHAT_STATE_PENDING_TTL', 3600))
+if CHAT_STATE_BACKEND == 'memory':
+    chat_state_store = MemoryChatStateStore(pending_ttl=CHAT_STATE_PENDING_TTL)
+else:
+    chat_state_store = SQLiteChatStateStore(lambda: db_pool.acquire(), pending_ttl=CHAT_STATE_PENDING_TTL)
 
 def get_chat_state(chat_id: int) -> dict:
-    state = chat_states.get(chat_id) or { 'verified': False, 'pending_photo_file_id': None, 'awaiting_code': False }
-    chat_states[chat_id] = state
-    return state
+    return chat_state_store.get(chat_id)
 
 def set_chat_state(chat_id: int, **patch):
-    state = get_chat_state(chat_id)
-    state.update(patch)
+    return chat_state_store.set(chat_id, **patch)
 
 
 # Feature flags / behavior toggles
 # If False, beklenen ödemeler payments will NOT be written into cash flow (giriş)
 ADD_BEKLENEN_TO_CASHFLOW = False
 
-def init_db():
-    """Initialize the database with all required tables"""
+def init_db(media_root=MEDIA_ROOT, store=blob_store):
+    """Initialize the database with all required tables.
+
+    Photos under media_root/sales/<id>/ are copied into store, but the old
+    files are left in place: deleting them is remove_legacy_media's job, run
+    at startup once the import is committed to the real database. Scripts
+    that point DATABASE_PATH at a copy pass their own media_root and store.
+    """
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
-    # Açık Borçlar table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS acik_borclar (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            borc_sahibi TEXT NOT NULL,
-            islem_kodu TEXT NOT NULL,
-            acik_borc REAL NOT NULL,
-            nagd_odeme REAL DEFAULT 0,
-            original_borc REAL NOT NULL,
-            payment_made BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('yönetici', 'çalışan')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Create or upgrade the schema
+    migrate(conn)
+    prune_change_log(cursor)
+    prune_jobs(cursor)
+    expire_pending_photos(cursor, CHAT_STATE_PENDING_TTL)
+    prune_sales_buckets(cursor)
+    prune_activity_buckets(cursor)
+    # Photos saved under MEDIA_ROOT/sales/<id>/ before the blob store existed
+    imported_media = import_legacy_media(cursor, store, media_root)
     
     # Add default admin user if not exists
     cursor.execute('SELECT COUNT(*) FROM users WHERE username = ?', ('Oh No!',))
@@ -91,170 +147,6 @@ def init_db():
             VALUES (?, ?, ?)
         ''', ('Oh No!', 'temmuz31201', 'yönetici'))
     
-    # Beklenen Ödemeler table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS beklenen_odemeler (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            musteri TEXT NOT NULL,
-            islem_kodu TEXT NOT NULL,
-            acik_odeme REAL NOT NULL,
-            odeme_tipi TEXT NOT NULL CHECK(odeme_tipi IN ('nakit', 'kart')),
-            taksit_sayisi INTEGER DEFAULT 0,
-            taksit_miktari REAL DEFAULT 0,
-            odeme_miktari REAL DEFAULT 0,
-            original_odeme REAL NOT NULL,
-            payment_made BOOLEAN DEFAULT FALSE,
-            last_payment_date TIMESTAMP,
-            previous_last_payment_date TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Add new columns to existing table if they don't exist
-    try:
-        cursor.execute('ALTER TABLE beklenen_odemeler ADD COLUMN taksit_sayisi INTEGER DEFAULT 0')
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        cursor.execute('ALTER TABLE beklenen_odemeler ADD COLUMN taksit_miktari REAL DEFAULT 0')
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    # Çalışanlar table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS calisanlar (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ad TEXT NOT NULL,
-            telefon TEXT,
-            pozisyon TEXT,
-            baslangic_tarihi DATE,
-            son_ay REAL DEFAULT 0,
-            son_3_ay REAL DEFAULT 0,
-            son_6_ay REAL DEFAULT 0,
-            son_12_ay REAL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Planlanan Ödemeler table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS planlanan_odemeler (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            debt_id INTEGER NOT NULL,
-            month INTEGER NOT NULL,
-            year INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            status TEXT DEFAULT 'planned' CHECK(status IN ('planned', 'due', 'paid')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (debt_id) REFERENCES acik_borclar (id)
-        )
-    ''')
-    
-    # Gündem Posts table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gundem_posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            author TEXT DEFAULT 'Yönetici',
-            is_important BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Envanter table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS envanter (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            urun_kodu TEXT NOT NULL UNIQUE,
-            metre REAL NOT NULL,
-            metre_maliyet REAL NOT NULL,
-            fiyat REAL DEFAULT 0,
-            son_islem_tarihi TEXT,
-            son_30_gun_islem INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create işlemler table with updated constraints
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS islemler (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            islem_tipi TEXT NOT NULL CHECK(islem_tipi IN ('satis', 'alis')),
-            urun_kodu TEXT NOT NULL,
-            miktar REAL NOT NULL,
-            birim_fiyat REAL NOT NULL,
-            toplam_tutar REAL NOT NULL,
-            musteri TEXT,
-            odeme_tipi TEXT CHECK(odeme_tipi IN ('nakit', 'kart', 'kredi', 'nakit+kart', 'mail order', 'pesin+taksit', 'taksit')),
-            aciklama TEXT,
-            pesin_miktar REAL DEFAULT 0,
-            taksit_miktar REAL DEFAULT 0,
-            taksit_sayisi INTEGER DEFAULT 0,
-            kar REAL DEFAULT 0,
-            odeme_plani_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (urun_kodu) REFERENCES envanter (urun_kodu),
-            FOREIGN KEY (odeme_plani_id) REFERENCES odeme_plani (id)
-        )
-    ''')
-    
-    # Nakit Akışı table - Monthly cash flows
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS nakit_akisi (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ay INTEGER NOT NULL,
-            yil INTEGER NOT NULL,
-            giris REAL DEFAULT 0,
-            cikis REAL DEFAULT 0,
-            aciklama TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(ay, yil)
-        )
-    ''')
-    
-    # Ödeme Planı table - Payment plans and installments
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS odeme_plani (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            islem_id INTEGER NOT NULL,
-            musteri TEXT NOT NULL,
-            toplam_tutar REAL NOT NULL,
-            pesin_miktar REAL DEFAULT 0,
-            taksit_miktar REAL DEFAULT 0,
-            taksit_sayisi INTEGER DEFAULT 0,
-            ay INTEGER NOT NULL,
-            yil INTEGER NOT NULL,
-            durum TEXT DEFAULT 'aktif' CHECK(durum IN ('aktif', 'tamamlandi', 'iptal')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (islem_id) REFERENCES islemler (id)
-        )
-    ''')
-    
-    # Taksit Detayları table - Individual installment details
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS taksit_detaylari (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            odeme_plani_id INTEGER NOT NULL,
-            taksit_no INTEGER NOT NULL,
-            miktar REAL NOT NULL,
-            vade_ay INTEGER NOT NULL,
-            vade_yil INTEGER NOT NULL,
-            odendi BOOLEAN DEFAULT FALSE,
-            odeme_tarihi TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (odeme_plani_id) REFERENCES odeme_plani (id)
-        )
-    ''')
-    
     # Insert sample data if tables are empty
     cursor.execute('SELECT COUNT(*) FROM acik_borclar')
     if cursor.fetchone()[0] == 0:
@@ -324,14 +216,265 @@ def init_db():
         ''', sample_nakit_akisi)
     
     conn.commit()
+    collect_garbage(conn, store, MEDIA_GC_GRACE)
     conn.close()
 
+    for media_id in imported_media:
+        telegram_jobs.enqueue('sale_media_variants', {'media_id': media_id})
+
 def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    """Get a pooled database connection; conn.close() returns it to the pool"""
+    conn = db_pool.acquire()
+    if has_app_context():
+        # Remember this checkout so teardown can reclaim a connection the route forgot
+        # to close, without touching it if it was closed and handed to another request
+        g.setdefault('db_connections', []).append((conn, conn._checkout))
     return conn
 
+@app.teardown_appcontext
+def release_db_connections(exc):
+    for conn, checkout in g.pop('db_connections', []):
+        conn.release_checkout(checkout)
+
+@app.before_request
+def start_request_metrics():
+    begin_request(request.endpoint)
+
+# Registered before the other after_request hooks so it runs last and counts the bytes actually sent
+@app.after_request
+def record_request_metrics(response):
+    if slow_query_log.enabled:
+        # The last statement of the request ends with it, after any streamed rows were read
+        response.call_on_close(slow_query_log.finish_thread)
+    return request_metrics.track(response, request.endpoint, request.method)
+
+@app.after_request
+def wake_event_hub(response):
+    # A write just committed in this worker: let SSE subscribers hear it right away
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        event_hub.notify_write()
+    return response
+
+@app.after_request
+def compress_response(response):
+    if request.method == 'HEAD':
+        return response
+    return response_compressor.compress(response, request.accept_encodings, request.endpoint)
+
+def stream_query(query, params=(), items=None):
+    """Run a read query and stream its rows as a JSON array.
+
+    With items set, items(rows) turns the rows into the dicts to send, one
+    at a time. The connection is taken from the pool directly rather than
+    through get_db_connection: teardown runs before the body is sent, so it
+    is returned when the response is closed instead.
+    """
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.execute(query, params)
+    except Exception:
+        conn.close()
+        raise
+    body = stream_rows(cursor) if items is None else stream_items(items(iter_rows(cursor)))
+    response = Response(body, mimetype='application/json')
+    response.call_on_close(conn.close)
+    return response
+
+def fetch_rows_by_id(cursor, table, ids, chunk_size=500):
+    rows = []
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT * FROM {table} WHERE id IN ({placeholders})', chunk)
+        rows.extend(dict(row) for row in cursor.fetchall())
+    return rows
+
+def delta_payload(cursor, table, since, revision):
+    """Rows of `table` changed after `since`, plus tombstones for deleted ids"""
+    changes = changes_since(cursor, table, since)
+    if changes is None:
+        # Log pruned past the client's revision: send a full snapshot instead
+        cursor.execute(f'SELECT * FROM {table}')
+        return {'revision': revision, 'reset': True,
+                'upserts': [dict(row) for row in cursor.fetchall()], 'deletes': []}
+    upsert_ids, deleted_ids = changes
+    upserts = fetch_rows_by_id(cursor, table, upsert_ids)
+    # A row that was updated and then deleted in the same window is a tombstone
+    found = {row['id'] for row in upserts}
+    deleted_ids.extend(row_id for row_id in upsert_ids if row_id not in found)
+    return {'revision': revision, 'reset': False, 'upserts': upserts, 'deletes': deleted_ids}
+
+def track_changes(*tables, delta_table=None, cached=False):
+    """ETag / 304 support for GET endpoints whose output depends only on `tables`.
+
+    The ETag is derived from the latest change_log revision of each table, so
+    an unchanged poll costs one indexed lookup and no query or serialization.
+    With delta_table set, ?since=<revision> returns only the rows of that
+    table inserted, updated or deleted after the client's revision. With
+    cached set, full responses are kept in response_cache under their ETag,
+    so a client without a matching ETag is served the bytes of the last
+    render until one of the tables is written to. A streamed response is
+    cached once its body has been sent in full.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            since = request.args.get('since')
+            if since is not None and delta_table:
+                try:
+                    since = int(since)
+                except ValueError:
+                    return jsonify({'error': 'Geçersiz since değeri'}), 400
+
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            revisions = table_revisions(cursor, tables)
+            revision = max(revisions.values())
+            # The date is part of the tag because views default to the current year
+            tag_source = (request.full_path + '|' + datetime.now().date().isoformat() + '|'
+                          + ','.join(f'{t}:{revisions[t]}' for t in tables))
+            etag = hashlib.sha1(tag_source.encode('utf-8')).hexdigest()
+
+            # Weak comparison: compressed responses carry the ETag as W/"..."
+            if request.if_none_match.contains_weak(etag):
+                conn.close()
+                response = app.response_class(status=304)
+            elif since is not None and delta_table:
+                payload = delta_payload(cursor, delta_table, since, revision)
+                conn.close()
+                response = jsonify(payload)
+            else:
+                conn.close()
+                cache_key = (request.endpoint, request.full_path)
+                hit = response_cache.get(cache_key, etag) if cached else None
+                if hit is not None:
+                    body, mimetype = hit
+                    response = app.response_class(body, mimetype=mimetype)
+                else:
+                    response = app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if cached and response.is_streamed:
+                        response.response = cache_when_sent(response.response, cache_key, etag, response.mimetype)
+                    elif cached:
+                        response_cache.put(cache_key, etag, response.get_data(), response.mimetype)
+
+            response.set_etag(etag)
+            response.headers['X-Revision'] = str(revision)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def cache_when_sent(chunks, cache_key, etag, mimetype):
+    """Pass a streamed body through, caching it if it is sent in full and fits the cache"""
+    body = []
+    size = 0
+    for chunk in chunks:
+        if body is not None:
+            body.append(chunk)
+            size += len(chunk)
+            if size > response_cache.max_bytes:
+                body = None
+        yield chunk
+    if body is not None:
+        response_cache.put(cache_key, etag, b''.join(body), mimetype)
+
+def send_message_job(payload):
+    telegram.send_message(payload['chat_id'], payload['text'])
+
+def save_sale_photo_job(payload):
+    file_path = telegram.get_file_path(payload['file_id'])
+    image_bytes = telegram.download_file(file_path)
+
+    # Stored by content hash, so a retried job or a photo sent twice is kept once
+    conn = db_pool.acquire()
+    try:
+        media_id = add_media(conn.cursor(), blob_store, payload['sale_id'], payload['filename'], image_bytes)
+        conn.commit()
+    finally:
+        conn.close()
+    telegram_jobs.enqueue('sale_media_variants', {'media_id': media_id})
+
+    telegram.send_message(payload['chat_id'], '✅ Görsel işlemle eşleştirildi.')
+
+def save_sale_photo_failed(payload):
+    telegram.send_message(payload['chat_id'], '❌ Görsel kaydedilemedi.')
+
+def sale_media_variants_job(payload):
+    conn = db_pool.acquire()
+    try:
+        row = conn.execute('SELECT filename, sha256 FROM sale_media WHERE id = ?', (payload['media_id'],)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return  # removed before the job ran
+
+    # Resizing runs without holding a connection
+    variants = make_variants(blob_store.read(row['sha256']))
+
+    conn = db_pool.acquire()
+    try:
+        store_variants(conn.cursor(), blob_store, payload['media_id'], row['filename'], variants)
+        conn.commit()
+    finally:
+        conn.close()
+
+def collect_media_garbage():
+    """One incremental GC pass over orphaned media blobs; returns (deleted, freed_bytes)"""
+    conn = db_pool.acquire()
+    try:
+        return collect_garbage(conn, blob_store, MEDIA_GC_GRACE)
+    finally:
+        conn.close()
+
+_media_gc_lock = threading.Lock()
+_media_gc_timer = None
+_media_gc_due = 0.0
+
+def schedule_media_gc():
+    """Collect blobs orphaned by a delete in the background, once their grace period is over
+
+    A delete's blobs can only be reclaimed MEDIA_GC_GRACE seconds later, so nothing is
+    gained by collecting in the request. One timer per process is pending at a time;
+    deletes made while it waits push its due time and it re-arms itself for them.
+    """
+    global _media_gc_due
+    with _media_gc_lock:
+        _media_gc_due = time.monotonic() + MEDIA_GC_GRACE + 1
+        if _media_gc_timer is None:
+            _arm_media_gc(MEDIA_GC_GRACE + 1)
+
+def _arm_media_gc(delay):
+    global _media_gc_timer
+    _media_gc_timer = threading.Timer(delay, _run_scheduled_media_gc)
+    _media_gc_timer.daemon = True
+    _media_gc_timer.start()
+
+def _run_scheduled_media_gc():
+    global _media_gc_timer
+    try:
+        while collect_media_garbage()[0]:
+            pass
+    except (sqlite3.Error, OSError) as e:
+        print(f"Media GC failed: {e}")
+    with _media_gc_lock:
+        remaining = _media_gc_due - time.monotonic()
+        if remaining > 0:
+            _arm_media_gc(remaining)
+        else:
+            _media_gc_timer = None
+
+telegram_jobs.register('send_message', send_message_job)
+telegram_jobs.register('save_sale_photo', save_sale_photo_job, on_failure=save_sale_photo_failed)
+telegram_jobs.register('sale_media_variants', sale_media_variants_job)
+
+@app.before_request
+def start_telegram_jobs():
+    # Pick up jobs left over from a previous run as soon as this worker serves a request
+    if telegram.enabled:
+        telegram_jobs.ensure_started()
+
 # API Routes
 
 @app.route('/webhook/telegram', methods=['POST'])
@@ -380,6 +523,12 @@ def telegram_webhook_handler():
             print(f"[WEBHOOK] No message in update - returning ok")
             return jsonify({'status': 'ok'})
 
+        # Telegram redelivers an update until it gets a 200; handle each one once
+        update_id = update.get('update_id')
+        if telegram_jobs.seen(update_id):
+            print(f"[WEBHOOK] Update {update_id} already handled - returning ok")
+            return jsonify({'status': 'ok'})
+
         # Extract chat info
         chat = message.get('chat', {})
         chat_id = chat.get('id')
@@ -397,17 +546,12 @@ def telegram_webhook_handler():
             print(f"[WEBHOOK] Chat state error: {e}")
             return jsonify({'status': 'ok'})
 
-        # Helper function to send messages
+        # Replies are queued; each update sends at most one
         def send_text(text):
-            if not TELEGRAM_BOT_TOKEN:
+            if not telegram.enabled:
                 return
-            try:
-                url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-                data = _json.dumps({'chat_id': chat_id, 'text': text}).encode('utf-8')
-                req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
-                urllib.request.urlopen(req, timeout=10)
-            except Exception as e:
-                print(f"Send message error: {e}")
+            telegram_jobs.enqueue('send_message', {'chat_id': chat_id, 'text': text},
+                                  chat_id=chat_id, update_id=update_id)
 
         # Extract message content
         text = message.get('text')
@@ -444,19 +588,20 @@ def telegram_webhook_handler():
                     send_text('Lütfen önce fotoğraf gönderin.')
                     return jsonify({'status': 'ok'})
 
-                # Find matching sale
+                # Find matching sale: exact code, else an unambiguous code prefix
+                code = code.upper()
                 conn = get_db_connection()
                 cur = conn.cursor()
-                cur.execute("""
-                    SELECT id, aciklama FROM islemler
-                    WHERE islem_tipi='satis' AND (
-                      aciklama LIKE '%' || ? || '%' OR
-                      aciklama LIKE '%Satış ID: ' || ? || '%'
-                    )
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """, (code, code))
+                cur.execute("SELECT id FROM islemler WHERE islem_kodu = ? AND islem_tipi = 'satis'", (code,))
                 row = cur.fetchone()
+                if not row and code:
+                    cur.execute("""
+                        SELECT id FROM islemler
+                        WHERE islem_kodu >= ? AND islem_kodu < ? AND islem_tipi = 'satis'
+                        LIMIT 2
+                    """, (code, prefix_upper_bound(code)))
+                    matches = cur.fetchall()
+                    row = matches[0] if len(matches) == 1 else None
                 
                 if not row:
                     conn.close()
@@ -464,41 +609,17 @@ def telegram_webhook_handler():
                     return jsonify({'status': 'ok'})
 
                 sale_id = row['id']
-
-                # Download and save image
-                try:
-                    # Get file info
-                    q = urllib.parse.urlencode({'file_id': file_id})
-                    with urllib.request.urlopen(f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getFile?{q}", timeout=10) as resp:
-                        file_info = _json.loads(resp.read().decode('utf-8'))
-                    
-                    file_path = file_info.get('result', {}).get('file_path')
-                    if not file_path:
-                        raise Exception('no file_path')
-                    
-                    # Download file
-                    file_url = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/{file_path}"
-                    with urllib.request.urlopen(file_url, timeout=15) as f:
-                        image_bytes = f.read()
-                    
-                    # Save file
-                    media_root = os.path.join(os.path.dirname(__file__), 'media', 'sales', str(sale_id))
-                    os.makedirs(media_root, exist_ok=True)
-                    filename = datetime.now().strftime('%Y%m%d_%H%M%S') + '.jpg'
-                    filepath = os.path.join(media_root, filename)
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(image_bytes)
-                    
-                    conn.close()
-                    set_chat_state(chat_id, pending_photo_file_id=None, awaiting_code=False)
-                    send_text('✅ Görsel işlemle eşleştirildi.')
-                    
-                except Exception as e:
-                    print(f"File download/save error: {e}")
-                    conn.close()
-                    send_text('❌ Görsel kaydedilemedi.')
-                
+                conn.close()
+
+                # Download and save image in the background; the job replies when done
+                if telegram.enabled:
+                    telegram_jobs.enqueue('save_sale_photo', {
+                        'chat_id': chat_id,
+                        'file_id': file_id,
+                        'sale_id': sale_id,
+                        'filename': datetime.now().strftime('%Y%m%d_%H%M%S') + '.jpg',
+                    }, chat_id=chat_id, update_id=update_id)
+                set_chat_state(chat_id, pending_photo_file_id=None, awaiting_code=False)
                 return jsonify({'status': 'ok'})
                 
             except Exception as e:
@@ -542,61 +663,157 @@ def debug_endpoint():
         'timestamp': str(datetime.now())
     }), 200
 
+@app.route('/api/debug/db-pool', methods=['GET'])
+def debug_db_pool():
+    """Connection pool statistics for this worker process"""
+    return jsonify(db_pool.stats()), 200
+
+@app.route('/api/debug/telegram-jobs', methods=['GET'])
+def debug_telegram_jobs():
+    """Telegram job queue counts, worker and chat state cache statistics"""
+    return jsonify({**telegram_jobs.stats(), 'chat_state': chat_state_store.stats()}), 200
+
+@app.route('/api/debug/response-cache', methods=['GET'])
+def debug_response_cache():
+    """Response cache size and hit/miss counters for this worker process"""
+    return jsonify(response_cache.stats()), 200
+
+@app.route('/api/debug/compression', methods=['GET'])
+def debug_compression():
+    """Per-endpoint compression ratio and CPU time for this worker process"""
+    return jsonify(response_compressor.stats()), 200
+
+@app.route('/api/metrics/prom', methods=['GET'])
+def metrics_prometheus():
+    """Per-route request, latency, response size and SQL metrics of all workers (Prometheus text format)"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/metrics', methods=['GET'])
+def debug_metrics():
+    """Samples recorded and flushed by this worker process"""
+    return jsonify(request_metrics.stats()), 200
+
+@app.route('/api/debug/slow-queries', methods=['GET', 'DELETE'])
+def debug_slow_queries():
+    """Statements over SLOW_QUERY_MS in this worker, by cumulative time, with their query plans"""
+    if request.method == 'DELETE':
+        slow_query_log.clear()
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(slow_query_log.report(limit=limit)), 200
+
+@app.route('/api/debug/static', methods=['GET'])
+def debug_static():
+    """Static manifest summary: files, precompressed siblings, bytes held in memory"""
+    return jsonify(static_manifest.stats()), 200
+
+@app.route('/api/debug/events', methods=['GET'])
+def debug_events():
+    """Event hub statistics for this worker process"""
+    return jsonify(event_hub.stats()), 200
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of change notifications (table, id, op).
+
+    ?tables=a,b limits the stream to those tables. Reconnecting clients send
+    Last-Event-ID and get the missed events replayed, or a `reset` event when
+    they fell too far behind and should refetch.
+    """
+    tables = [t for t in request.args.get('tables', '').split(',') if t]
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return Response(
+        event_hub.stream(last_event_id=last_event_id, tables=tables),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 # Media serving endpoint for sale photos
 @app.route('/api/media/sales/<int:sale_id>/<filename>')
 def serve_sale_media(sale_id, filename):
-    """Serve media files for sales"""
+    """Serve a sale photo or one of its variants (ETag, conditional GET and Range via send_file)"""
     try:
-        media_dir = os.path.join(os.path.dirname(__file__), 'media', 'sales', str(sale_id))
-        if not os.path.exists(media_dir):
-            return jsonify({'error': 'Media directory not found'}), 404
-        
-        file_path = os.path.join(media_dir, filename)
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found'}), 404
-        
         # Security check - ensure filename doesn't contain path traversal
         if '..' in filename or '/' in filename or '\\' in filename:
             return jsonify({'error': 'Invalid filename'}), 400
         
-        return send_from_directory(media_dir, filename)
+        conn = get_db_connection()
+        media, variant = find_media(conn.cursor(), sale_id, filename)
+        conn.close()
+        if media is None:
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Every file is a blob, and its content hash is its ETag
+        sha256 = media[f'{variant}_sha256'] if variant else media['sha256']
+        mimetype = 'image/jpeg' if variant else media['mimetype']
+        return send_file(blob_store.path(sha256), mimetype=mimetype, etag=sha256, max_age=MEDIA_MAX_AGE)
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': f'Error serving media: {str(e)}'}), 500
 
 # API endpoint to list media files for a sale
 @app.route('/api/sales/<int:sale_id>/media', methods=['GET'])
+@track_changes('sale_media')
 def get_sale_media(sale_id):
-    """Get list of media files for a sale"""
+    """List a sale's photos from the sale_media manifest, with thumbnail and preview URLs"""
     try:
-        media_dir = os.path.join(os.path.dirname(__file__), 'media', 'sales', str(sale_id))
-        if not os.path.exists(media_dir):
-            return jsonify({'files': []})
+        conn = get_db_connection()
+        media = list_media(conn.cursor(), sale_id)
+        conn.close()
         
         files = []
-        for filename in os.listdir(media_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                file_path = os.path.join(media_dir, filename)
-                file_stats = os.stat(file_path)
-                files.append({
-                    'filename': filename,
-                    'url': f'/api/media/sales/{sale_id}/{filename}',
-                    'size': file_stats.st_size,
-                    'created_at': datetime.fromtimestamp(file_stats.st_ctime).isoformat()
-                })
+        for item in media:
+            url = f'/api/media/sales/{sale_id}/{item["filename"]}'
+            files.append({
+                'filename': item['filename'],
+                'url': url,
+                # Until the variants are written (or without Pillow) the original stands in
+                'thumb_url': f'/api/media/sales/{sale_id}/{item["thumb_filename"]}' if item['thumb_filename'] else url,
+                'preview_url': f'/api/media/sales/{sale_id}/{item["preview_filename"]}' if item['preview_filename'] else url,
+                'size': item['size'],
+                'width': item['width'],
+                'height': item['height'],
+                'sha256': item['sha256'],
+                'created_at': item['created_at'],
+            })
         
         return jsonify({'files': files})
     except Exception as e:
         return jsonify({'error': f'Error listing media: {str(e)}'}), 500
 
+@app.route('/api/media/storage', methods=['GET'])
+def get_media_storage():
+    """Blob store usage: stored vs referenced bytes, deduplication savings, orphans awaiting GC"""
+    conn = get_db_connection()
+    report = storage_report(conn.cursor())
+    conn.close()
+    return jsonify({**report, 'root': blob_store.root, 'gc_grace_s': MEDIA_GC_GRACE})
+
+@app.route('/api/media/gc', methods=['POST'])
+def run_media_gc():
+    """Run incremental GC passes over orphaned blobs (at most ?batches=, default 10)"""
+    try:
+        batches = max(1, int(request.args.get('batches', 10)))
+    except ValueError:
+        return jsonify({'error': 'Geçersiz batches değeri'}), 400
+    deleted = freed = 0
+    for _ in range(batches):
+        batch_deleted, batch_freed = collect_media_garbage()
+        deleted += batch_deleted
+        freed += batch_freed
+        if not batch_deleted:
+            break
+    return jsonify({'deleted_blobs': deleted, 'freed_bytes': freed})
+
 @app.route('/api/acik-borclar', methods=['GET'])
+@track_changes('acik_borclar', delta_table='acik_borclar', cached=True)
 def get_acik_borclar():
     """Get all açık borçlar"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM acik_borclar ORDER BY created_at DESC')
-    borclar = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(borclar)
+    return stream_query('SELECT * FROM acik_borclar ORDER BY created_at DESC')
 
 @app.route('/api/acik-borclar', methods=['POST'])
 def create_acik_borc():
@@ -646,16 +863,8 @@ def make_payment_acik_borc(borc_id):
     # Reflect expense in cash flow for current month
     current_month = datetime.now().month
     current_year = datetime.now().year
-    cursor.execute('''
-        INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-        VALUES (?, ?, 
-                COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
-                ?, CURRENT_TIMESTAMP)
-    ''', (current_month, current_year,
-          current_month, current_year,
-          current_month, current_year, odeme_miktari,
-          f"Açık borç ödemesi - {borc['borc_sahibi']}"))
+    add_cash_movement(cursor, current_month, current_year, 'cikis', odeme_miktari,
+                      f"Açık borç ödemesi - {borc['borc_sahibi']}", 'acik_borc', borc_id)
     
     conn.commit()
     conn.close()
@@ -679,20 +888,14 @@ def undo_payment_acik_borc(borc_id):
         WHERE id = ?
     ''', (borc_id,))
 
-    # Reverse cash flow for current month
-    if last_paid > 0:
+    # The debt is reset to its original amount, so every recorded payment is reversed;
+    # payments made before the ledger existed fall back to the last paid amount
+    reversed_count = reverse_cash_movements(cursor, 'acik_borc', borc_id, 'Açık borç ödeme geri alma')
+    if not reversed_count and last_paid > 0:
         current_month = datetime.now().month
         current_year = datetime.now().year
-        cursor.execute('''
-            INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-            VALUES (?, ?, 
-                    COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                    MAX(0, COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) - ?),
-                    ?, CURRENT_TIMESTAMP)
-        ''', (current_month, current_year,
-              current_month, current_year,
-              current_month, current_year, last_paid,
-              'Açık borç ödeme geri alma'))
+        add_cash_movement(cursor, current_month, current_year, 'cikis', -last_paid,
+                          'Açık borç ödeme geri alma', 'acik_borc', borc_id)
     
     conn.commit()
     conn.close()
@@ -700,80 +903,78 @@ def undo_payment_acik_borc(borc_id):
     return jsonify({'message': 'Ödeme geri alındı'})
 
 @app.route('/api/beklenen-odemeler', methods=['GET'])
+@track_changes('islemler', 'odeme_plani', 'taksit_detaylari')
 def get_beklenen_odemeler():
     """Get all beklenen ödemeler with debt information from transactions"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get transactions that have outstanding debts (taksit_miktar > 0)
-    # ONLY include transactions where the installment portion is paid with 'nakit'
-    cursor.execute('''
+    # Transactions with an outstanding installment debt paid in 'nakit', built in one
+    # set-based query. Open plans are found through the partial index of unpaid
+    # installments, so the cost follows the number of open plans, not the history.
+    return stream_query('''
+        WITH acik_planlar AS (
+            SELECT odeme_plani_id, SUM(miktar) as remaining_amount
+            FROM taksit_detaylari
+            WHERE odendi = 0
+            GROUP BY odeme_plani_id
+            HAVING SUM(miktar) > 0
+        ),
+        plan_ozet AS (
+            SELECT 
+                odeme_plani_id,
+                COUNT(*) as total_installments,
+                COUNT(CASE WHEN odendi = 1 THEN 1 END) as paid_installments,
+                MAX(CASE WHEN odendi = 1 THEN odeme_tarihi END) as last_payment_date
+            FROM taksit_detaylari
+            WHERE odeme_plani_id IN (SELECT odeme_plani_id FROM acik_planlar)
+            GROUP BY odeme_plani_id
+        ),
+        borclu_islemler AS (
+            -- A cart sale shares one plan between its lines; the plan is listed once,
+            -- under its first line, with the taksit amount of the whole plan
+            SELECT i.id, i.islem_kodu, i.musteri, i.aciklama, i.taksit_odeme_tipi,
+                   COALESCE(op.taksit_miktar, i.taksit_miktar) as taksit_miktar, i.taksit_sayisi,
+                   i.created_at, i.odeme_plani_id, a.remaining_amount as acik_odeme
+            FROM acik_planlar a
+            CROSS JOIN islemler i ON i.odeme_plani_id = a.odeme_plani_id  -- drive from the open plans
+            LEFT JOIN odeme_plani op ON op.id = a.odeme_plani_id
+            WHERE i.islem_tipi = 'satis' AND i.taksit_miktar > 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM islemler o
+                  WHERE o.odeme_plani_id = i.odeme_plani_id AND o.id < i.id
+                    AND o.islem_tipi = 'satis' AND o.taksit_miktar > 0
+              )
+            UNION ALL
+            -- Installment sales recorded without a payment plan
+            SELECT i.id, i.islem_kodu, i.musteri, i.aciklama, i.taksit_odeme_tipi, i.taksit_miktar, i.taksit_sayisi,
+                   i.created_at, i.odeme_plani_id, i.taksit_miktar as acik_odeme
+            FROM islemler i
+            WHERE i.islem_tipi = 'satis' AND i.taksit_miktar > 0 AND i.odeme_plani_id IS NULL
+        )
         SELECT 
-            i.id as transaction_id,
-            i.musteri,
-            CASE 
-                WHEN i.aciklama LIKE '%Satış ID: SAT-%' THEN 
-                    SUBSTR(i.aciklama, INSTR(i.aciklama, 'Satış ID: ') + 10, 15)
-                ELSE 'SAT-' || i.id
-            END as islem_kodu,
-            i.taksit_miktar as acik_odeme,
-            CASE 
-                WHEN i.aciklama LIKE '%Taksit_Odeme_Tipi: kart%' THEN 'kart'
-                ELSE 'nakit'
-            END as odeme_tipi,
-            i.taksit_sayisi,
-            CASE WHEN i.taksit_sayisi > 0 THEN i.taksit_miktar / i.taksit_sayisi ELSE 0 END as taksit_miktari,
-            i.created_at,
-            i.odeme_plani_id,
-            i.created_at as last_payment_date
-        FROM islemler i
-        WHERE i.islem_tipi = 'satis' 
-        AND i.taksit_miktar > 0
-        AND i.aciklama NOT LIKE '%Taksit_Odeme_Tipi: kart%'
-        ORDER BY i.created_at DESC
-    ''')
-    
-    odemeler = [dict(row) for row in cursor.fetchall()]
-    
-    # Calculate remaining debt and last payment date for each transaction
-    for odeme in odemeler:
-        if odeme['odeme_plani_id']:
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_installments,
-                    COUNT(CASE WHEN odendi = 1 THEN 1 END) as paid_installments,
-                    SUM(CASE WHEN odendi = 0 THEN miktar ELSE 0 END) as remaining_amount,
-                    MAX(CASE WHEN odendi = 1 THEN odeme_tarihi END) as last_payment_date
-                FROM taksit_detaylari 
-                WHERE odeme_plani_id = ?
-            ''', (odeme['odeme_plani_id'],))
-            
-            debt_info = cursor.fetchone()
-            if debt_info:
-                odeme['acik_odeme'] = debt_info['remaining_amount'] or 0
-                odeme['paid_installments'] = debt_info['paid_installments']
-                odeme['total_installments'] = debt_info['total_installments']
-                odeme['paymentMade'] = debt_info['paid_installments'] > 0
-                
-                # Update last payment date if there were payments
-                if debt_info['last_payment_date']:
-                    odeme['last_payment_date'] = debt_info['last_payment_date']
-    
-    # Filter based on business rules - ONLY show nakit payments with unpaid installments
-    filtered_odemeler = []
-    for odeme in odemeler:
-        # Only show transactions that have unpaid installments AND are nakit payments
-        if odeme['acik_odeme'] > 0 and odeme['odeme_tipi'] == 'nakit':
-            from datetime import datetime, timedelta
-            last_payment = datetime.fromisoformat(odeme['last_payment_date'].replace('Z', '+00:00'))
-            days_since_payment = (datetime.now() - last_payment).days
-            
-            # Show if it's been more than 25 days OR if there are unpaid installments
-            if days_since_payment > 25 or odeme['acik_odeme'] > 0:
-                filtered_odemeler.append(odeme)
-    
-    conn.close()
-    return jsonify(filtered_odemeler)
+            b.id as transaction_id,
+            b.musteri,
+            COALESCE(b.islem_kodu, 'SAT-' || b.id) as islem_kodu,
+            b.acik_odeme,
+            'nakit' as odeme_tipi,
+            b.taksit_sayisi,
+            CASE WHEN b.taksit_sayisi > 0 THEN b.taksit_miktar / b.taksit_sayisi ELSE 0 END as taksit_miktari,
+            b.created_at,
+            b.odeme_plani_id,
+            COALESCE(p.last_payment_date, b.created_at) as last_payment_date,
+            CAST(julianday(:now) - julianday(COALESCE(p.last_payment_date, b.created_at)) AS INTEGER)
+                as days_since_payment,
+            COALESCE(p.paid_installments, 0) as paid_installments,
+            COALESCE(p.total_installments, 0) as total_installments
+        FROM borclu_islemler b
+        LEFT JOIN plan_ozet p ON p.odeme_plani_id = b.odeme_plani_id
+        WHERE COALESCE(b.taksit_odeme_tipi, 'nakit') != 'kart'
+        ORDER BY b.created_at DESC
+    ''', {'now': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, items=with_payment_made)
+
+def with_payment_made(rows):
+    for row in rows:
+        odeme = dict(row)
+        odeme['paymentMade'] = odeme['paid_installments'] > 0
+        yield odeme
 
 @app.route('/api/beklenen-odemeler', methods=['POST'])
 def create_beklenen_odeme():
@@ -835,14 +1036,9 @@ def make_payment_beklenen_odeme(transaction_id):
         conn.close()
         return jsonify({'error': 'Ödeme planı bulunamadı'}), 404
     
-    # Compute total remaining across unpaid installments
-    cursor.execute('''
-        SELECT COALESCE(SUM(miktar), 0) as remaining
-        FROM taksit_detaylari
-        WHERE odeme_plani_id = ? AND odendi = 0
-    ''', (odeme_plani_id,))
-    row_remaining = cursor.fetchone()
-    total_remaining = float(row_remaining['remaining'] if row_remaining else 0)
+    # One ordered read of the unpaid installments serves both the check and the allocation
+    installments = unpaid_installments(cursor, odeme_plani_id)
+    total_remaining = sum(float(installment['miktar']) for installment in installments)
     if odeme_miktari <= 0 or total_remaining <= 0:
         conn.close()
         return jsonify({'error': 'Ödenecek bir tutar bulunamadı'}), 400
@@ -850,60 +1046,22 @@ def make_payment_beklenen_odeme(transaction_id):
         conn.close()
         return jsonify({'error': f'Ödeme miktarı toplam kalan borçtan (₺{total_remaining}) fazla olamaz'}), 400
 
-    # Process payments across installments sequentially
-    remaining_to_pay = odeme_miktari
-    total_paid = 0.0
-    paid_installments = 0
+    # Settle installments oldest first: covered ones are marked paid, the rest
+    # reduces the next installment
+    allocations = allocate_payment(installments, odeme_miktari)
+    paid_installments = apply_allocations(cursor, allocations)
+    total_paid = sum(pay_now for _, pay_now, _ in allocations)
 
-    # Check if this is a mail order transaction
-    transaction_dict = dict(transaction)
-    is_mail_order = (transaction_dict.get('aciklama') or '').find('Mail_Order: true') != -1
+    is_mail_order = bool(transaction['is_mail_order'])
     current_month = datetime.now().month
     current_year = datetime.now().year
 
-    while remaining_to_pay > 1e-9:
-        cursor.execute('''
-            SELECT * FROM taksit_detaylari 
-            WHERE odeme_plani_id = ? AND odendi = 0 
-            ORDER BY taksit_no ASC 
-            LIMIT 1
-        ''', (odeme_plani_id,))
-        next_installment = cursor.fetchone()
-        if not next_installment:
-            break
-
-        installment_amount = float(next_installment['miktar'])
-        pay_now = min(installment_amount, remaining_to_pay)
-
-        if pay_now + 1e-6 >= installment_amount:
-            # Full installment paid
-            cursor.execute('''
-                UPDATE taksit_detaylari 
-                SET odendi = 1, odeme_tarihi = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (next_installment['id'],))
-            paid_installments += 1
-        else:
-            # Partial payment: reduce remaining amount
-            new_amount = max(0.0, installment_amount - pay_now)
-            cursor.execute('''
-                UPDATE taksit_detaylari 
-                SET miktar = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (new_amount, next_installment['id']))
-
-        total_paid += pay_now
-        remaining_to_pay -= pay_now
-
-        if ADD_BEKLENEN_TO_CASHFLOW and not is_mail_order:
-            cursor.execute('''
-                INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-                VALUES (?, ?, 
-                        COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
-                        COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                        ?, CURRENT_TIMESTAMP)
-            ''', (current_month, current_year, current_month, current_year, pay_now, 
-                  current_month, current_year, f"Taksit ödemesi - {transaction['musteri']}"))
+    if ADD_BEKLENEN_TO_CASHFLOW and not is_mail_order:
+        record_cash_movements(cursor, [
+            movement(current_month, current_year, 'giris', pay_now,
+                     f"Taksit ödemesi - {transaction['musteri']}", 'taksit', installment['id'])
+            for installment, pay_now, _ in allocations
+        ])
 
     conn.commit()
     conn.close()
@@ -952,29 +1110,21 @@ def undo_payment_beklenen_odeme(transaction_id):
         return jsonify({'error': 'Geri alınacak ödeme bulunamadı'}), 404
     
     # Mark installment as unpaid
-    cursor.execute('''
-        UPDATE taksit_detaylari 
-        SET odendi = 0, odeme_tarihi = NULL, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (last_paid_installment['id'],))
+    release_installments(cursor, [last_paid_installment['id']])
     
     # Remove payment from cash flow
     current_month = datetime.now().month
     current_year = datetime.now().year
     
-    # Check if this is a mail order transaction
-    transaction_dict = dict(transaction)
-    is_mail_order = (transaction_dict.get('aciklama') or '').find('Mail_Order: true') != -1
+    is_mail_order = bool(transaction['is_mail_order'])
     
     if ADD_BEKLENEN_TO_CASHFLOW and not is_mail_order:
-        cursor.execute('''
-            INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-            VALUES (?, ?, 
-                    MAX(0, COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) - ?),
-                    COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                    ?, CURRENT_TIMESTAMP)
-        ''', (current_month, current_year, current_month, current_year, last_paid_installment['miktar'], 
-              current_month, current_year, f"Taksit geri alma - {transaction['musteri']}"))
+        # Only the payment that completed the installment is reversed: it covered exactly
+        # the installment's current amount, while earlier partial payments stay applied
+        aciklama = f"Taksit geri alma - {transaction['musteri']}"
+        if not reverse_cash_movements(cursor, 'taksit', last_paid_installment['id'], aciklama, latest_only=True):
+            add_cash_movement(cursor, current_month, current_year, 'giris', -last_paid_installment['miktar'],
+                              aciklama, 'taksit', last_paid_installment['id'])
     
     conn.commit()
     conn.close()
@@ -987,15 +1137,41 @@ def undo_payment_beklenen_odeme(transaction_id):
 
 
 
+windows_refreshed_on = None
+
+
+def current_windows(view):
+    """Move the employee sales and product activity windows on to today before
+    the view (and its ETag) runs, and prune change_log, which otherwise only
+    shrinks at startup.
+
+    Costs a few UPDATEs per worker per day; other requests only compare a date.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        global windows_refreshed_on
+        today = utc_today()
+        if windows_refreshed_on != today:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            refresh_sales_windows(cursor, today=today)
+            prune_sales_buckets(cursor, today)
+            refresh_activity_windows(cursor, today=today)
+            prune_activity_buckets(cursor, today)
+            prune_change_log(cursor)
+            conn.commit()
+            conn.close()
+            windows_refreshed_on = today
+        return view(*args, **kwargs)
+    return wrapper
+
+
 @app.route('/api/calisanlar', methods=['GET'])
+@current_windows
+@track_changes('calisanlar', delta_table='calisanlar', cached=True)
 def get_calisanlar():
     """Get all çalışanlar"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM calisanlar ORDER BY created_at DESC')
-    calisanlar = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(calisanlar)
+    return stream_query('SELECT * FROM calisanlar ORDER BY created_at DESC')
 
 @app.route('/api/calisanlar', methods=['POST'])
 def create_calisan():
@@ -1051,6 +1227,7 @@ def delete_calisan(calisan_id):
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM calisanlar WHERE id = ?', (calisan_id,))
+    cursor.execute('DELETE FROM calisan_gunluk_satis WHERE calisan_id = ?', (calisan_id,))
     
     conn.commit()
     conn.close()
@@ -1058,14 +1235,10 @@ def delete_calisan(calisan_id):
     return jsonify({'message': 'Çalışan silindi'})
 
 @app.route('/api/planlanan-odemeler', methods=['GET'])
+@track_changes('planlanan_odemeler', delta_table='planlanan_odemeler', cached=True)
 def get_planlanan_odemeler():
     """Get all planlanan ödemeler"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM planlanan_odemeler ORDER BY year, month')
-    odemeler = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(odemeler)
+    return stream_query('SELECT * FROM planlanan_odemeler ORDER BY year, month')
 
 @app.route('/api/planlanan-odemeler', methods=['POST'])
 def create_planlanan_odeme():
@@ -1127,28 +1300,8 @@ def confirm_planlanan_odeme(odeme_id):
         ''', (payment_dict['amount'], payment_dict['amount'], payment_dict['debt_id']))
         
         # Add payment to cash flow as expense (çıkış)
-        # First check if record exists
-        cursor.execute('SELECT giris, cikis FROM nakit_akisi WHERE ay = ? AND yil = ?', 
-                      (payment_dict['month'], payment_dict['year']))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing record
-            cursor.execute('''
-                UPDATE nakit_akisi 
-                SET cikis = cikis + ?, 
-                    aciklama = COALESCE(aciklama, '') || '; Borç ödemesi ₺' || ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE ay = ? AND yil = ?
-            ''', (payment_dict['amount'], payment_dict['amount'], 
-                  payment_dict['month'], payment_dict['year']))
-        else:
-            # Insert new record
-            cursor.execute('''
-                INSERT INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-                VALUES (?, ?, 0, ?, ?, CURRENT_TIMESTAMP)
-            ''', (payment_dict['month'], payment_dict['year'], payment_dict['amount'],
-                  f"Borç ödemesi ₺{payment_dict['amount']}"))
+        add_cash_movement(cursor, payment_dict['month'], payment_dict['year'], 'cikis', payment_dict['amount'],
+                          f"Borç ödemesi ₺{payment_dict['amount']}", 'planlanan_odeme', odeme_id)
         
         conn.commit()
         return jsonify({'message': 'Ödeme onaylandı ve nakit akışına eklendi'})
@@ -1174,6 +1327,10 @@ def delete_planlanan_odeme(odeme_id):
         
         payment_dict = dict(payment)
         
+        # Cancel the expense a confirmed payment added to cash flow
+        reverse_cash_movements(cursor, 'planlanan_odeme', odeme_id,
+                               f"Borç ödemesi silindi ₺{payment_dict['amount']}")
+        
         # Delete planned payment
         cursor.execute('DELETE FROM planlanan_odemeler WHERE id = ?', (odeme_id,))
         
@@ -1187,14 +1344,10 @@ def delete_planlanan_odeme(odeme_id):
         conn.close()
 
 @app.route('/api/gundem-posts', methods=['GET'])
+@track_changes('gundem_posts', delta_table='gundem_posts', cached=True)
 def get_gundem_posts():
     """Get all gündem posts"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM gundem_posts ORDER BY created_at DESC')
-    posts = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(posts)
+    return stream_query('SELECT * FROM gundem_posts ORDER BY created_at DESC')
 
 @app.route('/api/gundem-posts', methods=['POST'])
 def create_gundem_post():
@@ -1230,32 +1383,22 @@ def delete_gundem_post(post_id):
 @app.route('/api/overdue-payments', methods=['GET'])
 def get_overdue_payments():
     """Get payments that are overdue (>30 days for nakit payments)"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
     
-    cursor.execute('''
+    return stream_query('''
         SELECT * FROM beklenen_odemeler 
         WHERE odeme_tipi = 'nakit' 
         AND last_payment_date IS NOT NULL 
         AND last_payment_date < ?
         ORDER BY last_payment_date ASC
     ''', (thirty_days_ago,))
-    
-    overdue = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(overdue)
 
 @app.route('/api/envanter', methods=['GET'])
+@current_windows
+@track_changes('envanter', delta_table='envanter', cached=True)
 def get_envanter():
     """Get all envanter items"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM envanter ORDER BY urun_kodu')
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(items)
+    return stream_query('SELECT * FROM envanter ORDER BY urun_kodu')
 
 @app.route('/api/envanter', methods=['POST'])
 def create_envanter_item():
@@ -1266,12 +1409,14 @@ def create_envanter_item():
     
     try:
         cursor.execute('''
-            INSERT INTO envanter (urun_kodu, metre, metre_maliyet, fiyat, son_islem_tarihi, son_30_gun_islem)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO envanter (urun_kodu, metre, metre_maliyet, fiyat, son_islem_tarihi)
+            VALUES (?, ?, ?, ?, ?)
         ''', (data['urun_kodu'], data['metre'], data['metre_maliyet'], 
-              data.get('fiyat', 0), data.get('son_islem_tarihi'), data.get('son_30_gun_islem', 0)))
+              data.get('fiyat', 0), data.get('son_islem_tarihi')))
         
         item_id = cursor.lastrowid
+        # A re-added product code picks up the activity it already has
+        refresh_activity_windows(cursor, [data['urun_kodu']])
         conn.commit()
         conn.close()
         
@@ -1291,11 +1436,12 @@ def update_envanter_item(item_id):
     cursor.execute('''
         UPDATE envanter 
         SET urun_kodu = ?, metre = ?, metre_maliyet = ?, fiyat = ?, 
-            son_islem_tarihi = ?, son_30_gun_islem = ?, updated_at = CURRENT_TIMESTAMP
+            son_islem_tarihi = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
     ''', (data['urun_kodu'], data['metre'], data['metre_maliyet'], 
-          data.get('fiyat', 0), data.get('son_islem_tarihi'), 
-          data.get('son_30_gun_islem', 0), item_id))
+          data.get('fiyat', 0), data.get('son_islem_tarihi'), item_id))
+    # The activity windows follow the (possibly renamed) product code
+    refresh_activity_windows(cursor, [data['urun_kodu']])
     
     conn.commit()
     conn.close()
@@ -1316,6 +1462,7 @@ def delete_envanter_item(item_id):
     return jsonify({'message': 'Envanter ürünü silindi'})
 
 @app.route('/api/envanter/by-code/<string:urun_kodu>', methods=['GET'])
+@current_windows
 def get_envanter_by_code(urun_kodu):
     """Get envanter item by product code"""
     conn = get_db_connection()
@@ -1329,7 +1476,19 @@ def get_envanter_by_code(urun_kodu):
     else:
         return jsonify({'error': 'Ürün bulunamadı'}), 404
 
+@app.route('/api/envanter/aktivite/rebuild', methods=['POST'])
+def rebuild_product_activity():
+    """Recompute the product activity buckets and windows from islemler"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = rebuild_activity_buckets(cursor)
+    conn.commit()
+    conn.close()
+
+    return jsonify({'message': 'Ürün hareketleri yeniden hesaplandı', 'updated_products': updated})
+
 @app.route('/api/calisanlar/validate/<string:calisan_adi>', methods=['GET'])
+@current_windows
 def validate_calisan(calisan_adi):
     """Validate if employee name exists (case-insensitive)"""
     conn = get_db_connection()
@@ -1343,6 +1502,122 @@ def validate_calisan(calisan_adi):
     else:
         return jsonify({'valid': False, 'error': 'Çalışan bulunamadı'}), 404
 
+ISLEM_KODU_PATTERN = re.compile(r'(?:Satış|Alış) ID:\s*([^,\s]+)')
+ISLEM_KODU_SEARCH_LIMIT = 20
+
+
+def islem_kodu_from_aciklama(aciklama):
+    match = ISLEM_KODU_PATTERN.search(aciklama or '')
+    return match.group(1).upper() if match else None
+
+
+def allocate_islem_kodu(cursor, prefix, requested=None):
+    """A free islem_kodu: the requested code if unused, else PREFIX-YYMMDD-HHMMSS.
+
+    Codes have one-second resolution, so a taken code gets a -2, -3, ... suffix.
+    """
+    code = (requested or '').strip().upper() or f"{prefix}-{datetime.now().strftime('%y%m%d-%H%M%S')}"
+    candidate, suffix = code, 2
+    while cursor.execute('SELECT 1 FROM islemler WHERE islem_kodu = ?', (candidate,)).fetchone():
+        candidate = f'{code}-{suffix}'
+        suffix += 1
+    return candidate
+
+
+def allocate_islem_kodlari(cursor, prefix, count, requested=None):
+    """count free codes sharing one base: CODE, CODE-2, CODE-3, ... skipping taken ones"""
+    code = (requested or '').strip().upper() or f"{prefix}-{datetime.now().strftime('%y%m%d-%H%M%S')}"
+    cursor.execute('SELECT islem_kodu FROM islemler WHERE islem_kodu >= ? AND islem_kodu < ?',
+                   (code, prefix_upper_bound(code)))
+    taken = {row['islem_kodu'] for row in cursor.fetchall()}
+    codes, suffix = [], 1
+    while len(codes) < count:
+        candidate = code if suffix == 1 else f'{code}-{suffix}'
+        if candidate not in taken:
+            codes.append(candidate)
+        suffix += 1
+    return codes
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def add_months(month, year, count):
+    """(month, year) count months after the given one"""
+    index = year * 12 + month - 1 + count
+    return index % 12 + 1, index // 12
+
+
+def sale_odeme_tipi(odeme_tipi, pesin_miktar, taksit_miktar):
+    """The payment type stored on a sale, from the amounts actually paid each way"""
+    if pesin_miktar > 0 and taksit_miktar > 0:
+        return 'pesin+taksit'
+    if taksit_miktar > 0:
+        return 'taksit'
+    return odeme_tipi  # Use the original payment type (nakit, kart, etc.)
+
+
+def sale_aciklama(aciklama, pesin_miktar, taksit_miktar, pesin_odeme_tipi, taksit_odeme_tipi,
+                  satici_ismi, is_mail_order):
+    """Sale description with the payment details the frontend views display"""
+    # Payment types, seller and mail order flag are stored in their own columns;
+    # they are also kept in the description for the frontend views that display it
+    if taksit_miktar > 0:
+        # Use the specific taksit payment type from frontend instead of inferring from overall payment type
+        aciklama = f"{aciklama}, Taksit_Odeme_Tipi: {taksit_odeme_tipi}"
+    
+    if pesin_miktar > 0:
+        # Store the peşin payment type for geniş ciro calculations
+        aciklama = f"{aciklama}, Pesin_Odeme_Tipi: {pesin_odeme_tipi}"
+    
+    # Add employee name to description for undo functionality
+    aciklama = f"{aciklama}, Satıcı: {satici_ismi}"
+    
+    # Add mail order flag to description for tracking
+    if is_mail_order:
+        aciklama = f"{aciklama}, Mail_Order: true"
+    return aciklama
+
+
+def profit_margin(birim_fiyat, metre_maliyet):
+    """Profit over cost, in percent"""
+    return ((birim_fiyat - metre_maliyet) / metre_maliyet) * 100 if metre_maliyet > 0 else 0
+
+
+def create_payment_plan(cursor, musteri, toplam_tutar, pesin_miktar, taksit_miktar, taksit_sayisi, month, year):
+    """Insert an odeme_plani row and its installments, the first due this month; returns the plan id"""
+    cursor.execute('''
+        INSERT INTO odeme_plani (islem_id, musteri, toplam_tutar, pesin_miktar, 
+                               taksit_miktar, taksit_sayisi, ay, yil)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (0, musteri, toplam_tutar, pesin_miktar, taksit_miktar, taksit_sayisi, month, year))
+    odeme_plani_id = cursor.lastrowid
+    
+    taksit_miktari = taksit_miktar / taksit_sayisi
+    cursor.executemany('''
+        INSERT INTO taksit_detaylari (odeme_plani_id, taksit_no, miktar, vade_ay, vade_yil)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(odeme_plani_id, i + 1, taksit_miktari, *add_months(month, year, i)) for i in range(taksit_sayisi)])
+    return odeme_plani_id
+
+
+def sale_cash_movements(islem_id, musteri, pesin_miktar, taksit_miktar, taksit_sayisi, month, year,
+                        source_type='islem'):
+    """Cash flow of a sale: peşin this month, installments from next month on"""
+    movements = []
+    if pesin_miktar > 0:
+        movements.append(movement(month, year, 'giris', pesin_miktar, f"Peşin satış - {musteri}", source_type, islem_id))
+    if taksit_miktar > 0 and taksit_sayisi > 0:
+        monthly_installment = taksit_miktar / taksit_sayisi
+        for i in range(taksit_sayisi):
+            installment_month, installment_year = add_months(month, year, i + 1)
+            movements.append(movement(installment_month, installment_year, 'giris', monthly_installment,
+                                      f"Taksit {i+1}/{taksit_sayisi} - {musteri}", source_type, islem_id))
+    return movements
+
+
 @app.route('/api/urun-satis', methods=['POST'])
 def urun_satis():
     """Process product sale - updates inventory and records transaction with payment plan"""
@@ -1418,13 +1693,13 @@ def urun_satis():
         # Update inventory
         new_metre = current_metre - miktar
         new_date = datetime.now().strftime('%Y-%m-%d %H:%M')
-        new_transaction_count = item['son_30_gun_islem'] + 1
         
         cursor.execute('''
             UPDATE envanter 
-            SET metre = ?, son_islem_tarihi = ?, son_30_gun_islem = ?, updated_at = CURRENT_TIMESTAMP
+            SET metre = ?, son_islem_tarihi = ?, updated_at = CURRENT_TIMESTAMP
             WHERE urun_kodu = ? COLLATE NOCASE
-        ''', (new_metre, new_date, new_transaction_count, urun_kodu))
+        ''', (new_metre, new_date, urun_kodu))
+        record_activity(cursor, [(urun_kodu, utc_today(), 1)])
         
         # Get current month and year
         current_date = datetime.now()
@@ -1434,70 +1709,37 @@ def urun_satis():
         # Create payment plan if needed
         odeme_plani_id = None
         if taksit_miktar > 0 and taksit_sayisi > 0:
-            cursor.execute('''
-                INSERT INTO odeme_plani (islem_id, musteri, toplam_tutar, pesin_miktar, 
-                                       taksit_miktar, taksit_sayisi, ay, yil)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (0, musteri, toplam_tutar, pesin_miktar, taksit_miktar, taksit_sayisi, current_month, current_year))
-            
-            odeme_plani_id = cursor.lastrowid
-            
-            # Create installment details
-            taksit_miktari = taksit_miktar / taksit_sayisi
-            installment_month = current_month
-            installment_year = current_year
-            
-            for i in range(taksit_sayisi):
-                cursor.execute('''
-                    INSERT INTO taksit_detaylari (odeme_plani_id, taksit_no, miktar, vade_ay, vade_yil)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (odeme_plani_id, i + 1, taksit_miktari, installment_month, installment_year))
-                
-                # Move to next month
-                installment_month += 1
-                if installment_month > 12:
-                    installment_month = 1
-                    installment_year += 1
+            odeme_plani_id = create_payment_plan(cursor, musteri, toplam_tutar, pesin_miktar, taksit_miktar,
+                                                 taksit_sayisi, current_month, current_year)
         
         # Determine the correct payment type based on actual payment amounts
-        if pesin_miktar > 0 and taksit_miktar > 0:
-            final_odeme_tipi = 'pesin+taksit'
-        elif taksit_miktar > 0:
-            final_odeme_tipi = 'taksit'
-        else:
-            final_odeme_tipi = odeme_tipi  # Use the original payment type (nakit, kart, etc.)
-        
-        # Store the payment type information separately in the description for filtering
-        # This is a workaround to track payment types for geniş ciro and beklenen ödemeler
-        if taksit_miktar > 0:
-            # Use the specific taksit payment type from frontend instead of inferring from overall payment type
-            aciklama = f"{aciklama}, Taksit_Odeme_Tipi: {taksit_odeme_tipi}"
-        
-        if pesin_miktar > 0:
-            # Store the peşin payment type for geniş ciro calculations
-            aciklama = f"{aciklama}, Pesin_Odeme_Tipi: {pesin_odeme_tipi}"
-        
-        # Add employee name to description for undo functionality
-        aciklama = f"{aciklama}, Satıcı: {satici_ismi}"
-        
-        # Add mail order flag to description for tracking
-        if is_mail_order:
-            aciklama = f"{aciklama}, Mail_Order: true"
-        
-        # Calculate profit margin
-        cost_per_unit = item['metre_maliyet']
-        profit_per_unit = birim_fiyat - cost_per_unit
-        profit_margin = (profit_per_unit / cost_per_unit) * 100 if cost_per_unit > 0 else 0
+        final_odeme_tipi = sale_odeme_tipi(odeme_tipi, pesin_miktar, taksit_miktar)
+        aciklama = sale_aciklama(aciklama, pesin_miktar, taksit_miktar, pesin_odeme_tipi, taksit_odeme_tipi,
+                                 satici_ismi, is_mail_order)
+        
+        # The frontend embeds its own SAT- code in the description; keep the
+        # description in sync when that code is missing or already taken
+        requested_kodu = data.get('islem_kodu') or islem_kodu_from_aciklama(aciklama)
+        islem_kodu = allocate_islem_kodu(cursor, 'SAT', requested_kodu)
+        if not requested_kodu:
+            aciklama = f"Satış ID: {islem_kodu}, {aciklama.lstrip(', ')}"
+        elif islem_kodu != requested_kodu.upper():
+            aciklama = aciklama.replace(f"Satış ID: {requested_kodu}", f"Satış ID: {islem_kodu}", 1)
         
         # Record transaction in işlemler
         cursor.execute('''
             INSERT INTO islemler (islem_tipi, urun_kodu, miktar, birim_fiyat, toplam_tutar, musteri, 
-                                odeme_tipi, aciklama, pesin_miktar, taksit_miktar, taksit_sayisi, kar, odeme_plani_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                odeme_tipi, aciklama, pesin_miktar, taksit_miktar, taksit_sayisi, kar, odeme_plani_id,
+                                taksit_odeme_tipi, pesin_odeme_tipi, satici, is_mail_order, islem_kodu)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', ('satis', urun_kodu, miktar, birim_fiyat, toplam_tutar, musteri, final_odeme_tipi, aciklama,
-              pesin_miktar, taksit_miktar, taksit_sayisi, profit_margin, odeme_plani_id))
+              pesin_miktar, taksit_miktar, taksit_sayisi, profit_margin(birim_fiyat, item['metre_maliyet']),
+              odeme_plani_id, taksit_odeme_tipi if taksit_miktar > 0 else None,
+              pesin_odeme_tipi if pesin_miktar > 0 else None,
+              satici_ismi, 1 if is_mail_order else 0, islem_kodu))
         
         transaction_id = cursor.lastrowid
+        apply_islem(cursor, transaction_id)
         
         # Update payment plan with transaction ID
         if odeme_plani_id:
@@ -1505,57 +1747,21 @@ def urun_satis():
                 UPDATE odeme_plani SET islem_id = ? WHERE id = ?
             ''', (transaction_id, odeme_plani_id))
         
-        # Add peşin amount to current month's cash flow (exclude mail orders)
-        if pesin_miktar > 0 and not is_mail_order:
-            cursor.execute('''
-                INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-                VALUES (?, ?, 
-                        COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
-                        COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                        ?, CURRENT_TIMESTAMP)
-            ''', (current_month, current_year, current_month, current_year, pesin_miktar, 
-                  current_month, current_year, f"Peşin satış - {musteri}"))
-        
-        # Distribute installment amounts across future months (exclude mail orders)
-        if taksit_miktar > 0 and taksit_sayisi > 0 and not is_mail_order:
-            monthly_installment = taksit_miktar / taksit_sayisi
-            
-            for i in range(taksit_sayisi):
-                # Calculate the month and year for this installment
-                installment_month = current_month + i + 1  # Start from next month
-                installment_year = current_year
-                
-                # Handle year rollover
-                while installment_month > 12:
-                    installment_month -= 12
-                    installment_year += 1
-                
-                # Add installment to the respective month's cash flow
-                cursor.execute('''
-                    INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-                    VALUES (?, ?, 
-                            COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
-                            COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                            ?, CURRENT_TIMESTAMP)
-                ''', (installment_month, installment_year, installment_month, installment_year, monthly_installment, 
-                      installment_month, installment_year, f"Taksit {i+1}/{taksit_sayisi} - {musteri}"))
-        
-        # Update employee performance (add to son_ay, son_3_ay, son_6_ay, son_12_ay)
-        cursor.execute('''
-            UPDATE calisanlar 
-            SET son_ay = son_ay + ?, 
-                son_3_ay = son_3_ay + ?, 
-                son_6_ay = son_6_ay + ?, 
-                son_12_ay = son_12_ay + ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (toplam_tutar, toplam_tutar, toplam_tutar, toplam_tutar, calisan_id))
+        # Peşin amount in this month's cash flow, installments across the following months
+        # (mail orders are not cash flow)
+        if not is_mail_order:
+            record_cash_movements(cursor, sale_cash_movements(transaction_id, musteri, pesin_miktar, taksit_miktar,
+                                                              taksit_sayisi, current_month, current_year))
+        
+        # Update employee performance (today's sales bucket and the son_ay ... son_12_ay windows)
+        record_sales(cursor, [(calisan_id, utc_today(), toplam_tutar, 1)])
         
         conn.commit()
         
         return jsonify({
             'message': 'Satış başarıyla kaydedildi',
             'transaction_id': transaction_id,
+            'islem_kodu': islem_kodu,
             'odeme_plani_id': odeme_plani_id,
             'urun_kodu': urun_kodu,
             'eski_stok': current_metre,
@@ -1574,6 +1780,215 @@ def urun_satis():
     finally:
         conn.close()
 
+SEPET_MAX_KALEM = 100
+
+
+def split_amount(amount, weights):
+    """Split amount in proportion to weights, rounded to kuruş; the last share takes the remainder"""
+    total = sum(weights)
+    shares = [round(amount * weight / total, 2) if total > 0 else 0.0 for weight in weights[:-1]]
+    return shares + [round(amount - sum(shares), 2)]
+
+
+@app.route('/api/urun-satis/batch', methods=['POST'])
+def urun_satis_batch():
+    """Sell several products in one checkout.
+
+    Each line becomes its own işlem (so it can be deleted on its own), with a
+    share of peşin and taksit in proportion to its total. The lines share one
+    payment plan and installment schedule, and the whole cart is committed at once.
+    """
+    data = request.get_json(silent=True) or {}
+    
+    kalemler = data.get('kalemler')
+    if not isinstance(kalemler, list) or not kalemler:
+        return jsonify({'error': 'kalemler alanı gerekli'}), 400
+    if len(kalemler) > SEPET_MAX_KALEM:
+        return jsonify({'error': f'Bir satışta en fazla {SEPET_MAX_KALEM} kalem olabilir'}), 400
+    if 'satici_ismi' not in data:
+        return jsonify({'error': 'satici_ismi alanı gerekli'}), 400
+    
+    lines = []
+    try:
+        for kalem in kalemler:
+            for field in ('urun_kodu', 'miktar', 'birim_fiyat'):
+                if field not in kalem:
+                    return jsonify({'error': f'{field} alanı gerekli'}), 400
+            line = {
+                'urun_kodu': str(kalem['urun_kodu']).upper(),
+                'miktar': float(kalem['miktar']),
+                'birim_fiyat': float(kalem['birim_fiyat']),
+            }
+            if line['miktar'] <= 0:
+                return jsonify({'error': 'Miktar 0\'dan büyük olmalı'}), 400
+            line['toplam_tutar'] = line['miktar'] * line['birim_fiyat']
+            lines.append(line)
+        pesin_miktar = float(data.get('pesin_miktar', 0))
+        taksit_miktar = float(data.get('taksit_miktar', 0))
+        taksit_sayisi = int(data.get('taksit_sayisi', 0))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Geçersiz kalem bilgisi'}), 400
+    
+    musteri = data.get('musteri', '')
+    odeme_tipi = data.get('odeme_tipi', 'nakit')
+    aciklama = data.get('aciklama', '')
+    satici_ismi = data['satici_ismi'].strip()
+    taksit_odeme_tipi = data.get('taksit_odeme_tipi', 'nakit')
+    pesin_odeme_tipi = data.get('pesin_odeme_tipi', 'nakit')
+    is_mail_order = data.get('is_mail_order', False)
+    toplam_tutar = sum(line['toplam_tutar'] for line in lines)
+    
+    if not satici_ismi:
+        return jsonify({'error': 'Satıcı ismi gerekli'}), 400
+    
+    # Validate payment plan
+    if pesin_miktar + taksit_miktar > 0:
+        if abs((pesin_miktar + taksit_miktar) - toplam_tutar) > 0.01:
+            return jsonify({'error': 'Peşin + Taksit toplamı, genel toplam ile eşleşmiyor'}), 400
+    else:
+        # Default: all amount is peşin
+        pesin_miktar = toplam_tutar
+        taksit_miktar = 0
+        taksit_sayisi = 0
+    
+    weights = [line['toplam_tutar'] for line in lines]
+    for line, line_pesin, line_taksit in zip(lines, split_amount(pesin_miktar, weights),
+                                             split_amount(taksit_miktar, weights)):
+        line['pesin_miktar'], line['taksit_miktar'] = line_pesin, line_taksit
+    
+    # The same product may appear on several lines; stock is checked against their sum
+    requested = {}
+    for line in lines:
+        requested[line['urun_kodu']] = requested.get(line['urun_kodu'], 0) + line['miktar']
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('SELECT id FROM calisanlar WHERE LOWER(ad) = LOWER(?)', (satici_ismi,))
+        calisan = cursor.fetchone()
+        if not calisan:
+            return jsonify({'error': f'Çalışan bulunamadı: {satici_ismi}. Lütfen önce Yönetici → Çalışanlar sekmesinden çalışanları ekleyin.'}), 400
+        
+        # Every product of the cart in one query
+        cursor.execute(f'''
+            SELECT * FROM envanter WHERE urun_kodu COLLATE NOCASE IN ({', '.join('?' * len(requested))})
+        ''', list(requested))
+        items = {row['urun_kodu'].upper(): row for row in cursor.fetchall()}
+        
+        missing = [urun_kodu for urun_kodu in requested if urun_kodu not in items]
+        if missing:
+            return jsonify({'error': f"Ürün bulunamadı: {', '.join(missing)}"}), 404
+        short = [f"{urun_kodu} (Mevcut: {items[urun_kodu]['metre']} m, İstenen: {miktar} m)"
+                 for urun_kodu, miktar in requested.items() if items[urun_kodu]['metre'] < miktar]
+        if short:
+            return jsonify({'error': f"Yetersiz stok: {'; '.join(short)}"}), 400
+        
+        # The metre guard makes a concurrent sale that took the stock first fail the whole cart
+        line_counts = {urun_kodu: sum(1 for line in lines if line['urun_kodu'] == urun_kodu) for urun_kodu in requested}
+        new_date = datetime.now().strftime('%Y-%m-%d %H:%M')
+        cursor.executemany('''
+            UPDATE envanter 
+            SET metre = metre - ?, son_islem_tarihi = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND metre >= ?
+        ''', [(miktar, new_date, items[urun_kodu]['id'], miktar) for urun_kodu, miktar in requested.items()])
+        if cursor.rowcount != len(requested):
+            conn.rollback()
+            return jsonify({'error': 'Yetersiz stok: stok satış sırasında değişti'}), 409
+        record_activity(cursor, [(urun_kodu, utc_today(), count) for urun_kodu, count in line_counts.items()])
+        
+        current_date = datetime.now()
+        current_month = current_date.month
+        current_year = current_date.year
+        
+        odeme_plani_id = None
+        if taksit_miktar > 0 and taksit_sayisi > 0:
+            odeme_plani_id = create_payment_plan(cursor, musteri, toplam_tutar, pesin_miktar, taksit_miktar,
+                                                 taksit_sayisi, current_month, current_year)
+        
+        # One code per line: the cart code, then -2, -3, ...
+        requested_kodu = data.get('islem_kodu') or islem_kodu_from_aciklama(aciklama)
+        islem_kodlari = allocate_islem_kodlari(cursor, 'SAT', len(lines), requested_kodu)
+        if requested_kodu:
+            aciklama = re.sub(r'Satış ID:\s*[A-Za-z0-9-]+,?\s*', '', aciklama).strip(', ')
+        
+        stock_left = {urun_kodu: items[urun_kodu]['metre'] for urun_kodu in requested}
+        rows = []
+        for line, islem_kodu in zip(lines, islem_kodlari):
+            line['islem_kodu'] = islem_kodu
+            line['eski_stok'] = stock_left[line['urun_kodu']]
+            line['yeni_stok'] = stock_left[line['urun_kodu']] = line['eski_stok'] - line['miktar']
+            line_aciklama = sale_aciklama(aciklama, line['pesin_miktar'], line['taksit_miktar'], pesin_odeme_tipi,
+                                          taksit_odeme_tipi, satici_ismi, is_mail_order)
+            rows.append((
+                'satis', line['urun_kodu'], line['miktar'], line['birim_fiyat'], line['toplam_tutar'], musteri,
+                sale_odeme_tipi(odeme_tipi, line['pesin_miktar'], line['taksit_miktar']),
+                f"Satış ID: {islem_kodu}, {line_aciklama.lstrip(', ')}",
+                line['pesin_miktar'], line['taksit_miktar'], taksit_sayisi if line['taksit_miktar'] > 0 else 0,
+                profit_margin(line['birim_fiyat'], items[line['urun_kodu']]['metre_maliyet']), odeme_plani_id,
+                taksit_odeme_tipi if line['taksit_miktar'] > 0 else None,
+                pesin_odeme_tipi if line['pesin_miktar'] > 0 else None,
+                satici_ismi, 1 if is_mail_order else 0, islem_kodu,
+            ))
+        cursor.executemany('''
+            INSERT INTO islemler (islem_tipi, urun_kodu, miktar, birim_fiyat, toplam_tutar, musteri, 
+                                odeme_tipi, aciklama, pesin_miktar, taksit_miktar, taksit_sayisi, kar, odeme_plani_id,
+                                taksit_odeme_tipi, pesin_odeme_tipi, satici, is_mail_order, islem_kodu)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.execute(f'''
+            SELECT id, islem_kodu FROM islemler WHERE islem_kodu IN ({', '.join('?' * len(islem_kodlari))})
+        ''', islem_kodlari)
+        ids = {row['islem_kodu']: row['id'] for row in cursor.fetchall()}
+        for line in lines:
+            line['transaction_id'] = ids[line['islem_kodu']]
+        apply_islemler(cursor, ids.values())
+        
+        # The plan belongs to the first line; the others point at it through odeme_plani_id
+        if odeme_plani_id:
+            cursor.execute('UPDATE odeme_plani SET islem_id = ? WHERE id = ?',
+                           (lines[0]['transaction_id'], odeme_plani_id))
+        
+        # Cash flow is recorded once for the cart, under the first line; deleting a
+        # single line reverses its own share (see delete_transaction)
+        if not is_mail_order:
+            record_cash_movements(cursor, sale_cash_movements(
+                lines[0]['transaction_id'], musteri, pesin_miktar, taksit_miktar, taksit_sayisi,
+                current_month, current_year, source_type='sepet'))
+        
+        record_sales(cursor, [(calisan['id'], utc_today(), toplam_tutar, len(lines))])
+        
+        conn.commit()
+        
+        return jsonify({
+            'message': 'Satış başarıyla kaydedildi',
+            'sepet_kodu': islem_kodlari[0],
+            'odeme_plani_id': odeme_plani_id,
+            'toplam_tutar': toplam_tutar,
+            'pesin_miktar': pesin_miktar,
+            'taksit_miktar': taksit_miktar,
+            'taksit_sayisi': taksit_sayisi,
+            'satici_ismi': satici_ismi,
+            'kalemler': [{
+                'transaction_id': line['transaction_id'],
+                'islem_kodu': line['islem_kodu'],
+                'urun_kodu': line['urun_kodu'],
+                'eski_stok': line['eski_stok'],
+                'yeni_stok': line['yeni_stok'],
+                'satis_miktari': line['miktar'],
+                'birim_fiyat': line['birim_fiyat'],
+                'toplam_tutar': line['toplam_tutar'],
+                'pesin_miktar': line['pesin_miktar'],
+                'taksit_miktar': line['taksit_miktar'],
+            } for line in lines],
+        }), 201
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': f'Satış kaydedilemedi: {str(e)}'}), 500
+    finally:
+        conn.close()
+
 @app.route('/api/urun-alis', methods=['POST'])
 def urun_alis():
     """Process product purchase - updates inventory and records transaction with debt tracking"""
@@ -1623,37 +2038,29 @@ def urun_alis():
             current_metre = item['metre']
             new_metre = current_metre + miktar
             new_date = datetime.now().strftime('%Y-%m-%d %H:%M')
-            new_transaction_count = item['son_30_gun_islem'] + 1
             
             # Update cost basis to use last purchase price (instead of weighted average)
             new_cost_per_meter = birim_fiyat
             
             cursor.execute('''
                 UPDATE envanter 
-                SET metre = ?, metre_maliyet = ?, son_islem_tarihi = ?, son_30_gun_islem = ?, updated_at = CURRENT_TIMESTAMP
+                SET metre = ?, metre_maliyet = ?, son_islem_tarihi = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE urun_kodu = ? COLLATE NOCASE
-            ''', (new_metre, new_cost_per_meter, new_date, new_transaction_count, urun_kodu))
+            ''', (new_metre, new_cost_per_meter, new_date, urun_kodu))
         else:
             # Create new inventory item
             new_date = datetime.now().strftime('%Y-%m-%d %H:%M')
             cursor.execute('''
-                INSERT INTO envanter (urun_kodu, metre, metre_maliyet, fiyat, son_islem_tarihi, son_30_gun_islem)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (urun_kodu, miktar, birim_fiyat, 0, new_date, 1))
+                INSERT INTO envanter (urun_kodu, metre, metre_maliyet, fiyat, son_islem_tarihi)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (urun_kodu, miktar, birim_fiyat, 0, new_date))
+        record_activity(cursor, [(urun_kodu, utc_today(), 1)])
         
         # Get current date for transaction and cash flow
         current_date = datetime.now()
         
         # Use provided transaction ID or generate one
-        transaction_id = data.get('transaction_id')
-        if not transaction_id:
-            year = current_date.year % 100  # Last 2 digits
-            month = current_date.month
-            day = current_date.day
-            hour = current_date.hour
-            minute = current_date.minute
-            second = current_date.second
-            transaction_id = f"ALIS-{year:02d}{month:02d}{day:02d}-{hour:02d}{minute:02d}{second:02d}"
+        transaction_id = allocate_islem_kodu(cursor, 'ALIS', data.get('transaction_id'))
         
         # Create description with transaction ID and notes
         aciklama = f"Alış ID: {transaction_id}, Alıcı: {alici_ismi}"
@@ -1663,10 +2070,12 @@ def urun_alis():
         # Record transaction in işlemler
         cursor.execute('''
             INSERT INTO islemler (islem_tipi, urun_kodu, miktar, birim_fiyat, toplam_tutar, musteri, 
-                                odeme_tipi, aciklama, pesin_miktar, taksit_miktar, taksit_sayisi, kar)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                odeme_tipi, aciklama, pesin_miktar, taksit_miktar, taksit_sayisi, kar, islem_kodu)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', ('alis', urun_kodu, miktar, birim_fiyat, toplam_tutar, tedarikci_bilgileri, 'nakit', aciklama,
-              pesin_miktar, borc_miktar, 0, 0))
+              pesin_miktar, borc_miktar, 0, 0, transaction_id))
+        islem_id = cursor.lastrowid
+        apply_islem(cursor, islem_id)
         
         # Get current month and year
         current_month = current_date.month
@@ -1674,14 +2083,8 @@ def urun_alis():
         
         # Add peşin amount to current month's cash flow as expense (giderler)
         if pesin_miktar > 0:
-            cursor.execute('''
-                INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-                VALUES (?, ?, 
-                        COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                        COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
-                        ?, CURRENT_TIMESTAMP)
-            ''', (current_month, current_year, current_month, current_year, 
-                  current_month, current_year, pesin_miktar, f"Alış ödemesi - {tedarikci_bilgileri}"))
+            add_cash_movement(cursor, current_month, current_year, 'cikis', pesin_miktar,
+                              f"Alış ödemesi - {tedarikci_bilgileri}", 'islem', islem_id)
         
         # Add debt to açık borçlar if there's a debt amount
         if borc_miktar > 0:
@@ -1712,15 +2115,136 @@ def urun_alis():
     finally:
         conn.close()
 
+ISLEM_FIELDS = (
+    'id', 'islem_tipi', 'urun_kodu', 'miktar', 'birim_fiyat', 'toplam_tutar', 'musteri',
+    'odeme_tipi', 'aciklama', 'pesin_miktar', 'taksit_miktar', 'taksit_sayisi', 'kar',
+    'odeme_plani_id', 'created_at', 'taksit_odeme_tipi', 'pesin_odeme_tipi', 'satici', 'is_mail_order',
+    'islem_kodu'
+)
+ISLEMLER_DEFAULT_LIMIT = 50
+ISLEMLER_MAX_LIMIT = 500
+
+def encode_islem_cursor(created_at, islem_id):
+    """Opaque keyset cursor for the (created_at, id) position of a row"""
+    raw = json.dumps([created_at, islem_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_islem_cursor(cursor_value):
+    created_at, islem_id = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+    return str(created_at), int(islem_id)
+
+def end_of_day(value):
+    """Turn an inclusive YYYY-MM-DD upper bound into an exclusive timestamp bound"""
+    if len(value) == 10:
+        return (datetime.strptime(value, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return value
+
 @app.route('/api/islemler', methods=['GET'])
+@track_changes('islemler', delta_table='islemler')
 def get_islemler():
-    """Get all transactions"""
+    """Get transactions, newest first.
+
+    Without limit/cursor the full list is returned as before. With them the
+    response is a keyset-paginated page: {'items': [...], 'next_cursor': ...}.
+    Optional filters: islem_tipi, date_from, date_to (YYYY-MM-DD, inclusive),
+    urun_kodu, musteri (substring, case-insensitive), teslim=1 (only sales with a
+    'Teslim: <date>' delivery date in aciklama); fields=a,b,c projects columns.
+    """
+    args = request.args
+    paginate = 'limit' in args or 'cursor' in args
+
+    fields = ISLEM_FIELDS
+    if args.get('fields'):
+        requested = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in requested if f not in ISLEM_FIELDS]
+        if unknown:
+            return jsonify({'error': f'Bilinmeyen alan: {", ".join(unknown)}'}), 400
+        # id and created_at are always needed to build the next cursor
+        fields = tuple(f for f in ISLEM_FIELDS if f in requested or f in ('id', 'created_at'))
+
+    where = []
+    params = []
+    if args.get('islem_tipi'):
+        where.append('islem_tipi = ?')
+        params.append(args['islem_tipi'])
+    if args.get('date_from'):
+        where.append('created_at >= ?')
+        params.append(args['date_from'])
+    if args.get('date_to'):
+        where.append('created_at < ?')
+        params.append(end_of_day(args['date_to']))
+    if args.get('urun_kodu'):
+        where.append('urun_kodu = ?')
+        params.append(args['urun_kodu'].upper())
+    if args.get('musteri'):
+        where.append("INSTR(LOWER(COALESCE(musteri, '')), LOWER(?)) > 0")
+        params.append(args['musteri'])
+    if args.get('teslim') == '1':
+        where.append("INSTR(COALESCE(aciklama, ''), 'Teslim: ') > 0")
+
+    limit = None
+    if paginate:
+        try:
+            limit = int(args.get('limit', ISLEMLER_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({'error': 'Geçersiz limit'}), 400
+        limit = max(1, min(limit, ISLEMLER_MAX_LIMIT))
+        if args.get('cursor'):
+            try:
+                cursor_created_at, cursor_id = decode_islem_cursor(args['cursor'])
+            except Exception:
+                return jsonify({'error': 'Geçersiz cursor'}), 400
+            where.append('(created_at, id) < (?, ?)')
+            params.extend([cursor_created_at, cursor_id])
+
+    query = f'SELECT {", ".join(fields)} FROM islemler'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += ' ORDER BY created_at DESC, id DESC'
+    if not paginate:
+        # The full list can be the whole table: stream it instead of building it in memory
+        return stream_query(query, params)
+    # Fetch one extra row to know whether another page exists
+    query += ' LIMIT ?'
+    params.append(limit + 1)
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM islemler ORDER BY created_at DESC')
+    cursor.execute(query, params)
     islemler = [dict(row) for row in cursor.fetchall()]
     conn.close()
-    return jsonify(islemler)
+
+    next_cursor = None
+    if len(islemler) > limit:
+        islemler = islemler[:limit]
+        last = islemler[-1]
+        next_cursor = encode_islem_cursor(last['created_at'], last['id'])
+    return jsonify({'items': islemler, 'next_cursor': next_cursor, 'limit': limit})
+
+@app.route('/api/islemler/kod-ara', methods=['GET'])
+def search_islem_kodu():
+    """Autocomplete transaction codes: ?q=SAT-2508 returns codes starting with q"""
+    prefix = request.args.get('q', '').strip().upper()
+    if not prefix:
+        return jsonify([])
+    try:
+        limit = max(1, min(int(request.args.get('limit', ISLEM_KODU_SEARCH_LIMIT)), ISLEMLER_MAX_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Geçersiz limit'}), 400
+
+    # A range over the unique index instead of LIKE, so this stays a seek
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, islem_kodu, islem_tipi, urun_kodu, musteri, toplam_tutar, created_at
+        FROM islemler
+        WHERE islem_kodu >= ? AND islem_kodu < ?
+        ORDER BY islem_kodu
+        LIMIT ?
+    ''', (prefix, prefix_upper_bound(prefix), limit))
+    matches = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return jsonify(matches)
 
 @app.route('/api/islemler/<int:transaction_id>', methods=['DELETE'])
 def delete_transaction(transaction_id):
@@ -1743,37 +2267,34 @@ def delete_transaction(transaction_id):
         transaction_month = transaction_date.month
         transaction_year = transaction_date.year
         
-        # Reverse cash flow effects (exclude mail orders)
-        if transaction_dict['islem_tipi'] == 'satis':
-            # Check if this is a mail order transaction
-            is_mail_order = transaction_dict.get('aciklama', '').find('Mail_Order: true') != -1
+        # Reverse cash flow effects with compensating ledger entries. This covers every
+        # movement recorded for the transaction, so deleting a purchase now also takes
+        # its outflow (cikis) back out of the month; only sales were reversed before.
+        reversed_count = reverse_cash_movements(cursor, 'islem', transaction_id,
+                                                f"İşlem silindi - {transaction_dict['musteri'] or ''}".strip(' -'))
+        
+        # Sales recorded before the ledger existed, and lines of a cart sale (whose cash
+        # flow is recorded once for the whole cart), have no movements of their own;
+        # their share is reversed as computed from the line
+        if not reversed_count and transaction_dict['islem_tipi'] == 'satis':
+            is_mail_order = bool(transaction_dict['is_mail_order'])
+            cash_movements = []
             
             # Reverse peşin amount from cash flow (exclude mail orders)
             if transaction_dict['pesin_miktar'] > 0 and not is_mail_order:
-                cursor.execute('''
-                    UPDATE nakit_akisi 
-                    SET giris = MAX(0, giris - ?), updated_at = CURRENT_TIMESTAMP
-                    WHERE ay = ? AND yil = ?
-                ''', (transaction_dict['pesin_miktar'], transaction_month, transaction_year))
+                cash_movements.append(movement(transaction_month, transaction_year, 'giris',
+                                               -transaction_dict['pesin_miktar'], 'İşlem silindi', 'islem', transaction_id))
             
             # Reverse installment amounts from future months (exclude mail orders)
             if transaction_dict['taksit_miktar'] > 0 and transaction_dict['taksit_sayisi'] > 0 and not is_mail_order:
                 monthly_installment = transaction_dict['taksit_miktar'] / transaction_dict['taksit_sayisi']
                 
                 for i in range(transaction_dict['taksit_sayisi']):
-                    installment_month = transaction_month + i + 1
-                    installment_year = transaction_year
-                    
-                    # Handle year rollover
-                    while installment_month > 12:
-                        installment_month -= 12
-                        installment_year += 1
-                    
-                    cursor.execute('''
-                        UPDATE nakit_akisi 
-                        SET giris = MAX(0, giris - ?), updated_at = CURRENT_TIMESTAMP
-                        WHERE ay = ? AND yil = ?
-                    ''', (monthly_installment, installment_month, installment_year))
+                    installment_month, installment_year = add_months(transaction_month, transaction_year, i + 1)
+                    cash_movements.append(movement(installment_month, installment_year, 'giris',
+                                                   -monthly_installment, 'İşlem silindi', 'islem', transaction_id))
+            
+            record_cash_movements(cursor, cash_movements)
         
         # Restore inventory if it's a sale
         if transaction_dict['islem_tipi'] == 'satis':
@@ -1785,43 +2306,54 @@ def delete_transaction(transaction_id):
         
         # Reverse employee stats if it's a sale
         if transaction_dict['islem_tipi'] == 'satis':
-            # Extract employee name from aciklama field
-            aciklama = transaction_dict.get('aciklama', '')
-            if 'Satıcı: ' in aciklama:
-                # Find the employee name after "Satıcı: "
-                start_pos = aciklama.find('Satıcı: ') + len('Satıcı: ')
-                end_pos = aciklama.find(',', start_pos)
-                if end_pos == -1:
-                    employee_name = aciklama[start_pos:].strip()
-                else:
-                    employee_name = aciklama[start_pos:end_pos].strip()
-                
+            employee_name = transaction_dict['satici']
+            if employee_name:
                 # Find the employee and reverse their stats
                 cursor.execute('SELECT * FROM calisanlar WHERE LOWER(ad) = LOWER(?)', (employee_name,))
                 employee = cursor.fetchone()
                 
                 if employee:
-                    # Subtract the transaction amount from employee performance
-                    cursor.execute('''
-                        UPDATE calisanlar 
-                        SET son_ay = MAX(0, son_ay - ?), 
-                            son_3_ay = MAX(0, son_3_ay - ?), 
-                            son_6_ay = MAX(0, son_6_ay - ?), 
-                            son_12_ay = MAX(0, son_12_ay - ?),
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    ''', (transaction_dict['toplam_tutar'], transaction_dict['toplam_tutar'], 
-                          transaction_dict['toplam_tutar'], transaction_dict['toplam_tutar'], employee['id']))
+                    # Take the sale out of the bucket of the day it was made. The windows are
+                    # re-summed from the buckets, so they stay exact and no MAX(0, ...) clamp
+                    # is needed as with the old running counters
+                    record_sales(cursor, [(employee['id'], transaction_dict['created_at'],
+                                           -(transaction_dict['toplam_tutar'] or 0), -1)])
+        
+        # Take the transaction out of the product's activity bucket
+        if transaction_dict['islem_tipi'] in COUNTED_TYPES and transaction_dict['urun_kodu']:
+            record_activity(cursor, [(transaction_dict['urun_kodu'], transaction_dict['created_at'], -1)])
         
         # Delete the transaction
+        apply_islem(cursor, transaction_id, sign=-1)
         cursor.execute('DELETE FROM islemler WHERE id = ?', (transaction_id,))
+        delete_media(cursor, [transaction_id])
         
         # Delete related payment plan if exists
-        if transaction_dict['odeme_plani_id']:
-            cursor.execute('DELETE FROM taksit_detaylari WHERE odeme_plani_id = ?', (transaction_dict['odeme_plani_id'],))
-            cursor.execute('DELETE FROM odeme_plani WHERE id = ?', (transaction_dict['odeme_plani_id'],))
+        odeme_plani_id = transaction_dict['odeme_plani_id']
+        if odeme_plani_id:
+            cursor.execute('SELECT MIN(id) as id FROM islemler WHERE odeme_plani_id = ?', (odeme_plani_id,))
+            remaining_line = cursor.fetchone()['id']
+            if remaining_line is None:
+                cursor.execute('DELETE FROM taksit_detaylari WHERE odeme_plani_id = ?', (odeme_plani_id,))
+                cursor.execute('DELETE FROM odeme_plani WHERE id = ?', (odeme_plani_id,))
+            else:
+                # Other lines of the same cart still use the plan: take this line's share
+                # out of the unpaid installments and the plan totals
+                taksit_share = (transaction_dict['taksit_miktar'] or 0) / (transaction_dict['taksit_sayisi'] or 1)
+                cursor.execute('''
+                    UPDATE taksit_detaylari SET miktar = MAX(0, miktar - ?), updated_at = CURRENT_TIMESTAMP
+                    WHERE odeme_plani_id = ? AND odendi = 0
+                ''', (taksit_share, odeme_plani_id))
+                cursor.execute('''
+                    UPDATE odeme_plani
+                    SET islem_id = ?, toplam_tutar = toplam_tutar - ?, pesin_miktar = pesin_miktar - ?,
+                        taksit_miktar = taksit_miktar - ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (remaining_line, transaction_dict['toplam_tutar'] or 0, transaction_dict['pesin_miktar'] or 0,
+                      transaction_dict['taksit_miktar'] or 0, odeme_plani_id))
         
         conn.commit()
+        schedule_media_gc()
         return jsonify({'message': 'Transaction deleted and cash flow updated'})
         
     except Exception as e:
@@ -1836,10 +2368,13 @@ def delete_islem(islem_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    apply_islem(cursor, islem_id, sign=-1)
     cursor.execute('DELETE FROM islemler WHERE id = ?', (islem_id,))
+    delete_media(cursor, [islem_id])
     
     conn.commit()
     conn.close()
+    schedule_media_gc()
     
     return jsonify({'message': 'İşlem silindi'})
 
@@ -1897,9 +2432,17 @@ def reset_envanter():
         # Clear all existing data - inventory and transactions
         cursor.execute('DELETE FROM envanter')
         cursor.execute('DELETE FROM islemler')
+        cursor.execute('DELETE FROM aylik_islem_ozeti')  # Monthly rollups behind /api/metrics
+        cursor.execute('SELECT DISTINCT islem_id FROM sale_media')
+        delete_media(cursor, [row['islem_id'] for row in cursor.fetchall()])  # Sale photos
         
         # Clear all financial data
         cursor.execute('DELETE FROM nakit_akisi')  # Cash flow data
+        cursor.execute('DELETE FROM cash_movements')  # Cash flow ledger
+        cursor.execute('DELETE FROM calisan_gunluk_satis')  # Employee sales buckets
+        cursor.execute('UPDATE calisanlar SET performans_tarihi = NULL')
+        refresh_sales_windows(cursor)
+        cursor.execute('DELETE FROM urun_gunluk_islem')  # Product activity buckets
         cursor.execute('DELETE FROM taksit_detaylari')  # Installment details
         cursor.execute('DELETE FROM odeme_plani')  # Payment plans
         cursor.execute('DELETE FROM acik_borclar')  # Outstanding debts
@@ -1925,6 +2468,8 @@ def reset_envanter():
             INSERT INTO envanter (urun_kodu, metre, metre_maliyet, fiyat, son_islem_tarihi, son_30_gun_islem)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', sample_envanter)
+        # No transactions are left, so the sample activity counts go back to zero
+        refresh_activity_windows(cursor)
         
         # Insert sample financial data - removed dummy debtors
         
@@ -1945,9 +2490,9 @@ def reset_envanter():
         return jsonify({
             'message': 'Envanter ve tüm finansal veriler başarıyla sıfırlandı',
             'cleared_tables': [
-                'envanter', 'islemler', 'nakit_akisi', 'taksit_detaylari', 
+                'envanter', 'islemler', 'nakit_akisi', 'cash_movements', 'taksit_detaylari', 
                 'odeme_plani', 'acik_borclar', 'beklenen_odemeler', 
-                'planlanan_odemeler', 'gundem_posts'
+                'planlanan_odemeler', 'gundem_posts', 'sale_media'
             ]
         })
         
@@ -1965,13 +2510,48 @@ def reset_calisanlar():
     
     # Clear all existing employee data
     cursor.execute('DELETE FROM calisanlar')
+    cursor.execute('DELETE FROM calisan_gunluk_satis')
     
     conn.commit()
     conn.close()
     
     return jsonify({'message': 'Çalışanlar tablosu sıfırlandı'})
 
+@app.route('/api/calisanlar/performans/rebuild', methods=['POST'])
+def rebuild_employee_sales():
+    """Recompute the employee sales buckets and windows from islemler"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = rebuild_sales_buckets(cursor)
+    conn.commit()
+    conn.close()
+
+    return jsonify({'message': 'Çalışan satışları yeniden hesaplandı', 'updated_employees': updated})
+
+@app.route('/api/metrics', methods=['GET'])
+@track_changes('islemler')
+def get_metrics():
+    """Sales/purchase metrics for a year: the yearly total and each month, from the monthly rollups"""
+    try:
+        year = int(request.args.get('year', datetime.now().year))
+    except ValueError:
+        return jsonify({'error': 'Geçersiz yıl'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM aylik_islem_ozeti WHERE yil = ?', (year,))
+    rows = {row['ay']: dict(row) for row in cursor.fetchall()}
+    conn.close()
+
+    total = {column: sum(row[column] for row in rows.values()) for column in ROLLUP_COLUMNS}
+    return jsonify({
+        'year': year,
+        'total': metrics_from_rollup(total),
+        'months': {month: metrics_from_rollup(rows.get(month)) for month in range(1, 13)},
+    })
+
 @app.route('/api/nakit-akisi', methods=['GET'])
+@track_changes('nakit_akisi', cached=True)
 def get_nakit_akisi():
     """Get monthly cash flow data"""
     year = request.args.get('year', datetime.now().year)
@@ -1984,6 +2564,31 @@ def get_nakit_akisi():
     
     return jsonify(akis)
 
+@app.route('/api/nakit-akisi/hareketler', methods=['GET'])
+@track_changes('cash_movements')
+def get_cash_movements():
+    """Ledger entries behind the cash flow of a year, optionally one month"""
+    try:
+        year = int(request.args.get('year', datetime.now().year))
+        month = int(request.args['month']) if request.args.get('month') else None
+    except ValueError:
+        return jsonify({'error': 'Geçersiz tarih'}), 400
+
+    if month is None:
+        return stream_query('SELECT * FROM cash_movements WHERE yil = ? ORDER BY ay, id', (year,))
+    return stream_query('SELECT * FROM cash_movements WHERE yil = ? AND ay = ? ORDER BY id', (year, month))
+
+@app.route('/api/nakit-akisi/rebuild', methods=['POST'])
+def rebuild_cash_flow():
+    """Recompute the monthly cash flow totals from the ledger"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = rebuild_nakit_akisi(cursor)
+    conn.commit()
+    conn.close()
+
+    return jsonify({'message': 'Nakit akışı yeniden hesaplandı', 'updated_months': updated})
+
 @app.route('/api/nakit-akisi', methods=['POST'])
 def update_nakit_akisi():
     """Update monthly cash flow"""
@@ -1997,11 +2602,19 @@ def update_nakit_akisi():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Insert or update
+    # Setting absolute totals is recorded as adjustment movements for the difference
+    cursor.execute('SELECT giris, cikis FROM nakit_akisi WHERE ay = ? AND yil = ?', (ay, yil))
+    existing = cursor.fetchone()
+    current_giris = (existing['giris'] or 0) if existing else 0
+    current_cikis = (existing['cikis'] or 0) if existing else 0
+    record_cash_movements(cursor, [
+        movement(ay, yil, 'giris', float(giris) - current_giris, aciklama, 'duzeltme'),
+        movement(ay, yil, 'cikis', float(cikis) - current_cikis, aciklama, 'duzeltme'),
+    ])
     cursor.execute('''
-        INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (ay, yil, giris, cikis, aciklama))
+        INSERT INTO nakit_akisi (ay, yil, giris, cikis, aciklama) VALUES (?, ?, 0, 0, ?)
+        ON CONFLICT(ay, yil) DO UPDATE SET aciklama = excluded.aciklama, updated_at = CURRENT_TIMESTAMP
+    ''', (ay, yil, aciklama))
     
     conn.commit()
     conn.close()
@@ -2020,24 +2633,7 @@ def add_income_to_cash_flow():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Get current cash flow for this month
-    cursor.execute('SELECT * FROM nakit_akisi WHERE ay = ? AND yil = ?', (ay, yil))
-    existing = cursor.fetchone()
-    
-    if existing:
-        # Update existing record
-        new_giris = existing['giris'] + miktar
-        cursor.execute('''
-            UPDATE nakit_akisi 
-            SET giris = ?, aciklama = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE ay = ? AND yil = ?
-        ''', (new_giris, aciklama, ay, yil))
-    else:
-        # Create new record
-        cursor.execute('''
-            INSERT INTO nakit_akisi (ay, yil, giris, cikis, aciklama)
-            VALUES (?, ?, ?, 0, ?)
-        ''', (ay, yil, miktar, aciklama))
+    add_cash_movement(cursor, ay, yil, 'giris', miktar, aciklama, 'gelir')
     
     conn.commit()
     conn.close()
@@ -2045,25 +2641,28 @@ def add_income_to_cash_flow():
     return jsonify({'message': 'Gelir eklendi'})
 
 @app.route('/api/odeme-plani', methods=['GET'])
+@track_changes('odeme_plani', 'taksit_detaylari')
 def get_odeme_plani():
     """Get all payment plans"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
+    # Ordered by plan id within a timestamp too, so each plan's rows are contiguous
+    return stream_query('''
         SELECT op.*, td.taksit_no, td.miktar as taksit_miktar, 
                td.vade_ay, td.vade_yil, td.odendi, td.odeme_tarihi
         FROM odeme_plani op
         LEFT JOIN taksit_detaylari td ON op.id = td.odeme_plani_id
-        ORDER BY op.created_at DESC, td.taksit_no ASC
-    ''')
-    
-    plans = {}
-    for row in cursor.fetchall():
+        ORDER BY op.created_at DESC, op.id, td.taksit_no ASC
+    ''', items=plans_with_installments)
+
+def plans_with_installments(rows):
+    """One dict per payment plan, with its installments, from rows grouped by plan"""
+    plan = None
+    for row in rows:
         row_dict = dict(row)
-        plan_id = row_dict['id']
         
-        if plan_id not in plans:
-            plans[plan_id] = {
+        if plan is None or plan['id'] != row_dict['id']:
+            if plan is not None:
+                yield plan
+            plan = {
                 'id': row_dict['id'],
                 'islem_id': row_dict['islem_id'],
                 'musteri': row_dict['musteri'],
@@ -2079,7 +2678,7 @@ def get_odeme_plani():
             }
         
         if row_dict['taksit_no']:
-            plans[plan_id]['taksitler'].append({
+            plan['taksitler'].append({
                 'taksit_no': row_dict['taksit_no'],
                 'miktar': row_dict['taksit_miktar'],
                 'vade_ay': row_dict['vade_ay'],
@@ -2087,9 +2686,8 @@ def get_odeme_plani():
                 'odendi': row_dict['odendi'],
                 'odeme_tarihi': row_dict['odeme_tarihi']
             })
-    
-    conn.close()
-    return jsonify(list(plans.values()))
+    if plan is not None:
+        yield plan
 
 @app.route('/api/odeme-plani', methods=['POST'])
 def create_odeme_plani():
@@ -2156,42 +2754,26 @@ def pay_installment(taksit_id):
         taksit = cursor.fetchone()
         if not taksit:
             return jsonify({'error': 'Taksit bulunamadı'}), 404
+        if taksit['odendi']:
+            return jsonify({'error': 'Taksit zaten ödenmiş'}), 400
         
-        # Mark as paid
-        cursor.execute('''
-            UPDATE taksit_detaylari 
-            SET odendi = TRUE, odeme_tarihi = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (taksit_id,))
+        # Mark as paid: the whole remaining amount of this one installment
+        apply_allocations(cursor, allocate_payment([dict(taksit)], float(taksit['miktar'])))
         
         # Add to cash flow (exclude mail orders)
         # Get the related transaction to check if it's a mail order
         cursor.execute('''
-            SELECT i.aciklama FROM islemler i
+            SELECT i.is_mail_order FROM islemler i
             JOIN odeme_plani op ON i.id = op.islem_id
             WHERE op.id = ?
         ''', (taksit['odeme_plani_id'],))
         
         transaction_info = cursor.fetchone()
-        is_mail_order = False
-        if transaction_info:
-            try:
-                # transaction_info may be a Row; access by key safely
-                info = dict(transaction_info)
-                is_mail_order = (info.get('aciklama') or '').find('Mail_Order: true') != -1
-            except Exception:
-                pass
+        is_mail_order = bool(transaction_info and transaction_info['is_mail_order'])
         
         if ADD_BEKLENEN_TO_CASHFLOW and not is_mail_order:
-            cursor.execute('''
-                INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
-                VALUES (?, ?, 
-                        COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
-                        COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
-                        ?, CURRENT_TIMESTAMP)
-            ''', (taksit['vade_ay'], taksit['vade_yil'], taksit['vade_ay'], taksit['vade_yil'], 
-                  taksit['miktar'], taksit['vade_ay'], taksit['vade_yil'], 
-                  f"Taksit ödemesi - {taksit['musteri']}"))
+            add_cash_movement(cursor, taksit['vade_ay'], taksit['vade_yil'], 'giris', taksit['miktar'],
+                              f"Taksit ödemesi - {taksit['musteri']}", 'taksit', taksit_id)
         
         conn.commit()
         return jsonify({'message': 'Taksit ödemesi kaydedildi'})
@@ -2203,6 +2785,7 @@ def pay_installment(taksit_id):
         conn.close()
 
 @app.route('/api/finansal-ozet', methods=['GET'])
+@track_changes('nakit_akisi', 'islemler', 'envanter', 'odeme_plani', cached=True)
 def get_finansal_ozet():
     """Get comprehensive financial summary"""
     year = request.args.get('year', datetime.now().year)
@@ -2287,7 +2870,7 @@ def register_user():
         if role not in ['yönetici', 'çalışan']:
             return jsonify({'error': 'Role must be either "yönetici" or "çalışan"'}), 400
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Check if username already exists
@@ -2321,7 +2904,7 @@ def login_user():
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -2351,7 +2934,7 @@ def login_user():
 def get_users():
     """Get all users (admin only)"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -2383,19 +2966,20 @@ def health_check():
 @app.route('/')
 def serve_react_app():
     """Serve the React app's index.html"""
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_manifest.response('index.html', request)
 
 @app.route('/<path:path>')
 def serve_static_files(path):
     """Serve static files or return React app for client-side routing"""
-    file_path = os.path.join(app.static_folder, path)
-    if os.path.exists(file_path):
-        return send_from_directory(app.static_folder, path)
-    else:
-        # For client-side routing, return index.html
-        return send_from_directory(app.static_folder, 'index.html')
+    return static_manifest.response(path, request)
 
-if __name__ == '__main__':
+def prepare_database():
+    """Startup work on the real database, run once before the server starts"""
     init_db()
+    # The legacy photos are in the blob store and referenced from the real database now
+    remove_legacy_media(MEDIA_ROOT)
+
+if __name__ == '__main__':
+    prepare_database()
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port) 
\ No newline at end of file
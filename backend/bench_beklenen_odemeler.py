@@ -0,0 +1,130 @@
+"""Benchmark GET /api/beklenen-odemeler against the old per-transaction (N+1) query.
+
+Seeds throwaway databases with open and fully paid installment plans and times
+both implementations, first as the paid-off history grows (the new query should
+stay flat) and then as the number of open plans grows (one statement instead of
+one per installment sale).
+
+    python bench_beklenen_odemeler.py
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import app as tukkan
+from blob_store import BlobStore
+from db import ConnectionPool
+
+INSTALLMENTS = 12
+OPEN_PLANS = 200
+CLOSED_PLAN_STEPS = (0, 2000, 5000, 10000)
+CLOSED_PLANS = 2000
+OPEN_PLAN_STEPS = (100, 500, 1000, 2500)
+REPEAT = 5
+
+
+def seed(conn, open_plans, closed_plans):
+    cursor = conn.cursor()
+    for n in range(open_plans + closed_plans):
+        is_open = n < open_plans
+        cursor.execute('''
+            INSERT INTO odeme_plani (islem_id, musteri, toplam_tutar, taksit_miktar, taksit_sayisi, ay, yil)
+            VALUES (0, ?, 1200, 1200, ?, 1, 2025)
+        ''', (f'Müşteri {n}', INSTALLMENTS))
+        plan_id = cursor.lastrowid
+        cursor.executemany('''
+            INSERT INTO taksit_detaylari (odeme_plani_id, taksit_no, miktar, vade_ay, vade_yil, odendi, odeme_tarihi)
+            VALUES (?, ?, 100, ?, 2025, ?, ?)
+        ''', [(plan_id, k + 1, k + 1, 0 if is_open and k >= 3 else 1,
+               None if is_open and k >= 3 else '2025-02-01 10:00:00') for k in range(INSTALLMENTS)])
+        cursor.execute('''
+            INSERT INTO islemler (islem_tipi, urun_kodu, miktar, birim_fiyat, toplam_tutar, musteri, odeme_tipi,
+                                  aciklama, taksit_miktar, taksit_sayisi, odeme_plani_id, created_at)
+            VALUES ('satis', 'ZAMBAK', 1, 1200, 1200, ?, 'taksit', ?, 1200, ?, ?, '2025-01-01 10:00:00')
+        ''', (f'Müşteri {n}', f'Satış ID: SAT-250101-{n:06d}, Taksit_Odeme_Tipi: nakit', INSTALLMENTS, plan_id))
+    conn.commit()
+
+
+def legacy_beklenen_odemeler(conn):
+    """The pre-optimization implementation: one aggregate query per transaction"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT i.id as transaction_id, i.taksit_miktar as acik_odeme, i.odeme_plani_id, i.created_at as last_payment_date
+        FROM islemler i
+        WHERE i.islem_tipi = 'satis' AND i.taksit_miktar > 0
+        AND i.aciklama NOT LIKE '%Taksit_Odeme_Tipi: kart%'
+        ORDER BY i.created_at DESC
+    ''')
+    odemeler = [dict(row) for row in cursor.fetchall()]
+    for odeme in odemeler:
+        if odeme['odeme_plani_id']:
+            cursor.execute('''
+                SELECT COUNT(*) as total_installments,
+                       COUNT(CASE WHEN odendi = 1 THEN 1 END) as paid_installments,
+                       SUM(CASE WHEN odendi = 0 THEN miktar ELSE 0 END) as remaining_amount,
+                       MAX(CASE WHEN odendi = 1 THEN odeme_tarihi END) as last_payment_date
+                FROM taksit_detaylari WHERE odeme_plani_id = ?
+            ''', (odeme['odeme_plani_id'],))
+            debt_info = cursor.fetchone()
+            odeme['acik_odeme'] = debt_info['remaining_amount'] or 0
+    return [o for o in odemeler if o['acik_odeme'] > 0]
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, result
+
+
+def run(workdir, open_plans, closed_plans):
+    db_path = os.path.join(workdir, f'bench_{open_plans}_{closed_plans}.db')
+    tukkan.DATABASE_PATH = db_path
+    tukkan.db_pool = ConnectionPool(db_path)
+    # A media root of its own, so the bench never touches the real photos
+    tukkan.MEDIA_ROOT = os.path.join(workdir, 'media')
+    tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+    tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    seed(conn, open_plans, closed_plans)
+    conn.execute('ANALYZE')
+
+    client = tukkan.app.test_client()
+    legacy_ms, legacy_rows = best_of(lambda: legacy_beklenen_odemeler(conn))
+
+    def fetch():
+        # The list is streamed: read all of it, then close to return the pooled connection
+        response = client.get('/api/beklenen-odemeler')
+        rows = response.get_json()
+        response.close()
+        return rows
+
+    new_ms, new_rows = best_of(fetch)
+    assert len(new_rows) == len(legacy_rows) == open_plans
+    print(f'{open_plans:>10} {closed_plans:>7} {legacy_ms:>10.1f} {new_ms:>8.1f} {legacy_ms / new_ms:>7.1f}x')
+
+    conn.close()
+    tukkan.db_pool.close_all()
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='tukkan-bench-')
+    try:
+        print(f'{"open plans":>10} {"closed":>7} {"legacy ms":>10} {"new ms":>8} {"speedup":>8}')
+        for closed_plans in CLOSED_PLAN_STEPS:
+            run(workdir, OPEN_PLANS, closed_plans)
+        print()
+        for open_plans in OPEN_PLAN_STEPS:
+            run(workdir, open_plans, CLOSED_PLANS)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark the nakit_akisi update of a 24-installment sale.
+
+Compares the old per-month INSERT OR REPLACE with two correlated subqueries
+against accumulate_cash_flow(), which folds all months into one executemany
+ON CONFLICT upsert. Each round runs inside a transaction that is rolled back,
+so every round starts from the same table. The second table repeats the
+comparison as nakit_akisi grows with more years of history.
+
+    python bench_cash_flow.py
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import app as tukkan
+from blob_store import BlobStore
+from cashflow import accumulate_cash_flow
+from db import ConnectionPool
+
+INSTALLMENTS = 24
+ROUNDS = 2000
+HISTORY_YEARS = (1, 10, 50)
+
+
+def installment_months(taksit_sayisi, start_month=1, start_year=2025):
+    for i in range(taksit_sayisi):
+        month = start_month + i + 1
+        year = start_year
+        while month > 12:
+            month -= 12
+            year += 1
+        yield month, year, f'Taksit {i + 1}/{taksit_sayisi}'
+
+
+def legacy_sale(cursor, amount):
+    """The pre-optimization write: read-modify-write of one row per installment month"""
+    for ay, yil, aciklama in installment_months(INSTALLMENTS):
+        cursor.execute('''
+            INSERT OR REPLACE INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
+            VALUES (?, ?,
+                    COALESCE((SELECT giris FROM nakit_akisi WHERE ay = ? AND yil = ?), 0) + ?,
+                    COALESCE((SELECT cikis FROM nakit_akisi WHERE ay = ? AND yil = ?), 0),
+                    ?, CURRENT_TIMESTAMP)
+        ''', (ay, yil, ay, yil, amount, ay, yil, aciklama))
+
+
+def upsert_sale(cursor, amount):
+    accumulate_cash_flow(cursor, [(ay, yil, amount, 0, aciklama)
+                                  for ay, yil, aciklama in installment_months(INSTALLMENTS)])
+
+
+def time_rounds(conn, write):
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        conn.execute('BEGIN')
+        write(cursor, 50.0)
+        conn.rollback()
+    return (time.perf_counter() - started) / ROUNDS * 1e6
+
+
+def run(workdir, history_years):
+    db_path = os.path.join(workdir, f'bench_{history_years}.db')
+    tukkan.DATABASE_PATH = db_path
+    tukkan.db_pool = ConnectionPool(db_path)
+    # A media root of its own, so the bench never touches the real photos
+    tukkan.MEDIA_ROOT = os.path.join(workdir, 'media')
+    tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+    tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+    tukkan.db_pool.close_all()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.executemany(
+        'INSERT OR IGNORE INTO nakit_akisi (ay, yil, giris, cikis) VALUES (?, ?, 100, 50)',
+        [(ay, yil) for yil in range(2025 - history_years, 2028) for ay in range(1, 13)],
+    )
+
+    # Both writers must leave the table in the same state
+    results = []
+    for write in (legacy_sale, upsert_sale):
+        conn.execute('BEGIN')
+        write(conn.cursor(), 50.0)
+        results.append(conn.execute('SELECT ay, yil, giris, cikis FROM nakit_akisi ORDER BY yil, ay').fetchall())
+        conn.rollback()
+    assert results[0] == results[1]
+
+    legacy_us = time_rounds(conn, legacy_sale)
+    upsert_us = time_rounds(conn, upsert_sale)
+    rows = conn.execute('SELECT COUNT(*) FROM nakit_akisi').fetchone()[0]
+    print(f'{rows:>6} {legacy_us:>10.1f} {upsert_us:>10.1f} {legacy_us / upsert_us:>7.1f}x')
+    conn.close()
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='tukkan-bench-')
+    try:
+        print(f'{INSTALLMENTS}-installment sale, mean of {ROUNDS} rounds')
+        print(f'{"months":>6} {"legacy us":>10} {"upsert us":>10} {"speedup":>8}')
+        for history_years in HISTORY_YEARS:
+            run(workdir, history_years)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark GET /api/islemler on a 100k-row table: jsonify vs streaming.
+
+Seeds a throwaway database with ROWS transactions, then serves the full list
+once per mode, each in a fresh subprocess so peak RSS is not shared:
+
+    jsonify  the previous code: fetchall, dict per row, one JSON string
+    json     stream_rows with the standard library encoder
+    orjson   stream_rows with orjson (skipped when it is not installed)
+
+Reports time to first byte, total time, the peak RSS of the process and its
+growth while serving. The body is consumed and dropped chunk by chunk as a
+server would.
+
+    python bench_json_stream.py
+"""
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROWS = 100_000
+
+
+def seed(db_path):
+    import app as tukkan
+    from blob_store import BlobStore
+    from db import ConnectionPool
+
+    tukkan.DATABASE_PATH = db_path
+    tukkan.db_pool = ConnectionPool(db_path)
+    # A media root of its own, so the bench never touches the real photos
+    tukkan.MEDIA_ROOT = os.path.join(os.path.dirname(db_path), 'media')
+    tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+    tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+    conn = tukkan.db_pool.acquire()
+    conn.executemany('''
+        INSERT INTO islemler (islem_tipi, islem_kodu, urun_kodu, miktar, birim_fiyat, toplam_tutar,
+                              pesin_miktar, taksit_miktar, taksit_sayisi, musteri, satici, created_at)
+        VALUES ('satis', ?, ?, 1.5, 100, 150, 50, 100, 6, 'Bench Müşteri', 'Bench', ?)
+    ''', [(f'BENCH-{n:06d}', f'URUN{n % 500:03d}', f'2025-{n % 12 + 1:02d}-{n % 28 + 1:02d} 12:00:00')
+          for n in range(ROWS)])
+    conn.commit()
+    conn.close()
+    tukkan.db_pool.close_all()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def serve(db_path, mode):
+    import json_stream
+    import app as tukkan
+    from db import ConnectionPool
+    from flask import jsonify
+
+    if mode == 'json' and json_stream.ENCODER != 'json':
+        fallback = json_stream.json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+        json_stream.encode_row = lambda row: fallback.encode(dict(row)).encode('utf-8')
+    tukkan.DATABASE_PATH = db_path
+    tukkan.db_pool = ConnectionPool(db_path)
+    client = tukkan.app.test_client()
+    client.get('/api/islemler?limit=1')  # warm up the pool and imports
+    baseline = peak_rss_mb()
+
+    started = time.perf_counter()
+    size = 0
+    if mode == 'jsonify':
+        with tukkan.app.test_request_context('/api/islemler'):
+            conn = tukkan.get_db_connection()
+            rows = [dict(row) for row in conn.execute(
+                'SELECT * FROM islemler ORDER BY created_at DESC, id DESC').fetchall()]
+            conn.close()
+            body = jsonify(rows).get_data()
+            first_byte = time.perf_counter()
+            size = len(body)
+    else:
+        response = client.get('/api/islemler', buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        first_byte = time.perf_counter()
+        for chunk in chunks:
+            size += len(chunk)
+        response.close()
+    finished = time.perf_counter()
+    print(f'{mode:<8} {(first_byte - started) * 1000:>9.1f} {(finished - started) * 1000:>9.1f} '
+          f'{peak_rss_mb():>9.1f} {peak_rss_mb() - baseline:>13.1f} {size / 1e6:>8.1f}')
+
+
+def main():
+    if len(sys.argv) == 3:
+        serve(sys.argv[1], sys.argv[2])
+        return
+    workdir = tempfile.mkdtemp(prefix='tukkan-bench-')
+    try:
+        db_path = os.path.join(workdir, 'bench.db')
+        seed(db_path)
+        try:
+            import orjson  # noqa: F401
+            modes = ('jsonify', 'json', 'orjson')
+        except ImportError:
+            modes = ('jsonify', 'json')
+        print(f'{ROWS} rows')
+        print(f'{"mode":<8} {"ttfb ms":>9} {"total ms":>9} {"peak MB":>9} {"peak RSS +MB":>13} {"body MB":>8}')
+        for mode in modes:
+            subprocess.run([sys.executable, __file__, db_path, mode], check=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
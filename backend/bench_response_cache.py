@@ -0,0 +1,74 @@
+"""Benchmark polling GET endpoints with and without the response cache.
+
+Seeds a throwaway database with products, employees and posts, then times
+clients that poll without an ETag (a fresh tab, or a client behind a proxy
+that drops If-None-Match). Without the cache every poll reruns the query and
+the JSON serialization; with it, an unchanged table costs the revision lookup
+and a dictionary hit. Runs through the Flask test client.
+
+    python bench_response_cache.py
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import app as tukkan
+from blob_store import BlobStore
+from db import ConnectionPool
+
+PRODUCTS = 2000
+PATHS = ('/api/envanter', '/api/calisanlar', '/api/gundem-posts', '/api/nakit-akisi', '/api/finansal-ozet')
+ROUNDS = 200
+
+
+def seed(client):
+    for n in range(PRODUCTS):
+        client.post('/api/envanter', json={'urun_kodu': f'BENCH{n:04d}', 'metre': 100,
+                                           'metre_maliyet': 50, 'fiyat': 100})
+    for n in range(20):
+        client.post('/api/calisanlar', json={'ad': f'Bench{n}'})
+
+
+def poll(client, path):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        response = client.get(path)
+        assert response.status_code == 200
+        # Streamed lists are only rendered (and cached) as they are read, and
+        # return their pooled connection when the response is closed
+        response.get_data()
+        response.close()
+    return (time.perf_counter() - started) / ROUNDS * 1000
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='tukkan-bench-')
+    try:
+        db_path = os.path.join(workdir, 'bench.db')
+        tukkan.DATABASE_PATH = db_path
+        tukkan.db_pool = ConnectionPool(db_path)
+        # A media root of its own, so the bench never touches the real photos
+        tukkan.MEDIA_ROOT = os.path.join(workdir, 'media')
+        tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+        tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+        client = tukkan.app.test_client()
+        seed(client)
+
+        max_bytes = tukkan.response_cache.max_bytes
+        print(f'{"path":<22} {"uncached ms":>12} {"cached ms":>10} {"speedup":>8}')
+        for path in PATHS:
+            tukkan.response_cache.max_bytes = 0
+            tukkan.response_cache.clear()
+            uncached_ms = poll(client, path)
+            tukkan.response_cache.max_bytes = max_bytes
+            cached_ms = poll(client, path)
+            print(f'{path:<22} {uncached_ms:>12.2f} {cached_ms:>10.2f} {uncached_ms / cached_ms:>7.1f}x')
+        print(tukkan.response_cache.stats())
+        tukkan.db_pool.close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark installment payment allocation against the old per-installment loop.
+
+Seeds a throwaway database with one plan per length and times a prepayment
+that settles every installment but the last, which it pays in part. The old
+loop re-reads the next unpaid installment and updates it once per iteration;
+the allocator reads the plan once and writes full and partial updates in one
+statement each. Each round is rolled back, so every round pays the same plan.
+
+    python bench_taksit_odeme.py
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import app as tukkan
+from blob_store import BlobStore
+from db import ConnectionPool
+from installments import allocate_payment, apply_allocations, unpaid_installments
+
+PLAN_LENGTHS = (6, 12, 24, 36, 72)
+INSTALLMENT = 100.0
+ROUNDS = 500
+
+
+def seed(conn, taksit_sayisi):
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO odeme_plani (islem_id, musteri, toplam_tutar, taksit_miktar, taksit_sayisi, ay, yil)
+        VALUES (0, 'Bench', ?, ?, ?, 1, 2025)
+    ''', (INSTALLMENT * taksit_sayisi, INSTALLMENT * taksit_sayisi, taksit_sayisi))
+    plan_id = cursor.lastrowid
+    cursor.executemany('''
+        INSERT INTO taksit_detaylari (odeme_plani_id, taksit_no, miktar, vade_ay, vade_yil)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(plan_id, k + 1, INSTALLMENT, k % 12 + 1, 2025 + k // 12) for k in range(taksit_sayisi)])
+    conn.commit()
+    return plan_id
+
+
+def legacy_pay(cursor, plan_id, amount):
+    """The pre-optimization allocation: one SELECT and one UPDATE per installment"""
+    remaining_to_pay = amount
+    while remaining_to_pay > 1e-9:
+        cursor.execute('''
+            SELECT * FROM taksit_detaylari
+            WHERE odeme_plani_id = ? AND odendi = 0
+            ORDER BY taksit_no ASC
+            LIMIT 1
+        ''', (plan_id,))
+        next_installment = cursor.fetchone()
+        if not next_installment:
+            break
+        installment_amount = float(next_installment['miktar'])
+        pay_now = min(installment_amount, remaining_to_pay)
+        if pay_now + 1e-6 >= installment_amount:
+            cursor.execute('''
+                UPDATE taksit_detaylari
+                SET odendi = 1, odeme_tarihi = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (next_installment['id'],))
+        else:
+            cursor.execute('''
+                UPDATE taksit_detaylari SET miktar = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            ''', (max(0.0, installment_amount - pay_now), next_installment['id']))
+        remaining_to_pay -= pay_now
+
+
+def allocator_pay(cursor, plan_id, amount):
+    apply_allocations(cursor, allocate_payment(unpaid_installments(cursor, plan_id), amount))
+
+
+def plan_state(conn, plan_id):
+    return conn.execute('''
+        SELECT taksit_no, miktar, odendi FROM taksit_detaylari WHERE odeme_plani_id = ? ORDER BY taksit_no
+    ''', (plan_id,)).fetchall()
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Counts execute/executemany calls (an executemany is one prepared statement)"""
+    calls = 0
+
+    def execute(self, *args):
+        CountingCursor.calls += 1
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        CountingCursor.calls += 1
+        return super().executemany(*args)
+
+
+def measure(conn, pay, plan_id, amount):
+    conn.execute('BEGIN')
+    CountingCursor.calls = 0
+    pay(conn.cursor(CountingCursor), plan_id, amount)
+    statement_count = CountingCursor.calls
+    state = plan_state(conn, plan_id)
+    conn.rollback()
+
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        conn.execute('BEGIN')
+        pay(conn.cursor(), plan_id, amount)
+        conn.rollback()
+    return (time.perf_counter() - started) / ROUNDS * 1e6, statement_count, state
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='tukkan-bench-')
+    try:
+        db_path = os.path.join(workdir, 'bench.db')
+        tukkan.DATABASE_PATH = db_path
+        tukkan.db_pool = ConnectionPool(db_path)
+        # A media root of its own, so the bench never touches the real photos
+        tukkan.MEDIA_ROOT = os.path.join(workdir, 'media')
+        tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+        tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+        tukkan.db_pool.close_all()
+
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        print(f'{"installments":>12} {"legacy us":>10} {"stmts":>6} {"allocator us":>13} {"stmts":>6} {"speedup":>8}')
+        for taksit_sayisi in PLAN_LENGTHS:
+            conn.execute('BEGIN')
+            plan_id = seed(conn, taksit_sayisi)
+            amount = INSTALLMENT * (taksit_sayisi - 0.5)
+            legacy_us, legacy_stmts, legacy_state = measure(conn, legacy_pay, plan_id, amount)
+            new_us, new_stmts, new_state = measure(conn, allocator_pay, plan_id, amount)
+            assert [tuple(row) for row in legacy_state] == [tuple(row) for row in new_state]
+            print(f'{taksit_sayisi:>12} {legacy_us:>10.1f} {legacy_stmts:>6} {new_us:>13.1f} {new_stmts:>6} '
+                  f'{legacy_us / new_us:>7.1f}x')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
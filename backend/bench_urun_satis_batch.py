@@ -0,0 +1,88 @@
+"""Benchmark a multi-line checkout: one POST /api/urun-satis per line vs /api/urun-satis/batch.
+
+Seeds a throwaway database with enough products and stock, then times a cart
+of N fabric lines (12 installments) sold line by line and as one batch. Runs
+through the Flask test client, so the per-request cost shown for the
+line-by-line case leaves out the network round trips a browser would add.
+
+    python bench_urun_satis_batch.py
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import app as tukkan
+from blob_store import BlobStore
+from db import ConnectionPool
+
+LINE_STEPS = (1, 5, 10, 25, 50)
+REPEAT = 5
+INSTALLMENTS = 12
+
+
+def seed(client, products):
+    client.post('/api/calisanlar', json={'ad': 'Bench'})
+    for n in range(products):
+        client.post('/api/envanter', json={'urun_kodu': f'BENCH{n:03d}', 'metre': 100000,
+                                           'metre_maliyet': 50, 'fiyat': 100})
+
+
+def cart(lines):
+    return [{'urun_kodu': f'BENCH{n:03d}', 'miktar': 1.5, 'birim_fiyat': 100} for n in range(lines)]
+
+
+def sell_line_by_line(client, kalemler):
+    for kalem in kalemler:
+        toplam = kalem['miktar'] * kalem['birim_fiyat']
+        response = client.post('/api/urun-satis', json={
+            **kalem, 'satici_ismi': 'Bench', 'musteri': 'Müşteri',
+            'pesin_miktar': toplam / 4, 'taksit_miktar': toplam * 3 / 4, 'taksit_sayisi': INSTALLMENTS,
+        })
+        assert response.status_code == 201, response.get_json()
+
+
+def sell_batch(client, kalemler):
+    toplam = sum(kalem['miktar'] * kalem['birim_fiyat'] for kalem in kalemler)
+    response = client.post('/api/urun-satis/batch', json={
+        'kalemler': kalemler, 'satici_ismi': 'Bench', 'musteri': 'Müşteri',
+        'pesin_miktar': toplam / 4, 'taksit_miktar': toplam * 3 / 4, 'taksit_sayisi': INSTALLMENTS,
+    })
+    assert response.status_code == 201, response.get_json()
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='tukkan-bench-')
+    try:
+        db_path = os.path.join(workdir, 'bench.db')
+        tukkan.DATABASE_PATH = db_path
+        tukkan.db_pool = ConnectionPool(db_path)
+        # A media root of its own, so the bench never touches the real photos
+        tukkan.MEDIA_ROOT = os.path.join(workdir, 'media')
+        tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+        tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+        client = tukkan.app.test_client()
+        seed(client, max(LINE_STEPS))
+
+        print(f'{"lines":>5} {"per line ms":>12} {"batch ms":>9} {"speedup":>8}')
+        for lines in LINE_STEPS:
+            kalemler = cart(lines)
+            single_ms = best_of(lambda: sell_line_by_line(client, kalemler))
+            batch_ms = best_of(lambda: sell_batch(client, kalemler))
+            print(f'{lines:>5} {single_ms:>12.1f} {batch_ms:>9.1f} {single_ms / batch_ms:>7.1f}x')
+        tukkan.db_pool.close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Content-addressed blob store for media files.
+
+A blob is stored once under its SHA-256, sharded by the first two byte pairs
+of the hash (blobs/ab/cd/abcd...), and recorded in media_blobs. Files are
+written to a temp file in the same filesystem and renamed into place, so a
+reader never sees a partial blob and the same content forwarded twice is
+stored once. Tables such as sale_media reference blobs by hash.
+
+Garbage collection is incremental: when references go away, release_blobs
+stamps the blobs that lost their last reference with orphaned_at, and a GC
+pass only looks at stamped blobs (a partial index) older than a grace
+period, a batch at a time, instead of walking the tree. Registering a blob
+and its reference happen in one write transaction and a GC pass holds the
+write lock while it deletes, so a blob being re-added is never removed.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+# (table, column) pairs that reference media_blobs.sha256
+BLOB_REFERENCES = (
+    ('sale_media', 'sha256'),
+    ('sale_media', 'thumb_sha256'),
+    ('sale_media', 'preview_sha256'),
+)
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def put(self, data, sha256=None):
+        """Store data under its hash unless already present; returns the hash"""
+        sha256 = sha256 or hashlib.sha256(data).hexdigest()
+        path = self.path(sha256)
+        if os.path.exists(path):
+            return sha256
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return sha256
+
+    def read(self, sha256):
+        with open(self.path(sha256), 'rb') as f:
+            return f.read()
+
+    def delete(self, sha256):
+        try:
+            os.unlink(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+def register_blob(cursor, store, data, mimetype=None):
+    """Record and store a blob; the caller commits it together with its reference"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    # Written first so this transaction holds the write lock before the file is checked
+    cursor.execute('''
+        INSERT INTO media_blobs (sha256, size, mimetype) VALUES (?, ?, ?)
+        ON CONFLICT(sha256) DO UPDATE SET orphaned_at = NULL
+    ''', (sha256, len(data), mimetype))
+    store.put(data, sha256)
+    return sha256
+
+
+def referenced(cursor, sha256):
+    query = ' UNION ALL '.join(f'SELECT 1 FROM {table} WHERE {column} = ?' for table, column in BLOB_REFERENCES)
+    cursor.execute(f'SELECT EXISTS ({query})', [sha256] * len(BLOB_REFERENCES))
+    return bool(cursor.fetchone()[0])
+
+
+def release_blobs(cursor, hashes):
+    """Mark the given blobs as GC candidates if nothing references them any more"""
+    orphaned = [sha256 for sha256 in {h for h in hashes if h} if not referenced(cursor, sha256)]
+    if orphaned:
+        cursor.executemany('''
+            UPDATE media_blobs SET orphaned_at = ? WHERE sha256 = ? AND orphaned_at IS NULL
+        ''', [(time.time(), sha256) for sha256 in orphaned])
+    return len(orphaned)
+
+
+def collect_garbage(conn, store, grace_seconds=3600, batch_size=200):
+    """Delete up to batch_size orphaned blobs older than the grace period.
+
+    Runs in its own BEGIN IMMEDIATE transaction on conn and commits it.
+    Returns (deleted, freed_bytes).
+    """
+    cutoff = time.time() - grace_seconds
+    cursor = conn.cursor()
+    # Cheap read first so a pass with nothing to do never takes the write lock
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM media_blobs WHERE orphaned_at < ?)', (cutoff,))
+    if not cursor.fetchone()[0]:
+        conn.rollback()
+        return 0, 0
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            SELECT sha256, size FROM media_blobs
+            WHERE orphaned_at IS NOT NULL AND orphaned_at < ?
+            ORDER BY orphaned_at
+            LIMIT ?
+        ''', (cutoff, batch_size))
+        candidates = cursor.fetchall()
+        deleted, freed = [], 0
+        for sha256, size in candidates:
+            if referenced(cursor, sha256):
+                # Picked up again since it was released
+                cursor.execute('UPDATE media_blobs SET orphaned_at = NULL WHERE sha256 = ?', (sha256,))
+                continue
+            # File first: a crash before the commit leaves a row whose file is already gone,
+            # which the next pass deletes, rather than a file nothing points at
+            store.delete(sha256)
+            deleted.append((sha256,))
+            freed += size
+        cursor.executemany('DELETE FROM media_blobs WHERE sha256 = ?', deleted)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(deleted), freed
+
+
+def storage_report(cursor):
+    """Blob counts and bytes: stored, referenced, orphaned, and what deduplication saved"""
+    cursor.execute('''
+        SELECT COUNT(*), COALESCE(SUM(size), 0),
+               COALESCE(SUM(orphaned_at IS NOT NULL), 0),
+               COALESCE(SUM(CASE WHEN orphaned_at IS NOT NULL THEN size END), 0),
+               MIN(orphaned_at)
+        FROM media_blobs
+    ''')
+    blobs, stored_bytes, orphaned, orphaned_bytes, oldest_orphan = cursor.fetchone()
+    by_reference = {}
+    logical_bytes = 0
+    for table, column in BLOB_REFERENCES:
+        cursor.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(b.size), 0)
+            FROM {table} r JOIN media_blobs b ON b.sha256 = r.{column}
+        ''')
+        references, size = cursor.fetchone()
+        by_reference[f'{table}.{column}'] = {'references': references, 'bytes': size}
+        logical_bytes += size
+    return {
+        'blobs': blobs,
+        'stored_bytes': stored_bytes,
+        'logical_bytes': logical_bytes,
+        'dedup_saved_bytes': max(0, logical_bytes - (stored_bytes - orphaned_bytes)),
+        'orphaned_blobs': orphaned,
+        'orphaned_bytes': orphaned_bytes,
+        'oldest_orphan_age_s': round(time.time() - oldest_orphan) if oldest_orphan else None,
+        'by_reference': by_reference,
+    }
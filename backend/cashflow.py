@@ -0,0 +1,110 @@
+"""Cash movement ledger with nakit_akisi as its monthly projection.
+
+Every change to cash flow is appended to cash_movements as one row: month,
+direction ('giris' or 'cikis'), signed amount, description and the record
+that caused it (source_type, source_id). Nothing in the ledger is updated or
+deleted; an undo or a deleted transaction appends compensating rows that
+point back at the movements they cancel. nakit_akisi holds the per-month
+totals, updated together with each append, and can be recomputed from the
+ledger at any time with rebuild_nakit_akisi().
+"""
+
+DIRECTIONS = ('giris', 'cikis')
+
+
+def movement(ay, yil, direction, amount, aciklama=None, source_type=None, source_id=None, reverses_id=None):
+    if direction not in DIRECTIONS:
+        raise ValueError(f'Geçersiz nakit yönü: {direction}')
+    return (int(ay), int(yil), direction, float(amount), aciklama, source_type, source_id, reverses_id)
+
+
+def accumulate_cash_flow(cursor, deltas):
+    """Add (ay, yil, giris, cikis, aciklama) deltas onto nakit_akisi.
+
+    One upsert per month: the row is updated in place, so its id and
+    created_at stay put and a month that does not exist yet is created.
+    """
+    cursor.executemany('''
+        INSERT INTO nakit_akisi (ay, yil, giris, cikis, aciklama)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(ay, yil) DO UPDATE SET
+            giris = COALESCE(giris, 0) + excluded.giris,
+            cikis = COALESCE(cikis, 0) + excluded.cikis,
+            aciklama = COALESCE(excluded.aciklama, aciklama),
+            updated_at = CURRENT_TIMESTAMP
+    ''', deltas)
+
+
+def record_cash_movements(cursor, movements):
+    """Append movements to the ledger and fold them into nakit_akisi"""
+    movements = [m for m in movements if m[3]]
+    if not movements:
+        return 0
+    cursor.executemany('''
+        INSERT INTO cash_movements (ay, yil, direction, amount, aciklama, source_type, source_id, reverses_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', movements)
+    months = {}
+    for ay, yil, direction, amount, aciklama, *_ in movements:
+        giris, cikis, last_aciklama = months.get((ay, yil), (0, 0, None))
+        if direction == 'giris':
+            giris += amount
+        else:
+            cikis += amount
+        months[(ay, yil)] = (giris, cikis, aciklama or last_aciklama)
+    accumulate_cash_flow(cursor, [(ay, yil, *totals) for (ay, yil), totals in months.items()])
+    return len(movements)
+
+
+def add_cash_movement(cursor, ay, yil, direction, amount, aciklama=None, source_type=None, source_id=None):
+    return record_cash_movements(cursor, [movement(ay, yil, direction, amount, aciklama, source_type, source_id)])
+
+
+def reverse_cash_movements(cursor, source_type, source_id, aciklama=None, latest_only=False):
+    """Append compensating entries for every live movement of one source.
+
+    Each reversal lands in the month of the movement it cancels. latest_only
+    reverses just the most recent one. Returns the number of movements
+    reversed; 0 means the source has no ledger history (e.g. it predates the
+    ledger) and the caller must compensate by hand.
+    """
+    cursor.execute(f'''
+        SELECT m.id, m.ay, m.yil, m.direction, m.amount, m.aciklama
+        FROM cash_movements m
+        WHERE m.source_type = ? AND m.source_id = ? AND m.reverses_id IS NULL
+          AND NOT EXISTS (SELECT 1 FROM cash_movements r WHERE r.reverses_id = m.id)
+        ORDER BY m.id {'DESC LIMIT 1' if latest_only else ''}
+    ''', (source_type, source_id))
+    originals = cursor.fetchall()
+    return record_cash_movements(cursor, [
+        movement(ay, yil, direction, -amount, aciklama or f'İptal: {original_aciklama or ""}'.strip(),
+                 source_type, source_id, reverses_id=movement_id)
+        for movement_id, ay, yil, direction, amount, original_aciklama in originals
+    ])
+
+
+def rebuild_nakit_akisi(cursor):
+    """Recompute every nakit_akisi total from the ledger in one pass"""
+    cursor.execute('''
+        INSERT INTO nakit_akisi (ay, yil, giris, cikis, aciklama, updated_at)
+        SELECT m.ay, m.yil,
+               SUM(CASE WHEN m.direction = 'giris' THEN m.amount ELSE 0 END),
+               SUM(CASE WHEN m.direction = 'cikis' THEN m.amount ELSE 0 END),
+               (SELECT l.aciklama FROM cash_movements l
+                WHERE l.ay = m.ay AND l.yil = m.yil ORDER BY l.id DESC LIMIT 1),
+               CURRENT_TIMESTAMP
+        FROM cash_movements m
+        WHERE 1
+        GROUP BY m.yil, m.ay
+        ON CONFLICT(ay, yil) DO UPDATE SET
+            giris = excluded.giris, cikis = excluded.cikis, aciklama = excluded.aciklama,
+            updated_at = excluded.updated_at
+        WHERE giris IS NOT excluded.giris OR cikis IS NOT excluded.cikis
+    ''')
+    updated = cursor.rowcount
+    cursor.execute('''
+        UPDATE nakit_akisi SET giris = 0, cikis = 0, updated_at = CURRENT_TIMESTAMP
+        WHERE (giris != 0 OR cikis != 0)
+          AND NOT EXISTS (SELECT 1 FROM cash_movements m WHERE m.ay = nakit_akisi.ay AND m.yil = nakit_akisi.yil)
+    ''')
+    return updated + cursor.rowcount
@@ -0,0 +1,69 @@
+"""Row-level change tracking on top of the change_log table.
+
+Triggers (see migrations.py) append one change_log row for every insert,
+update and delete on a tracked table. The change_log revision is a global
+AUTOINCREMENT counter, so the latest revision of a table only ever grows and
+doubles as a cheap version number for ETags and ?since= delta sync.
+"""
+
+
+def table_revisions(cursor, tables):
+    """Latest revision of each table.
+
+    A table whose entries were all pruned reports the prune watermark, so its
+    revision never moves backwards.
+    """
+    # One indexed MAX() lookup per table instead of a GROUP BY over the log
+    query = ' UNION ALL '.join(
+        'SELECT ?, COALESCE((SELECT MAX(revision) FROM change_log WHERE table_name = ?),'
+        ' (SELECT pruned_through FROM change_log_state WHERE id = 1), 0)'
+        for _ in tables
+    )
+    params = []
+    for table in tables:
+        params.extend([table, table])
+    cursor.execute(query, params)
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def pruned_through(cursor):
+    cursor.execute('SELECT pruned_through FROM change_log_state WHERE id = 1')
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def changes_since(cursor, table, since):
+    """Rows of table touched after revision `since`.
+
+    Returns (upsert_ids, deleted_ids), or None when the log no longer reaches
+    back to `since` and the caller must fall back to a full snapshot.
+    """
+    if since < pruned_through(cursor):
+        return None
+    # The bare op column is taken from the row holding MAX(revision),
+    # i.e. the latest operation on each row id.
+    cursor.execute('''
+        SELECT row_id, op, MAX(revision) AS revision
+        FROM change_log
+        WHERE table_name = ? AND revision > ?
+        GROUP BY row_id
+    ''', (table, since))
+    upserts, deletes = [], []
+    for row_id, op, _ in cursor.fetchall():
+        (deletes if op == 'delete' else upserts).append(row_id)
+    return upserts, deletes
+
+
+def prune_change_log(cursor, keep_days=7):
+    """Drop log entries older than keep_days and remember how far we pruned"""
+    cursor.execute(
+        "SELECT MAX(revision) FROM change_log WHERE changed_at < datetime('now', ?)",
+        (f'-{int(keep_days)} days',)
+    )
+    cutoff = cursor.fetchone()[0]
+    if not cutoff:
+        return 0
+    cursor.execute('DELETE FROM change_log WHERE revision <= ?', (cutoff,))
+    deleted = cursor.rowcount
+    cursor.execute('UPDATE change_log_state SET pruned_through = MAX(pruned_through, ?) WHERE id = 1', (cutoff,))
+    return deleted
@@ -0,0 +1,139 @@
+"""Telegram chat state (verification, pending photo) shared by all workers.
+
+SQLiteChatStateStore keeps one row per chat in the chat_states table, so a
+user's state survives restarts and is the same whichever gunicorn worker
+receives the next update. Reads go through a small in-process LRU cache;
+writes go straight to the table and refresh the cache with the merged row.
+A pending photo that waited longer than pending_ttl is forgotten, so a code
+typed the next day is not matched against yesterday's picture.
+"""
+import collections
+import threading
+import time
+
+DEFAULT_STATE = {'verified': False, 'pending_photo_file_id': None, 'awaiting_code': False}
+STATE_FIELDS = tuple(DEFAULT_STATE)
+
+
+class MemoryChatStateStore:
+    """Process-local store; state is lost on restart and not shared between workers"""
+
+    def __init__(self, pending_ttl=3600.0):
+        self.pending_ttl = pending_ttl
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, chat_id):
+        with self._lock:
+            state, pending_since = self._states.get(chat_id, (dict(DEFAULT_STATE), None))
+        return expire_pending(state, pending_since, self.pending_ttl)
+
+    def set(self, chat_id, **patch):
+        with self._lock:
+            state, pending_since = self._states.get(chat_id, (dict(DEFAULT_STATE), None))
+            state = {**state, **patch}
+            if patch.get('pending_photo_file_id'):
+                pending_since = time.time()
+            self._states[chat_id] = (state, pending_since)
+        return dict(state)
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._states)}
+
+
+class SQLiteChatStateStore:
+    def __init__(self, get_connection, cache_size=1024, cache_ttl=2.0, pending_ttl=3600.0):
+        self.get_connection = get_connection
+        self.cache_size = cache_size
+        # Another worker may have changed the row; a cached copy is trusted this long
+        self.cache_ttl = cache_ttl
+        self.pending_ttl = pending_ttl
+        self._cache = collections.OrderedDict()  # chat_id -> (state, pending_since, cached_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def _cache_put(self, chat_id, state, pending_since):
+        with self._lock:
+            self._cache[chat_id] = (state, pending_since, time.monotonic())
+            self._cache.move_to_end(chat_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, chat_id):
+        with self._lock:
+            entry = self._cache.get(chat_id)
+            if entry and time.monotonic() - entry[2] < self.cache_ttl:
+                self._cache.move_to_end(chat_id)
+                self._stats['hits'] += 1
+                return expire_pending(entry[0], entry[1], self.pending_ttl)
+            self._stats['misses'] += 1
+
+        conn = self.get_connection()
+        try:
+            row = conn.execute('''
+                SELECT verified, pending_photo_file_id, awaiting_code, pending_since
+                FROM chat_states WHERE chat_id = ?
+            ''', (chat_id,)).fetchone()
+        finally:
+            conn.close()
+        state, pending_since = row_to_state(row)
+        self._cache_put(chat_id, state, pending_since)
+        return expire_pending(state, pending_since, self.pending_ttl)
+
+    def set(self, chat_id, **patch):
+        unknown = set(patch) - set(STATE_FIELDS)
+        if unknown:
+            raise ValueError(f'Unknown chat state fields: {sorted(unknown)}')
+        columns = dict(patch)
+        if 'pending_photo_file_id' in patch:
+            columns['pending_since'] = time.time() if patch['pending_photo_file_id'] else None
+        names = list(columns)
+        # Only the patched columns are written, so concurrent updates to other
+        # fields from another worker are never overwritten with stale values
+        updates = ', '.join(f'{name} = excluded.{name}' for name in names) + ', updated_at = excluded.updated_at'
+        conn = self.get_connection()
+        try:
+            row = conn.execute(f'''
+                INSERT INTO chat_states (chat_id, {', '.join(names)}, updated_at)
+                VALUES (?, {', '.join('?' * len(names))}, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET {updates}
+                RETURNING verified, pending_photo_file_id, awaiting_code, pending_since
+            ''', (chat_id, *[columns[name] for name in names], time.time())).fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        state, pending_since = row_to_state(row)
+        self._cache_put(chat_id, state, pending_since)
+        return dict(state)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'cached': len(self._cache), 'cache_size': self.cache_size}
+
+
+def row_to_state(row):
+    if row is None:
+        return dict(DEFAULT_STATE), None
+    return {
+        'verified': bool(row[0]),
+        'pending_photo_file_id': row[1],
+        'awaiting_code': bool(row[2]),
+    }, row[3]
+
+
+def expire_pending(state, pending_since, pending_ttl):
+    """Copy of state with a pending photo older than pending_ttl dropped"""
+    state = dict(state)
+    if state['pending_photo_file_id'] and pending_since and time.time() - pending_since > pending_ttl:
+        state.update(pending_photo_file_id=None, awaiting_code=False)
+    return state
+
+
+def expire_pending_photos(cursor, pending_ttl=3600.0):
+    """Clear pending photos that waited longer than pending_ttl"""
+    cursor.execute('''
+        UPDATE chat_states SET pending_photo_file_id = NULL, awaiting_code = 0, pending_since = NULL
+        WHERE pending_since < ?
+    ''', (time.time() - pending_ttl,))
+    return cursor.rowcount
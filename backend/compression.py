@@ -0,0 +1,128 @@
+"""Accept-Encoding negotiated compression of API responses.
+
+ResponseCompressor.compress is run from an after_request hook. It picks
+brotli (when the brotli package is installed) or gzip from the client's
+Accept-Encoding, leaves small bodies, binary content types and file
+responses alone, and compresses streamed responses chunk by chunk, flushing
+after each chunk so the first rows still leave early. Bytes in, bytes out and
+CPU time are counted per endpoint, so the levels can be tuned against real
+traffic.
+"""
+import os
+import threading
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/javascript', 'text/html', 'text/css', 'text/plain',
+    'text/javascript', 'image/svg+xml',
+)
+
+
+class ResponseCompressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_level=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_level = brotli_level
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_level)
+            return compressor.process, compressor.flush, compressor.finish
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    def compress(self, response, accept_encodings, route):
+        """Compress response in place when worthwhile and accepted; returns it"""
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding, route)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                self._record(route, skipped=True)
+                return response
+            started = time.thread_time()
+            process, _, finish = self._compressor(encoding)
+            compressed = process(body) + finish()
+            self._record(route, len(body), len(compressed), time.thread_time() - started)
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes are a different representation of the same revision
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_stream(self, chunks, encoding, route):
+        process, flush, finish = self._compressor(encoding)
+        size_in = size_out = 0
+        cpu = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                started = time.thread_time()
+                out = process(chunk) + flush()
+                cpu += time.thread_time() - started
+                size_in += len(chunk)
+                size_out += len(out)
+                yield out
+            started = time.thread_time()
+            out = finish()
+            cpu += time.thread_time() - started
+            size_out += len(out)
+            yield out
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            self._record(route, size_in, size_out, cpu)
+
+    def _record(self, route, size_in=0, size_out=0, cpu=0.0, skipped=False):
+        with self._lock:
+            stats = self._routes.setdefault(route or '?', {
+                'compressed': 0, 'skipped_small': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0,
+            })
+            if skipped:
+                stats['skipped_small'] += 1
+                return
+            stats['compressed'] += 1
+            stats['bytes_in'] += size_in
+            stats['bytes_out'] += size_out
+            stats['cpu_ms'] += cpu * 1000
+
+    def stats(self):
+        with self._lock:
+            routes = {}
+            for route, stats in self._routes.items():
+                routes[route] = {
+                    **stats,
+                    'cpu_ms': round(stats['cpu_ms'], 3),
+                    'ratio': round(stats['bytes_in'] / stats['bytes_out'], 2) if stats['bytes_out'] else None,
+                }
+        return {
+            'pid': os.getpid(),
+            'encodings': list(self.encodings),
+            'min_size': self.min_size,
+            'gzip_level': self.gzip_level,
+            'brotli_level': self.brotli_level,
+            'routes': routes,
+        }
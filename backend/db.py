@@ -0,0 +1,211 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# PRAGMAs applied once per physical connection when it is opened.
+# journal_mode=WAL is persistent in the database file; the others are per-connection.
+PRAGMA_PROFILE = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -20000),        # ~20 MB page cache per connection
+    ('mmap_size', 268435456),      # 256 MB memory-mapped I/O
+    ('busy_timeout', 5000),        # wait up to 5s for a competing writer
+    ('temp_store', 'MEMORY'),
+)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection became available in time"""
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    Route code keeps calling conn.close() exactly as before; the underlying
+    connection stays open with its page cache warm for the next request.
+    Cursors, including the ones conn.execute creates, are made with the
+    pool's cursor_factory, which is where statements get instrumented.
+    """
+
+    _pool = None
+    _checked_out = False
+    _checkout = 0  # bumped on every checkout, so a stale holder can be told apart
+    _cursor_factory = sqlite3.Cursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self._cursor_factory)
+
+    # sqlite3.Connection's shortcuts do not go through cursor(), so route them there
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        if self._pool is None:
+            return super().close()
+        self._pool.release(self)
+
+    def release_checkout(self, checkout):
+        """Return the connection only if it is still on the given checkout.
+
+        Safe to call after close(): by then the connection may belong to
+        another request, and releasing it by identity would hand it out twice.
+        """
+        if self._pool is not None:
+            self._pool.release(self, checkout)
+
+    def close_physical(self):
+        super().close()
+
+
+class ConnectionPool:
+    """A bounded, per-process pool of long-lived SQLite connections"""
+
+    def __init__(self, database, max_size=8, timeout=10.0, pragmas=PRAGMA_PROFILE, cursor_factory=None):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.cursor_factory = cursor_factory or sqlite3.Cursor
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # LIFO so the most recently used (warmest) connection is handed out first
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    def _check_fork(self):
+        # Connections must not be shared across a fork (e.g. gunicorn workers);
+        # each worker process starts with its own empty pool.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn._cursor_factory = self.cursor_factory
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn._pool = self
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def acquire(self):
+        """Check out a connection, opening a new one while below max_size"""
+        self._check_fork()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            create = False
+            with self._lock:
+                if self._open < self.max_size:
+                    self._open += 1
+                    create = True
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                with self._lock:
+                    self._stats['waits'] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeout('Veritabanı bağlantı havuzu dolu')
+                finally:
+                    with self._lock:
+                        self._stats['wait_time_ms'] += (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            conn._checked_out = True
+            conn._checkout += 1
+            self._stats['checkouts'] += 1
+            self._in_use += 1
+        return conn
+
+    def release(self, conn, checkout=None):
+        """Return a connection to the pool, discarding any uncommitted work.
+
+        With checkout (the connection's _checkout when it was acquired), the
+        call is ignored unless that checkout is still the current one.
+        """
+        with self._lock:
+            if not conn._checked_out or (checkout is not None and conn._checkout != checkout):
+                return
+            conn._checked_out = False
+            self._in_use -= 1
+
+        if conn._pool is not self or self._pid != os.getpid():
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+            self._stats['discarded'] += 1
+        try:
+            conn.close_physical()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones are closed on release)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+            stats.update({
+                'pid': self._pid,
+                'max_size': self.max_size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+            })
+        return stats
@@ -0,0 +1,85 @@
+"""Rolling-window employee sales from daily buckets.
+
+calisan_gunluk_satis holds one row per employee per day with that day's sales
+total and count. Sales and transaction deletes add to or subtract from the
+bucket of the sale's day. The son_ay / son_3_ay / son_6_ay / son_12_ay columns
+of calisanlar are sums over at most 365 of those rows: recomputed for an
+employee whenever their buckets change, and for everyone once a day as the
+windows move on. Buckets older than the longest window are pruned.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+WINDOWS = (('son_ay', 30), ('son_3_ay', 90), ('son_6_ay', 180), ('son_12_ay', 365))
+KEEP_DAYS = max(days for _, days in WINDOWS)
+
+
+def utc_today():
+    # islemler.created_at is CURRENT_TIMESTAMP, i.e. UTC; buckets use the same calendar
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def window_start(today, days):
+    """First day inside a window of `days` days ending today"""
+    return (date.fromisoformat(today) - timedelta(days=days - 1)).isoformat()
+
+
+def refresh_sales_windows(cursor, calisan_ids=None, today=None):
+    """Recompute the window columns of some employees (all that are stale with None)"""
+    today = today or utc_today()
+    sums = ', '.join(f'''
+        {column} = COALESCE((SELECT SUM(b.tutar) FROM calisan_gunluk_satis b
+                             WHERE b.calisan_id = calisanlar.id AND b.gun >= '{window_start(today, days)}'), 0)'''
+        for column, days in WINDOWS)
+    if calisan_ids is None:
+        where, params = 'performans_tarihi IS NOT ?', [today]
+    else:
+        calisan_ids = list(calisan_ids)
+        if not calisan_ids:
+            return 0
+        where, params = f"id IN ({', '.join('?' * len(calisan_ids))})", calisan_ids
+    cursor.execute(f'''
+        UPDATE calisanlar SET {sums}, performans_tarihi = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE {where}
+    ''', [today, *params])
+    return cursor.rowcount
+
+
+def record_sales(cursor, sales, today=None):
+    """Add (calisan_id, gun, tutar, adet) deltas to the daily buckets; negative for deletes"""
+    today = today or utc_today()
+    oldest = window_start(today, KEEP_DAYS)
+    rows = [(calisan_id, gun[:10], tutar, adet) for calisan_id, gun, tutar, adet in sales if gun[:10] >= oldest]
+    if not rows:
+        return
+    cursor.executemany('''
+        INSERT INTO calisan_gunluk_satis (calisan_id, gun, tutar, adet) VALUES (?, ?, ?, ?)
+        ON CONFLICT(calisan_id, gun) DO UPDATE SET tutar = tutar + excluded.tutar, adet = adet + excluded.adet
+    ''', rows)
+    cursor.executemany('DELETE FROM calisan_gunluk_satis WHERE calisan_id = ? AND gun = ? AND adet <= 0',
+                       [(calisan_id, gun) for calisan_id, gun, _, _ in rows])
+    refresh_sales_windows(cursor, {calisan_id for calisan_id, _, _, _ in rows}, today)
+
+
+def prune_sales_buckets(cursor, today=None):
+    """Drop buckets that no window reaches any more"""
+    cursor.execute('DELETE FROM calisan_gunluk_satis WHERE gun < ?', (window_start(today or utc_today(), KEEP_DAYS),))
+    return cursor.rowcount
+
+
+def rebuild_sales_buckets(cursor, today=None):
+    """Recompute the buckets of the last year from islemler and refresh every employee.
+
+    Sales are matched to employees by name with LOWER(), as the sale routes look them up.
+    """
+    today = today or utc_today()
+    cursor.execute('DELETE FROM calisan_gunluk_satis')
+    cursor.execute('''
+        INSERT INTO calisan_gunluk_satis (calisan_id, gun, tutar, adet)
+        SELECT c.id, date(i.created_at), SUM(i.toplam_tutar), COUNT(*)
+        FROM islemler i
+        JOIN calisanlar c ON LOWER(c.ad) = LOWER(i.satici)
+        WHERE i.islem_tipi = 'satis' AND i.created_at >= ?
+        GROUP BY c.id, date(i.created_at)
+    ''', (window_start(today, KEEP_DAYS),))
+    cursor.execute('UPDATE calisanlar SET performans_tarihi = NULL')
+    return refresh_sales_windows(cursor, today=today)
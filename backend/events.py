@@ -0,0 +1,212 @@
+"""Server-Sent Events fan-out for change notifications.
+
+One poller thread per worker process tails the change_log table (filled by
+triggers on every write, see migrations.py) and appends new rows to a bounded
+ring buffer. Subscribers block on a shared Condition, so an idle client costs
+one sleeping thread and no database work; the database is read once per
+poll interval no matter how many clients are connected. Because change_log
+lives in SQLite, writes made by any gunicorn worker reach every subscriber.
+
+Served by gunicorn's gevent worker (see the README), the threading primitives
+are monkey-patched: an open stream is a greenlet parked on the Condition, not
+a WSGI thread, and a worker holds up to COOPERATIVE_MAX_SUBSCRIBERS of them.
+Under a threaded server (gthread, or `python app.py` in development) each
+stream does pin a thread for as long as it is connected, so the cap drops to
+THREADED_MAX_SUBSCRIBERS. Past the cap a client gets a `reset` event (refetch
+now) and is told to reconnect after overflow_retry seconds; it then polls at
+that pace. The browser opens one shared stream per tab (src/config/events.js).
+
+While nobody is subscribed the poller stays idle; the first subscriber moves
+the hub's cursor to the current revision, so it does not receive the changes
+of the idle period as new events.
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+try:
+    from gevent import monkey
+except ImportError:
+    monkey = None
+
+THREADED_MAX_SUBSCRIBERS = 32
+COOPERATIVE_MAX_SUBSCRIBERS = 500  # keep below gunicorn's --worker-connections
+
+
+def cooperative():
+    """True in a gevent worker, where blocking calls yield to other greenlets"""
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+class EventHub:
+    def __init__(self, get_connection, buffer_size=1000, poll_interval=0.5, heartbeat_interval=15.0,
+                 max_subscribers=None, overflow_retry=15.0):
+        self.get_connection = get_connection
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.max_subscribers = max_subscribers
+        self.overflow_retry = overflow_retry
+        self._rejected = 0
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._ring = collections.deque(maxlen=buffer_size)
+        self._last_revision = None
+        self._floor = None  # every event after this revision is in the ring
+        self._subscribers = 0
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Started lazily so each gunicorn worker runs its own poller after fork
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._condition:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._ring.clear()
+            self._last_revision = self._floor = self._current_revision()
+            self._thread = threading.Thread(target=self._run, name='event-hub-poller', daemon=True)
+            self._thread.start()
+
+    def _current_revision(self):
+        conn = self.get_connection()
+        try:
+            row = conn.execute('SELECT COALESCE(MAX(revision), 0) FROM change_log').fetchone()
+            return row[0]
+        finally:
+            conn.close()
+
+    def subscriber_limit(self):
+        """max_subscribers, or by default what the worker type can hold"""
+        if self.max_subscribers is not None:
+            return self.max_subscribers
+        return COOPERATIVE_MAX_SUBSCRIBERS if cooperative() else THREADED_MAX_SUBSCRIBERS
+
+    def notify_write(self):
+        """Hint from a local write route: poll now instead of waiting"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if not self._subscribers:
+                continue
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"[EVENTS] poll error: {e}")
+                time.sleep(self.poll_interval)
+
+    def _poll(self):
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT revision, table_name, row_id, op FROM change_log
+                WHERE revision > ? ORDER BY revision LIMIT ?
+            ''', (self._last_revision, self.buffer_size)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        with self._condition:
+            # The cursor may have moved on (see _catch_up) while this poll read
+            rows = [row for row in rows if row[0] > self._last_revision]
+            for revision, table, row_id, op in rows:
+                if len(self._ring) == self._ring.maxlen:
+                    self._floor = self._ring[0][0]
+                self._ring.append((revision, {'table': table, 'id': row_id, 'op': op}))
+            if rows:
+                self._last_revision = rows[-1][0]
+                self._condition.notify_all()
+
+    def _catch_up(self):
+        """Skip the changes made while nobody was subscribed (the poller was idle)"""
+        revision = self._current_revision()
+        with self._condition:
+            if revision > self._last_revision:
+                self._ring.clear()
+                self._last_revision = self._floor = revision
+
+    def _events_after(self, revision, tables):
+        """Buffered events after `revision`; None when the ring no longer reaches back that far"""
+        if revision < self._floor:
+            return None
+        return [(rev, event) for rev, event in self._ring
+                if rev > revision and (not tables or event['table'] in tables)]
+
+    def stream(self, last_event_id=None, tables=None):
+        """Generator of SSE frames for one subscriber"""
+        self._ensure_started()
+        tables = set(tables or ())
+        with self._condition:
+            full = self._subscribers >= self.subscriber_limit()
+            if full:
+                self._rejected += 1
+            else:
+                self._subscribers += 1
+                first = self._subscribers == 1
+        if full:
+            # No slot to spare: have the client refetch and come back later
+            yield f'retry: {int(self.overflow_retry * 1000)}\nevent: reset\ndata: {{}}\n\n'
+            return
+        try:
+            if first:
+                self._catch_up()
+        except Exception:
+            with self._condition:
+                self._subscribers -= 1
+            raise
+        with self._condition:
+            cursor = self._last_revision
+        if last_event_id is not None and last_event_id > cursor:
+            # Client was served by a worker whose poller ran ahead of ours
+            cursor = last_event_id
+        try:
+            yield 'retry: 3000\n\n'
+            if last_event_id is not None and last_event_id < cursor:
+                with self._condition:
+                    missed = self._events_after(last_event_id, tables)
+                if missed is None:
+                    # Too far behind to replay: tell the client to refetch everything
+                    yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+                else:
+                    for rev, event in missed:
+                        if rev <= cursor:
+                            yield f'id: {rev}\nevent: change\ndata: {json.dumps(event)}\n\n'
+
+            while True:
+                timed_out = False
+                with self._condition:
+                    if self._last_revision <= cursor:
+                        timed_out = not self._condition.wait(self.heartbeat_interval)
+                    events = self._events_after(cursor, tables)
+                    latest = self._last_revision
+                if events is None:
+                    # Fell behind the ring buffer while blocked on a slow client
+                    yield f'id: {latest}\nevent: reset\ndata: {{}}\n\n'
+                elif events:
+                    for rev, event in events:
+                        yield f'id: {rev}\nevent: change\ndata: {json.dumps(event)}\n\n'
+                elif timed_out:
+                    yield ': heartbeat\n\n'
+                cursor = latest
+        finally:
+            with self._condition:
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'subscribers': self._subscribers,
+                'max_subscribers': self.subscriber_limit(),
+                'cooperative': cooperative(),
+                'rejected': self._rejected,
+                'buffered_events': len(self._ring),
+                'last_revision': self._last_revision,
+                'poller_running': bool(self._thread and self._thread.is_alive()),
+            }
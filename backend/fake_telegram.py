@@ -0,0 +1,125 @@
+"""Run the Telegram bot flow end to end against a local fake Bot API.
+
+Starts a tiny HTTP server that answers sendMessage, getFile and file
+downloads, points the app at it through TELEGRAM_API_BASE, posts webhook
+updates (password, photo, sale code, plus a redelivered update) into a
+throwaway copy of the database, and prints what the fake server received
+once the background jobs have drained. Set FAKE_TELEGRAM_FAIL=N to make the
+first N getFile calls return 502 and watch the retry/backoff path.
+
+    python fake_telegram.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN = 'TEST:TOKEN'
+PASSWORD = 'parola'
+IMAGE = b'\xff\xd8\xff\xe0fake-jpeg\xff\xd9'
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    calls = []
+    failures_left = int(os.environ.get('FAKE_TELEGRAM_FAIL', 0))
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json'):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        length = int(self.headers.get('Content-Length', 0))
+        params = json.loads(self.rfile.read(length) or b'{}')
+        FakeTelegram.calls.append((method, params))
+        if method == 'getFile':
+            if FakeTelegram.failures_left > 0:
+                FakeTelegram.failures_left -= 1
+                return self._reply(502, {'ok': False, 'description': 'Bad Gateway'})
+            return self._reply(200, {'ok': True, 'result': {'file_id': params['file_id'], 'file_path': 'photos/file_1.jpg'}})
+        if method == 'sendMessage':
+            return self._reply(200, {'ok': True, 'result': {'message_id': len(FakeTelegram.calls)}})
+        self._reply(404, {'ok': False, 'description': 'Not Found'})
+
+    def do_GET(self):
+        FakeTelegram.calls.append(('download', self.path))
+        self._reply(200, IMAGE, content_type='image/jpeg')
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'BOT_ACCESS_PASSWORD': PASSWORD,
+        'TELEGRAM_SECRET_TOKEN': '',
+        'TELEGRAM_API_BASE': f'http://127.0.0.1:{server.server_port}',
+    })
+    import app as tukkan
+    from blob_store import BlobStore
+    from db import ConnectionPool
+
+    workdir = tempfile.mkdtemp(prefix='tukkan-telegram-')
+    db_path = os.path.join(workdir, 'tukkan.db')
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tukkan.db'), db_path)
+    tukkan.DATABASE_PATH = db_path
+    tukkan.MEDIA_ROOT = os.path.join(workdir, 'media')
+    tukkan.blob_store = BlobStore(os.path.join(tukkan.MEDIA_ROOT, 'blobs'))
+    tukkan.db_pool = ConnectionPool(db_path)
+    tukkan.init_db(tukkan.MEDIA_ROOT, tukkan.blob_store)
+    tukkan.telegram_jobs.backoff_base = 0.2
+
+    conn = tukkan.db_pool.acquire()
+    sale = conn.execute("SELECT id, islem_kodu FROM islemler WHERE islem_tipi = 'satis' ORDER BY id DESC LIMIT 1").fetchone()
+    conn.close()
+    if not sale:
+        sys.exit('No sale in tukkan.db to attach a photo to')
+
+    chat = {'id': 4242, 'type': 'private'}
+    updates = [
+        {'update_id': 1, 'message': {'chat': chat, 'text': PASSWORD}},
+        {'update_id': 2, 'message': {'chat': chat, 'photo': [{'file_id': 'small', 'file_size': 10},
+                                                             {'file_id': 'large', 'file_size': 99}]}},
+        {'update_id': 3, 'message': {'chat': chat, 'text': sale['islem_kodu']}},
+        {'update_id': 3, 'message': {'chat': chat, 'text': sale['islem_kodu']}},  # redelivery
+    ]
+    client = tukkan.app.test_client()
+    try:
+        for update in updates:
+            started = time.perf_counter()
+            response = client.post('/webhook/telegram', json=update)
+            print(f"update {update['update_id']}: {response.status_code} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            jobs = tukkan.telegram_jobs.stats()['jobs']
+            if not jobs.get('pending') and not jobs.get('running'):
+                break
+            time.sleep(0.1)
+
+        print('\nFake Telegram received:')
+        for method, params in FakeTelegram.calls:
+            print(f'  {method}: {params}')
+        print(f"\nJobs: {tukkan.telegram_jobs.stats()}")
+        media_dir = os.path.join(tukkan.MEDIA_ROOT, 'sales', str(sale['id']))
+        print(f"Saved photos for sale {sale['id']}: {sorted(os.listdir(media_dir)) if os.path.isdir(media_dir) else []}")
+    finally:
+        server.shutdown()
+        tukkan.db_pool.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Payment allocation over a plan's installments (taksit_detaylari).
+
+A payment settles unpaid installments in taksit_no order: each one it covers
+is marked paid and whatever is left reduces the next one. The split is
+computed in Python from one ordered read of the unpaid installments and
+written back with one statement per kind of update, so a prepayment covering
+36 installments costs the same handful of statements as paying one.
+"""
+
+EPSILON = 1e-6
+
+INSTALLMENT_FIELDS = 'id, taksit_no, miktar, vade_ay, vade_yil, odendi'
+
+
+def unpaid_installments(cursor, odeme_plani_id):
+    """Unpaid installments of a plan, oldest first"""
+    cursor.execute(f'''
+        SELECT {INSTALLMENT_FIELDS} FROM taksit_detaylari
+        WHERE odeme_plani_id = ? AND odendi = 0
+        ORDER BY taksit_no ASC
+    ''', (odeme_plani_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def allocate_payment(installments, amount):
+    """Split amount over installments in order.
+
+    Returns (installment, pay_now, fully_paid) for every installment the
+    payment reaches; only the last one can be partially paid.
+    """
+    allocations = []
+    remaining = amount
+    for installment in installments:
+        if remaining <= 1e-9:
+            break
+        miktar = float(installment['miktar'])
+        pay_now = min(miktar, remaining)
+        allocations.append((installment, pay_now, pay_now + EPSILON >= miktar))
+        remaining -= pay_now
+    return allocations
+
+
+def apply_allocations(cursor, allocations):
+    """Write allocations back: paid installments in one statement, a partial one in another"""
+    paid = [installment['id'] for installment, _, fully_paid in allocations if fully_paid]
+    partial = [(max(0.0, float(installment['miktar']) - pay_now), installment['id'])
+               for installment, pay_now, fully_paid in allocations if not fully_paid]
+    if paid:
+        cursor.execute(f'''
+            UPDATE taksit_detaylari
+            SET odendi = 1, odeme_tarihi = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id IN ({', '.join('?' * len(paid))})
+        ''', paid)
+    if partial:
+        cursor.executemany('''
+            UPDATE taksit_detaylari SET miktar = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', partial)
+    return len(paid)
+
+
+def release_installments(cursor, installment_ids):
+    """Mark paid installments unpaid again (undo)"""
+    installment_ids = list(installment_ids)
+    if not installment_ids:
+        return 0
+    cursor.execute(f'''
+        UPDATE taksit_detaylari
+        SET odendi = 0, odeme_tarihi = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE odendi = 1 AND id IN ({', '.join('?' * len(installment_ids))})
+    ''', installment_ids)
+    return cursor.rowcount
@@ -0,0 +1,61 @@
+"""Streaming JSON arrays straight from a cursor.
+
+jsonify needs the full list of dicts and then the full JSON string in memory,
+so the peak memory of a list endpoint grows with the table. stream_rows reads
+the cursor in fetchmany chunks and yields the encoded array piece by piece:
+only one chunk of rows is alive at a time and the first bytes leave before
+the last row is read. Rows are encoded with orjson when it is installed and
+with the standard library otherwise; either way keys are sorted, matching
+jsonify's output. stream_items does the same for rows that are reshaped in
+Python on their way out, one at a time.
+"""
+import itertools
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 500
+
+if orjson is not None:
+    ENCODER = 'orjson'
+
+    def encode_row(row):
+        return orjson.dumps(dict(row), option=orjson.OPT_SORT_KEYS)
+else:
+    ENCODER = 'json'
+    _encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+    def encode_row(row):
+        return _encoder.encode(dict(row)).encode('utf-8')
+
+
+def iter_rows(cursor, chunk_size=CHUNK_SIZE):
+    """An executed cursor's rows, read chunk_size at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def stream_items(items, chunk_size=CHUNK_SIZE):
+    """Yield rows or dicts, from any iterable, as the chunks of one JSON array"""
+    items = iter(items)
+    yield b'['
+    first = True
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            break
+        parts = b','.join(encode_row(item) for item in chunk)
+        yield parts if first else b',' + parts
+        first = False
+    yield b']'
+
+
+def stream_rows(cursor, chunk_size=CHUNK_SIZE):
+    """Yield an executed cursor's rows as the chunks of one JSON array"""
+    return stream_items(iter_rows(cursor, chunk_size), chunk_size)
@@ -0,0 +1,256 @@
+"""Per-route request metrics, exported in the Prometheus text format.
+
+A request is timed from before_request until its response is closed, so a
+streamed body counts in full, and is recorded with its endpoint, method,
+status code and the bytes sent after compression. SQL is measured by
+InstrumentedCursor, the cursor class of the pooled connections that
+get_db_connection hands out: every execute and fetch adds its statement count
+and time to the request running on the current thread. Background threads
+(telegram jobs, the event hub) have no request and are not counted.
+
+Each worker process adds its samples to an in-memory dict and, every
+flush_interval seconds and before a scrape, adds them to the metric_samples
+table with one UPSERT per series. The table is the shared store: whichever
+gunicorn worker answers /api/metrics/prom reports the totals of all of them,
+at most flush_interval seconds behind. Counters live as long as the database
+and never reset on restart.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FAMILIES = {
+    'tukkan_http_requests_total': (
+        'counter', 'Requests served, by endpoint, method and status code'),
+    'tukkan_http_request_duration_seconds': (
+        'histogram', 'Time from the start of a request until its response was closed'),
+    'tukkan_http_response_bytes_total': (
+        'counter', 'Response body bytes sent, after compression'),
+    'tukkan_sql_statements_total': (
+        'counter', 'SQL statements executed while serving requests'),
+    'tukkan_sql_duration_seconds_total': (
+        'counter', 'Time spent in SQLite execute and fetch calls while serving requests'),
+}
+
+_local = threading.local()
+
+
+class RequestStats:
+    __slots__ = ('route', 'started', 'statements', 'sql_seconds', 'response_bytes')
+
+    def __init__(self, route=None):
+        self.route = route
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.response_bytes = 0
+
+
+def begin_request(route=None):
+    _local.stats = RequestStats(route)
+    return _local.stats
+
+
+def current_request():
+    return getattr(_local, 'stats', None)
+
+
+def _add_sql(started, statements=0):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.statements += statements
+        stats.sql_seconds += time.perf_counter() - started
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that charges its statements and their time to the current request.
+
+    Fetches are timed too: SQLite does most of a SELECT's work while rows
+    are stepped through, not in execute.
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _add_sql(started, 1)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _add_sql(started, 1)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _add_sql(started, 1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _add_sql(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _add_sql(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _add_sql(started)
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _count_chunks(chunks, stats):
+    try:
+        for chunk in chunks:
+            stats.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class MetricsStore:
+    def __init__(self, connect, flush_interval=10.0):
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}  # (family, name, labels) -> value to add
+        self._last_flush = time.monotonic()
+        self._stats = {'requests': 0, 'flushes': 0, 'flush_errors': 0, 'samples_written': 0}
+
+    def track(self, response, route, method):
+        """Count the bytes of response and record the request once it is closed"""
+        stats = current_request()
+        if stats is None:
+            return response
+        if response.content_length is not None:
+            stats.response_bytes = response.content_length
+        elif response.is_streamed:
+            response.response = _count_chunks(response.response, stats)
+        else:
+            stats.response_bytes = response.calculate_content_length() or 0
+        status = response.status_code
+        response.call_on_close(lambda: self._finish(stats, route, method, status))
+        return response
+
+    def _finish(self, stats, route, method, status):
+        if getattr(_local, 'stats', None) is stats:
+            del _local.stats
+        self.observe(route, method, status, time.perf_counter() - stats.started,
+                     stats.response_bytes, stats.statements, stats.sql_seconds)
+
+    def observe(self, route, method, status, duration, size, statements, sql_seconds):
+        labels = f'route="{_label_value(route or "unmatched")}",method="{_label_value(method)}"'
+        histogram = 'tukkan_http_request_duration_seconds'
+        with self._lock:
+            self._stats['requests'] += 1
+            self._add('tukkan_http_requests_total', 'tukkan_http_requests_total',
+                      f'{labels},status="{status}"', 1)
+            for bound in LATENCY_BUCKETS:
+                if duration <= bound:
+                    self._add(histogram, histogram + '_bucket', f'{labels},le="{bound}"', 1)
+            self._add(histogram, histogram + '_bucket', f'{labels},le="+Inf"', 1)
+            self._add(histogram, histogram + '_sum', labels, duration)
+            self._add(histogram, histogram + '_count', labels, 1)
+            self._add('tukkan_http_response_bytes_total', 'tukkan_http_response_bytes_total', labels, size)
+            self._add('tukkan_sql_statements_total', 'tukkan_sql_statements_total', labels, statements)
+            self._add('tukkan_sql_duration_seconds_total', 'tukkan_sql_duration_seconds_total',
+                      labels, sql_seconds)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def _add(self, family, name, labels, value):
+        key = (family, name, labels)
+        self._pending[key] = self._pending.get(key, 0) + value
+
+    def flush(self):
+        """Add this worker's pending samples to metric_samples; returns how many were written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        conn = self.connect()
+        try:
+            conn.executemany('''
+                INSERT INTO metric_samples (family, name, labels, value) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value
+            ''', [(family, name, labels, value) for (family, name, labels), value in pending.items()])
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            # Keep the samples for the next flush rather than dropping them
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+                self._stats['flush_errors'] += 1
+            return 0
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['samples_written'] += len(pending)
+        return len(pending)
+
+    def render(self):
+        """Every worker's flushed samples in the Prometheus text exposition format"""
+        self.flush()
+        conn = self.connect()
+        try:
+            rows = conn.execute('SELECT family, name, labels, value FROM metric_samples').fetchall()
+        finally:
+            conn.close()
+
+        def order(row):
+            family, name, labels, _ = row
+            base, _, bound = labels.partition(',le="')
+            return family, base, name, float(bound.rstrip('"').replace('+Inf', 'inf')) if bound else 0.0
+
+        lines = []
+        current = None
+        for family, name, labels, value in sorted(rows, key=order):
+            if family != current:
+                kind, help_text = FAMILIES.get(family, ('untyped', ''))
+                lines.append(f'# HELP {family} {help_text}')
+                lines.append(f'# TYPE {family} {kind}')
+                current = family
+            lines.append(f'{name}{{{labels}}} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'pid': os.getpid(),
+                'pending_samples': len(self._pending),
+                'flush_interval': self.flush_interval,
+            }
@@ -0,0 +1,722 @@
+"""Versioned schema migrations for the Tukkan SQLite database.
+
+Each migration is registered with a version number and runs exactly once,
+inside its own transaction, recording itself in the schema_version table.
+Starting the app against an up-to-date database only reads schema_version.
+
+A migration must keep doing what it did when it was written, so it never
+calls into the live business modules (changes.py, rollups.py, ...): the SQL
+it needs is copied here, frozen at that version.
+"""
+import re
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function taking a cursor"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def add_column(cursor, table, column, declaration):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column is already there"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+def change_triggers(cursor, table):
+    """change_log triggers for a table, as changes.py wrote them at version 5"""
+    for op, ref in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_{op}
+            AFTER {op.upper()} ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op}');
+            END
+        ''')
+
+
+def current_version(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if not cursor.fetchone():
+        return 0
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return cursor.fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations; returns the list of versions applied"""
+    if current_version(conn) >= latest_version():
+        return []
+
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # manage transactions explicitly
+    cursor = conn.cursor()
+    applied = []
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        for version, description, func in MIGRATIONS:
+            # BEGIN IMMEDIATE takes the write lock, so concurrently starting
+            # workers serialize here and the loser sees the version as applied.
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+                if cursor.fetchone():
+                    cursor.execute('COMMIT')
+                    continue
+                func(cursor)
+                cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                               (version, description))
+                cursor.execute('COMMIT')
+                applied.append(version)
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+        if applied:
+            # Refresh planner statistics for the new indexes
+            cursor.execute('ANALYZE')
+            cursor.execute('PRAGMA optimize')
+    finally:
+        conn.isolation_level = previous_isolation
+    return applied
+
+
+@migration(1, 'baseline schema')
+def _baseline_schema(cursor):
+    # Açık Borçlar table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS acik_borclar (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            borc_sahibi TEXT NOT NULL,
+            islem_kodu TEXT NOT NULL,
+            acik_borc REAL NOT NULL,
+            nagd_odeme REAL DEFAULT 0,
+            original_borc REAL NOT NULL,
+            payment_made BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('yönetici', 'çalışan')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Beklenen Ödemeler table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS beklenen_odemeler (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            musteri TEXT NOT NULL,
+            islem_kodu TEXT NOT NULL,
+            acik_odeme REAL NOT NULL,
+            odeme_tipi TEXT NOT NULL CHECK(odeme_tipi IN ('nakit', 'kart')),
+            taksit_sayisi INTEGER DEFAULT 0,
+            taksit_miktari REAL DEFAULT 0,
+            odeme_miktari REAL DEFAULT 0,
+            original_odeme REAL NOT NULL,
+            payment_made BOOLEAN DEFAULT FALSE,
+            last_payment_date TIMESTAMP,
+            previous_last_payment_date TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Çalışanlar table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calisanlar (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ad TEXT NOT NULL,
+            telefon TEXT,
+            pozisyon TEXT,
+            baslangic_tarihi DATE,
+            son_ay REAL DEFAULT 0,
+            son_3_ay REAL DEFAULT 0,
+            son_6_ay REAL DEFAULT 0,
+            son_12_ay REAL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Planlanan Ödemeler table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS planlanan_odemeler (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            debt_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT DEFAULT 'planned' CHECK(status IN ('planned', 'due', 'paid')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (debt_id) REFERENCES acik_borclar (id)
+        )
+    ''')
+
+    # Gündem Posts table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS gundem_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            author TEXT DEFAULT 'Yönetici',
+            is_important BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Envanter table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS envanter (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            urun_kodu TEXT NOT NULL UNIQUE,
+            metre REAL NOT NULL,
+            metre_maliyet REAL NOT NULL,
+            fiyat REAL DEFAULT 0,
+            son_islem_tarihi TEXT,
+            son_30_gun_islem INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # İşlemler table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS islemler (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            islem_tipi TEXT NOT NULL CHECK(islem_tipi IN ('satis', 'alis')),
+            urun_kodu TEXT NOT NULL,
+            miktar REAL NOT NULL,
+            birim_fiyat REAL NOT NULL,
+            toplam_tutar REAL NOT NULL,
+            musteri TEXT,
+            odeme_tipi TEXT CHECK(odeme_tipi IN ('nakit', 'kart', 'kredi', 'nakit+kart', 'mail order', 'pesin+taksit', 'taksit')),
+            aciklama TEXT,
+            pesin_miktar REAL DEFAULT 0,
+            taksit_miktar REAL DEFAULT 0,
+            taksit_sayisi INTEGER DEFAULT 0,
+            kar REAL DEFAULT 0,
+            odeme_plani_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (urun_kodu) REFERENCES envanter (urun_kodu),
+            FOREIGN KEY (odeme_plani_id) REFERENCES odeme_plani (id)
+        )
+    ''')
+
+    # Nakit Akışı table - Monthly cash flows
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS nakit_akisi (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ay INTEGER NOT NULL,
+            yil INTEGER NOT NULL,
+            giris REAL DEFAULT 0,
+            cikis REAL DEFAULT 0,
+            aciklama TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(ay, yil)
+        )
+    ''')
+
+    # Ödeme Planı table - Payment plans and installments
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS odeme_plani (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            islem_id INTEGER NOT NULL,
+            musteri TEXT NOT NULL,
+            toplam_tutar REAL NOT NULL,
+            pesin_miktar REAL DEFAULT 0,
+            taksit_miktar REAL DEFAULT 0,
+            taksit_sayisi INTEGER DEFAULT 0,
+            ay INTEGER NOT NULL,
+            yil INTEGER NOT NULL,
+            durum TEXT DEFAULT 'aktif' CHECK(durum IN ('aktif', 'tamamlandi', 'iptal')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (islem_id) REFERENCES islemler (id)
+        )
+    ''')
+
+    # Taksit Detayları table - Individual installment details
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS taksit_detaylari (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            odeme_plani_id INTEGER NOT NULL,
+            taksit_no INTEGER NOT NULL,
+            miktar REAL NOT NULL,
+            vade_ay INTEGER NOT NULL,
+            vade_yil INTEGER NOT NULL,
+            odendi BOOLEAN DEFAULT FALSE,
+            odeme_tarihi TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (odeme_plani_id) REFERENCES odeme_plani (id)
+        )
+    ''')
+
+
+@migration(2, 'beklenen_odemeler installment columns')
+def _beklenen_odemeler_taksit_columns(cursor):
+    # Databases created before these columns existed
+    add_column(cursor, 'beklenen_odemeler', 'taksit_sayisi', 'INTEGER DEFAULT 0')
+    add_column(cursor, 'beklenen_odemeler', 'taksit_miktari', 'REAL DEFAULT 0')
+
+
+@migration(3, 'secondary indexes for hot query shapes')
+def _secondary_indexes(cursor):
+    # işlemler: type filters ordered by date, plan joins
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_islemler_tipi_created ON islemler (islem_tipi, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_islemler_created ON islemler (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_islemler_odeme_plani ON islemler (odeme_plani_id)')
+
+    # taksit_detaylari: per-plan unpaid/paid scans in installment order, covering
+    # the amount and payment date so plan aggregates never touch the table
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_taksit_plan_odendi_no
+        ON taksit_detaylari (odeme_plani_id, odendi, taksit_no, miktar, odeme_tarihi)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_odeme_plani_islem ON odeme_plani (islem_id)')
+
+    # Monthly lookups
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_nakit_akisi_yil_ay ON nakit_akisi (yil, ay)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_planlanan_year_month ON planlanan_odemeler (year, month)')
+
+    # List endpoints ordered by creation date
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_acik_borclar_created ON acik_borclar (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_gundem_posts_created ON gundem_posts (created_at)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_beklenen_odemeler_tipi_last
+        ON beklenen_odemeler (odeme_tipi, last_payment_date)
+    ''')
+
+    # Case-insensitive lookups: LOWER(ad) = LOWER(?) and urun_kodu = ? COLLATE NOCASE
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_calisanlar_lower_ad ON calisanlar (LOWER(ad))')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_envanter_urun_kodu_nocase ON envanter (urun_kodu COLLATE NOCASE)')
+
+
+@migration(4, 'islemler product filter index')
+def _islemler_urun_index(cursor):
+    # /api/islemler?urun_kodu=... walks this newest-first; rowid breaks created_at ties
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_islemler_urun_created ON islemler (urun_kodu, created_at)')
+
+
+@migration(5, 'change log and tracking triggers')
+def _change_log(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            revision INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete')),
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_table_revision ON change_log (table_name, revision)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_state (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            pruned_through INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO change_log_state (id, pruned_through) VALUES (1, 0)')
+    for table in ('acik_borclar', 'beklenen_odemeler', 'calisanlar', 'planlanan_odemeler',
+                  'gundem_posts', 'envanter', 'islemler', 'nakit_akisi', 'odeme_plani',
+                  'taksit_detaylari'):
+        change_triggers(cursor, table)
+
+
+@migration(6, 'partial indexes for open installment debts')
+def _open_debt_indexes(cursor):
+    # Only unpaid installments: beklenen ödemeler finds open plans without
+    # touching fully paid history
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_taksit_unpaid
+        ON taksit_detaylari (odeme_plani_id, miktar, odendi) WHERE odendi = 0
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_islemler_planless_taksit
+        ON islemler (created_at)
+        WHERE islem_tipi = 'satis' AND taksit_miktar > 0 AND odeme_plani_id IS NULL
+    ''')
+
+
+def _aciklama_value(aciklama, label):
+    """Last `label: value` pair in a legacy aciklama string (values end at a comma)"""
+    matches = re.findall(re.escape(label) + r':\s*([^,]*)', aciklama or '')
+    return matches[-1].strip() if matches else None
+
+
+@migration(7, 'structured payment attributes on islemler')
+def _islemler_payment_attributes(cursor):
+    add_column(cursor, 'islemler', 'taksit_odeme_tipi', 'TEXT')
+    add_column(cursor, 'islemler', 'pesin_odeme_tipi', 'TEXT')
+    add_column(cursor, 'islemler', 'satici', 'TEXT')
+    add_column(cursor, 'islemler', 'is_mail_order', 'INTEGER DEFAULT 0')
+
+    # Backfill from the attributes urun_satis used to encode into aciklama
+    cursor.execute("SELECT id, aciklama FROM islemler WHERE islem_tipi = 'satis'")
+    updates = []
+    for islem_id, aciklama in cursor.fetchall():
+        updates.append((
+            _aciklama_value(aciklama, 'Taksit_Odeme_Tipi'),
+            _aciklama_value(aciklama, 'Pesin_Odeme_Tipi'),
+            _aciklama_value(aciklama, 'Satıcı'),
+            1 if 'Mail_Order: true' in (aciklama or '') else 0,
+            islem_id,
+        ))
+    cursor.executemany('''
+        UPDATE islemler
+        SET taksit_odeme_tipi = ?, pesin_odeme_tipi = ?, satici = ?, is_mail_order = ?
+        WHERE id = ?
+    ''', updates)
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_islemler_satici ON islemler (satici COLLATE NOCASE)')
+
+
+ISLEM_KODU_LABELS = {'satis': ('Satış ID', 'SAT'), 'alis': ('Alış ID', 'ALIS')}
+
+
+@migration(8, 'unique islem_kodu on islemler')
+def _islemler_islem_kodu(cursor):
+    add_column(cursor, 'islemler', 'islem_kodu', 'TEXT')
+
+    # Backfill from the code embedded in aciklama, falling back to the
+    # PREFIX-<id> form the API already reported for rows without one
+    cursor.execute("SELECT id, islem_tipi, aciklama FROM islemler WHERE islem_kodu IS NULL ORDER BY id")
+    rows = cursor.fetchall()
+    cursor.execute('SELECT islem_kodu FROM islemler WHERE islem_kodu IS NOT NULL')
+    taken = {row[0] for row in cursor.fetchall()}
+    updates = []
+    for islem_id, islem_tipi, aciklama in rows:
+        if islem_tipi not in ISLEM_KODU_LABELS:
+            continue
+        label, prefix = ISLEM_KODU_LABELS[islem_tipi]
+        code = (_aciklama_value(aciklama, label) or f'{prefix}-{islem_id}').upper()
+        # Codes have one-second resolution, so older rows may share one
+        candidate, suffix = code, 2
+        while candidate in taken:
+            candidate = f'{code}-{suffix}'
+            suffix += 1
+        taken.add(candidate)
+        updates.append((candidate, islem_id))
+    cursor.executemany('UPDATE islemler SET islem_kodu = ? WHERE id = ?', updates)
+
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_islemler_islem_kodu ON islemler (islem_kodu)')
+
+
+@migration(9, 'telegram_jobs queue')
+def _telegram_jobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            update_id INTEGER UNIQUE,
+            chat_id INTEGER,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_telegram_jobs_status_run_after ON telegram_jobs (status, run_after)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_telegram_jobs_chat_status ON telegram_jobs (chat_id, status)')
+
+
+@migration(10, 'chat_states for the Telegram bot')
+def _chat_states(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_states (
+            chat_id INTEGER PRIMARY KEY,
+            verified INTEGER NOT NULL DEFAULT 0,
+            pending_photo_file_id TEXT,
+            awaiting_code INTEGER NOT NULL DEFAULT 0,
+            pending_since REAL,
+            updated_at REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_states_pending_since
+        ON chat_states (pending_since) WHERE pending_since IS NOT NULL
+    ''')
+
+
+@migration(11, 'aylik_islem_ozeti monthly rollups')
+def _aylik_islem_ozeti(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS aylik_islem_ozeti (
+            yil INTEGER NOT NULL,
+            ay INTEGER NOT NULL,
+            satis_adet INTEGER NOT NULL DEFAULT 0,
+            satis_miktar REAL NOT NULL DEFAULT 0,
+            satis_ciro REAL NOT NULL DEFAULT 0,
+            kar_tutari REAL NOT NULL DEFAULT 0,
+            kar_orani_toplam REAL NOT NULL DEFAULT 0,
+            kar_orani_adet INTEGER NOT NULL DEFAULT 0,
+            alis_adet INTEGER NOT NULL DEFAULT 0,
+            alis_miktar REAL NOT NULL DEFAULT 0,
+            alis_tutar REAL NOT NULL DEFAULT 0,
+            nakit_tutar REAL NOT NULL DEFAULT 0,
+            nakit_adet INTEGER NOT NULL DEFAULT 0,
+            kart_tutar REAL NOT NULL DEFAULT 0,
+            kart_adet INTEGER NOT NULL DEFAULT 0,
+            mail_order_tutar REAL NOT NULL DEFAULT 0,
+            mail_order_adet INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (yil, ay)
+        )
+    ''')
+    # The rollups of rollups.islem_deltas as of version 11: mail orders count on their own, and mixed
+    # peşin+taksit sales count each non-zero part under its own payment type
+    cursor.execute('''
+        WITH s AS (
+            SELECT CAST(substr(created_at, 1, 4) AS INTEGER) AS yil,
+                   CAST(substr(created_at, 6, 2) AS INTEGER) AS ay,
+                   islem_tipi, COALESCE(miktar, 0) AS miktar, COALESCE(toplam_tutar, 0) AS toplam, kar,
+                   COALESCE(NULLIF(odeme_tipi, ''), 'nakit') AS odeme,
+                   islem_tipi = 'satis' AND COALESCE(is_mail_order, 0) != 0 AS mail,
+                   COALESCE(pesin_miktar, 0) AS pesin, pesin_odeme_tipi IS 'kart' AS pesin_kart,
+                   COALESCE(taksit_miktar, 0) AS taksit, taksit_odeme_tipi IS 'kart' AS taksit_kart
+            FROM islemler WHERE islem_tipi IN ('satis', 'alis')
+        ), p AS (
+            SELECT s.*,
+                   islem_tipi = 'satis' AND NOT mail AS split,
+                   islem_tipi = 'satis' AND kar IS NOT NULL AND toplam > 0 AS karli,
+                   CASE WHEN odeme IN ('kart', 'kredi') THEN 0
+                        WHEN odeme = 'taksit' THEN CASE WHEN taksit_kart THEN 0 ELSE toplam END
+                        WHEN odeme = 'pesin+taksit'
+                            THEN CASE WHEN pesin > 0 AND NOT pesin_kart THEN pesin ELSE 0 END
+                               + CASE WHEN taksit > 0 AND NOT taksit_kart THEN taksit ELSE 0 END
+                        ELSE toplam END AS nakit_tutar,
+                   CASE WHEN odeme IN ('kart', 'kredi') THEN 0
+                        WHEN odeme = 'taksit' THEN NOT taksit_kart
+                        WHEN odeme = 'pesin+taksit' THEN (pesin > 0 AND NOT pesin_kart) + (taksit > 0 AND NOT taksit_kart)
+                        ELSE 1 END AS nakit_adet,
+                   CASE WHEN odeme IN ('kart', 'kredi') THEN toplam
+                        WHEN odeme = 'taksit' THEN CASE WHEN taksit_kart THEN toplam ELSE 0 END
+                        WHEN odeme = 'pesin+taksit'
+                            THEN CASE WHEN pesin > 0 AND pesin_kart THEN pesin ELSE 0 END
+                               + CASE WHEN taksit > 0 AND taksit_kart THEN taksit ELSE 0 END
+                        ELSE 0 END AS kart_tutar,
+                   CASE WHEN odeme IN ('kart', 'kredi') THEN 1
+                        WHEN odeme = 'taksit' THEN taksit_kart
+                        WHEN odeme = 'pesin+taksit' THEN (pesin > 0 AND pesin_kart) + (taksit > 0 AND taksit_kart)
+                        ELSE 0 END AS kart_adet
+            FROM s
+        )
+        INSERT INTO aylik_islem_ozeti (
+            yil, ay, satis_adet, satis_miktar, satis_ciro, kar_tutari, kar_orani_toplam, kar_orani_adet,
+            alis_adet, alis_miktar, alis_tutar, nakit_tutar, nakit_adet, kart_tutar, kart_adet,
+            mail_order_tutar, mail_order_adet)
+        SELECT yil, ay,
+               SUM(islem_tipi = 'satis'),
+               SUM(CASE WHEN islem_tipi = 'satis' THEN miktar ELSE 0 END),
+               SUM(CASE WHEN islem_tipi = 'satis' THEN toplam ELSE 0 END),
+               SUM(CASE WHEN karli THEN toplam * kar / 100 ELSE 0 END),
+               SUM(CASE WHEN karli THEN kar ELSE 0 END),
+               SUM(karli),
+               SUM(islem_tipi = 'alis'),
+               SUM(CASE WHEN islem_tipi = 'alis' THEN miktar ELSE 0 END),
+               SUM(CASE WHEN islem_tipi = 'alis' THEN toplam ELSE 0 END),
+               SUM(CASE WHEN split THEN nakit_tutar ELSE 0 END),
+               SUM(CASE WHEN split THEN nakit_adet ELSE 0 END),
+               SUM(CASE WHEN split THEN kart_tutar ELSE 0 END),
+               SUM(CASE WHEN split THEN kart_adet ELSE 0 END),
+               SUM(CASE WHEN mail THEN toplam ELSE 0 END),
+               SUM(mail)
+        FROM p
+        GROUP BY yil, ay
+    ''')
+
+
+@migration(12, 'cash_movements ledger behind nakit_akisi')
+def _cash_movements(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cash_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ay INTEGER NOT NULL,
+            yil INTEGER NOT NULL,
+            direction TEXT NOT NULL CHECK (direction IN ('giris', 'cikis')),
+            amount REAL NOT NULL,
+            aciklama TEXT,
+            source_type TEXT,
+            source_id INTEGER,
+            reverses_id INTEGER REFERENCES cash_movements (id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cash_movements_yil_ay ON cash_movements (yil, ay)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cash_movements_source ON cash_movements (source_type, source_id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_cash_movements_reverses
+        ON cash_movements (reverses_id) WHERE reverses_id IS NOT NULL
+    ''')
+    change_triggers(cursor, 'cash_movements')
+
+    # Existing totals become opening balances, so rebuilding from the ledger
+    # reproduces today's nakit_akisi exactly
+    for direction in ('giris', 'cikis'):
+        cursor.execute(f'''
+            INSERT INTO cash_movements (ay, yil, direction, amount, aciklama, source_type)
+            SELECT ay, yil, '{direction}', {direction}, 'Açılış bakiyesi', 'acilis'
+            FROM nakit_akisi WHERE COALESCE({direction}, 0) != 0
+            ORDER BY yil, ay
+        ''')
+
+
+@migration(13, 'calisan_gunluk_satis daily buckets for employee sales windows')
+def _calisan_gunluk_satis(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calisan_gunluk_satis (
+            calisan_id INTEGER NOT NULL,
+            gun TEXT NOT NULL,
+            tutar REAL NOT NULL DEFAULT 0,
+            adet INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (calisan_id, gun)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_calisan_gunluk_satis_gun ON calisan_gunluk_satis (gun)')
+    # Date the window columns were last computed for; stale rows are refreshed once a day
+    add_column(cursor, 'calisanlar', 'performans_tarihi', 'TEXT')
+    # The old counters were all-time totals; recompute them from the last year of sales.
+    # employee_sales.rebuild_sales_buckets as of version 13, with the windows ending today (UTC)
+    cursor.execute('''
+        INSERT INTO calisan_gunluk_satis (calisan_id, gun, tutar, adet)
+        SELECT c.id, date(i.created_at), SUM(i.toplam_tutar), COUNT(*)
+        FROM islemler i
+        JOIN calisanlar c ON LOWER(c.ad) = LOWER(i.satici)
+        WHERE i.islem_tipi = 'satis' AND i.created_at >= date('now', '-364 days')
+        GROUP BY c.id, date(i.created_at)
+    ''')
+    sums = ', '.join(f'''
+        {column} = COALESCE((SELECT SUM(b.tutar) FROM calisan_gunluk_satis b
+                             WHERE b.calisan_id = calisanlar.id AND b.gun >= date('now', '-{days - 1} days')), 0)'''
+        for column, days in (('son_ay', 30), ('son_3_ay', 90), ('son_6_ay', 180), ('son_12_ay', 365)))
+    cursor.execute(f"UPDATE calisanlar SET {sums}, performans_tarihi = date('now'), updated_at = CURRENT_TIMESTAMP")
+
+
+@migration(14, 'urun_gunluk_islem daily buckets for product activity windows')
+def _urun_gunluk_islem(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS urun_gunluk_islem (
+            urun_kodu TEXT NOT NULL COLLATE NOCASE,
+            gun TEXT NOT NULL,
+            adet INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (urun_kodu, gun)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_urun_gunluk_islem_gun ON urun_gunluk_islem (gun)')
+    add_column(cursor, 'envanter', 'son_7_gun_islem', 'INTEGER DEFAULT 0')
+    add_column(cursor, 'envanter', 'son_90_gun_islem', 'INTEGER DEFAULT 0')
+    add_column(cursor, 'envanter', 'aktivite_tarihi', 'TEXT')
+    # son_30_gun_islem only ever grew; recompute it from the transactions of the last 90 days.
+    # product_activity.rebuild_activity_buckets as of version 14, with the windows ending today (UTC)
+    cursor.execute('''
+        INSERT INTO urun_gunluk_islem (urun_kodu, gun, adet)
+        SELECT UPPER(urun_kodu), date(created_at), COUNT(*)
+        FROM islemler
+        WHERE islem_tipi IN ('satis', 'alis') AND created_at >= date('now', '-89 days') AND urun_kodu IS NOT NULL
+        GROUP BY UPPER(urun_kodu), date(created_at)
+    ''')
+    sums = ', '.join(f'''
+        {column} = COALESCE((SELECT SUM(b.adet) FROM urun_gunluk_islem b
+                             WHERE b.urun_kodu = envanter.urun_kodu AND b.gun >= date('now', '-{days - 1} days')), 0)'''
+        for column, days in (('son_7_gun_islem', 7), ('son_30_gun_islem', 30), ('son_90_gun_islem', 90)))
+    cursor.execute(f"UPDATE envanter SET {sums}, aktivite_tarihi = date('now')")
+
+
+@migration(15, 'sale_media manifest of sale photos')
+def _sale_media(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sale_media (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            islem_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            mimetype TEXT,
+            sha256 TEXT NOT NULL,
+            thumb_filename TEXT,
+            preview_filename TEXT,
+            variants_status TEXT NOT NULL DEFAULT 'pending'
+                CHECK(variants_status IN ('pending', 'done', 'unavailable')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (islem_id, filename)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sale_media_variants_pending
+        ON sale_media (id) WHERE variants_status = 'pending'
+    ''')
+    # Listings are served with an ETag like the other tracked tables
+    change_triggers(cursor, 'sale_media')
+
+
+@migration(16, 'media_blobs content-addressed store behind sale_media')
+def _media_blobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mimetype TEXT,
+            orphaned_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_media_blobs_orphaned_at
+        ON media_blobs (orphaned_at) WHERE orphaned_at IS NOT NULL
+    ''')
+    add_column(cursor, 'sale_media', 'thumb_sha256', 'TEXT')
+    add_column(cursor, 'sale_media', 'preview_sha256', 'TEXT')
+    # Reference lookups for GC; sha256 also serves the per-sale duplicate check
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sale_media_sha256 ON sale_media (sha256)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sale_media_thumb_sha256 ON sale_media (thumb_sha256)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sale_media_preview_sha256 ON sale_media (preview_sha256)')
+    # Files move into the store in init_db (import_legacy_media), which knows MEDIA_ROOT
+
+
+@migration(17, 'metric_samples shared by the workers for /api/metrics/prom')
+def _metric_samples(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_samples (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            family TEXT NOT NULL,
+            value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, labels)
+        ) WITHOUT ROWID
+    ''')
@@ -0,0 +1,82 @@
+"""Rolling-window product activity from daily buckets.
+
+urun_gunluk_islem holds one row per product code per day with the number of
+sales and purchases of that product. urun_satis / urun_alis add to the bucket
+of the day and transaction deletes subtract from it. The son_7_gun_islem,
+son_30_gun_islem and son_90_gun_islem columns of envanter are sums over at
+most 90 of those rows: recomputed for a product whenever its buckets change,
+and for every product once a day as the windows move on.
+"""
+from employee_sales import utc_today, window_start
+
+WINDOWS = (('son_7_gun_islem', 7), ('son_30_gun_islem', 30), ('son_90_gun_islem', 90))
+KEEP_DAYS = max(days for _, days in WINDOWS)
+COUNTED_TYPES = ('satis', 'alis')
+
+
+def refresh_activity_windows(cursor, urun_kodlari=None, today=None):
+    """Recompute the window columns of some products (all that are stale with None)"""
+    today = today or utc_today()
+    sums = ', '.join(f'''
+        {column} = COALESCE((SELECT SUM(b.adet) FROM urun_gunluk_islem b
+                             WHERE b.urun_kodu = envanter.urun_kodu AND b.gun >= '{window_start(today, days)}'), 0)'''
+        for column, days in WINDOWS)
+    if urun_kodlari is None:
+        where, params = 'aktivite_tarihi IS NOT ?', [today]
+    else:
+        urun_kodlari = list(urun_kodlari)
+        if not urun_kodlari:
+            return 0
+        where, params = f"urun_kodu COLLATE NOCASE IN ({', '.join('?' * len(urun_kodlari))})", urun_kodlari
+    cursor.execute(f'''
+        UPDATE envanter SET {sums}, aktivite_tarihi = ?
+        WHERE {where}
+    ''', [today, *params])
+    return cursor.rowcount
+
+
+def record_activity(cursor, events, today=None):
+    """Add (urun_kodu, gun, adet) deltas to the daily buckets; negative for deletes"""
+    today = today or utc_today()
+    oldest = window_start(today, KEEP_DAYS)
+    rows = [(urun_kodu.upper(), gun[:10], adet) for urun_kodu, gun, adet in events if gun[:10] >= oldest]
+    if not rows:
+        return
+    cursor.executemany('''
+        INSERT INTO urun_gunluk_islem (urun_kodu, gun, adet) VALUES (?, ?, ?)
+        ON CONFLICT(urun_kodu, gun) DO UPDATE SET adet = adet + excluded.adet
+    ''', rows)
+    cursor.executemany('DELETE FROM urun_gunluk_islem WHERE urun_kodu = ? AND gun = ? AND adet <= 0',
+                       [(urun_kodu, gun) for urun_kodu, gun, _ in rows])
+    refresh_activity_windows(cursor, {urun_kodu for urun_kodu, _, _ in rows}, today)
+
+
+def prune_activity_buckets(cursor, today=None):
+    """Drop buckets that no window reaches any more"""
+    cursor.execute('DELETE FROM urun_gunluk_islem WHERE gun < ?', (window_start(today or utc_today(), KEEP_DAYS),))
+    return cursor.rowcount
+
+
+def rebuild_activity_buckets(cursor, today=None):
+    """Recompute the buckets from islemler in one grouped pass and refresh every product.
+
+    Like record_activity, it keeps only the days a window reaches, and codes
+    are upper-cased in Python: SQLite's UPPER() leaves letters such as ş or ü
+    as they are, which would split a product across two bucket keys.
+    """
+    today = today or utc_today()
+    cursor.execute(f'''
+        SELECT urun_kodu, date(created_at), COUNT(*)
+        FROM islemler
+        WHERE islem_tipi IN ({', '.join('?' * len(COUNTED_TYPES))}) AND created_at >= ? AND urun_kodu IS NOT NULL
+        GROUP BY urun_kodu, date(created_at)
+    ''', (*COUNTED_TYPES, window_start(today, KEEP_DAYS)))
+    buckets = {}
+    for urun_kodu, gun, adet in cursor.fetchall():
+        key = (urun_kodu.upper(), gun)
+        buckets[key] = buckets.get(key, 0) + adet
+    cursor.execute('DELETE FROM urun_gunluk_islem')
+    cursor.executemany('INSERT INTO urun_gunluk_islem (urun_kodu, gun, adet) VALUES (?, ?, ?)',
+                       [(urun_kodu, gun, adet) for (urun_kodu, gun), adet in buckets.items()])
+    cursor.execute('UPDATE envanter SET aktivite_tarihi = NULL')
+    return refresh_activity_windows(cursor, today=today)
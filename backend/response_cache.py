@@ -0,0 +1,73 @@
+"""In-process cache of serialized GET responses.
+
+Entries are keyed by endpoint and full request path and stamped with the
+version they were rendered at: the ETag that track_changes derives from the
+change_log revisions of the tables the view reads. Every write to one of
+those tables, from any gunicorn worker, moves the revision in SQLite, so a
+lookup with the current version misses exactly when the underlying rows
+changed; the stale entry is dropped on the spot. The cache is bounded by the
+total size of the bodies it holds and evicts least recently used entries.
+"""
+import collections
+import os
+import threading
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (version, body, mimetype)
+        self._size = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0, 'stores': 0}
+
+    def get(self, key, version):
+        """Body and mimetype cached for key at version, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[0] != version:
+                self._drop(key)
+                self._stats['invalidations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1], entry[2]
+
+    def put(self, key, version, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, body, mimetype)
+            self._size += len(body)
+            self._stats['stores'] += 1
+            while self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _drop(self, key):
+        _, body, _ = self._entries.pop(key)
+        self._size -= len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'pid': os.getpid(),
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hit_ratio': round(stats['hits'] / lookups, 3) if lookups else None,
+            })
+        return stats
@@ -0,0 +1,141 @@
+"""Monthly business metric rollups over islemler.
+
+aylik_islem_ozeti holds one row per (yil, ay) with running totals of sales and
+purchases: counts, metres, revenue, profit and the cash / card / mail order
+split the Finansallar dashboard shows. Routes that create or delete a
+transaction call apply_islem() with +1 or -1 inside their own transaction, so
+reading a year of metrics is a 12-row lookup however many transactions exist.
+Migration 11 filled the table from the transactions that existed before.
+"""
+
+ROLLUP_COLUMNS = (
+    'satis_adet', 'satis_miktar', 'satis_ciro', 'kar_tutari', 'kar_orani_toplam', 'kar_orani_adet',
+    'alis_adet', 'alis_miktar', 'alis_tutar',
+    'nakit_tutar', 'nakit_adet', 'kart_tutar', 'kart_adet', 'mail_order_tutar', 'mail_order_adet',
+)
+
+# islemler columns the rollups are computed from
+SOURCE_FIELDS = (
+    'islem_tipi', 'created_at', 'miktar', 'toplam_tutar', 'kar', 'odeme_tipi', 'pesin_miktar',
+    'taksit_miktar', 'pesin_odeme_tipi', 'taksit_odeme_tipi', 'is_mail_order',
+)
+
+
+def islem_month(islem):
+    created_at = str(islem['created_at'])
+    return int(created_at[:4]), int(created_at[5:7])
+
+
+def payment_split(islem):
+    """(nakit_tutar, nakit_adet, kart_tutar, kart_adet, mail_tutar, mail_adet) of one sale.
+
+    Mirrors the dashboard's rules: mail orders count on their own, mixed
+    peşin+taksit sales count each part under its own payment type.
+    """
+    toplam = islem['toplam_tutar'] or 0
+    if islem['is_mail_order']:
+        return 0, 0, 0, 0, toplam, 1
+    odeme_tipi = islem['odeme_tipi'] or 'nakit'
+    if odeme_tipi in ('kart', 'kredi'):
+        return 0, 0, toplam, 1, 0, 0
+    if odeme_tipi == 'taksit':
+        if islem['taksit_odeme_tipi'] == 'kart':
+            return 0, 0, toplam, 1, 0, 0
+        return toplam, 1, 0, 0, 0, 0
+    if odeme_tipi == 'pesin+taksit':
+        nakit_tutar = nakit_adet = kart_tutar = kart_adet = 0
+        for amount, tipi in ((islem['pesin_miktar'] or 0, islem['pesin_odeme_tipi']),
+                             (islem['taksit_miktar'] or 0, islem['taksit_odeme_tipi'])):
+            if amount > 0:
+                if tipi == 'kart':
+                    kart_tutar += amount
+                    kart_adet += 1
+                else:
+                    nakit_tutar += amount
+                    nakit_adet += 1
+        return nakit_tutar, nakit_adet, kart_tutar, kart_adet, 0, 0
+    return toplam, 1, 0, 0, 0, 0
+
+
+def islem_deltas(islem):
+    """Rollup column values contributed by one islemler row"""
+    deltas = dict.fromkeys(ROLLUP_COLUMNS, 0)
+    toplam = islem['toplam_tutar'] or 0
+    if islem['islem_tipi'] == 'satis':
+        deltas.update(satis_adet=1, satis_miktar=islem['miktar'] or 0, satis_ciro=toplam)
+        if islem['kar'] is not None and toplam > 0:
+            deltas.update(
+                kar_tutari=toplam * islem['kar'] / 100,
+                kar_orani_toplam=islem['kar'],
+                kar_orani_adet=1,
+            )
+        (deltas['nakit_tutar'], deltas['nakit_adet'], deltas['kart_tutar'], deltas['kart_adet'],
+         deltas['mail_order_tutar'], deltas['mail_order_adet']) = payment_split(islem)
+    elif islem['islem_tipi'] == 'alis':
+        deltas.update(alis_adet=1, alis_miktar=islem['miktar'] or 0, alis_tutar=toplam)
+    else:
+        return None
+    return deltas
+
+
+def upsert_rollups(cursor, rows):
+    """Add (yil, ay, deltas) rows onto aylik_islem_ozeti"""
+    columns = ', '.join(ROLLUP_COLUMNS)
+    increments = ', '.join(f'{c} = {c} + excluded.{c}' for c in ROLLUP_COLUMNS)
+    cursor.executemany(f'''
+        INSERT INTO aylik_islem_ozeti (yil, ay, {columns})
+        VALUES (?, ?, {', '.join('?' * len(ROLLUP_COLUMNS))})
+        ON CONFLICT(yil, ay) DO UPDATE SET {increments}, updated_at = CURRENT_TIMESTAMP
+    ''', [(yil, ay, *[deltas[c] for c in ROLLUP_COLUMNS]) for yil, ay, deltas in rows])
+
+
+def apply_islem(cursor, islem_id, sign=1):
+    """Add (sign=1) or remove (sign=-1) one transaction's contribution.
+
+    Call after inserting the row, or before deleting it.
+    """
+    apply_islemler(cursor, [islem_id], sign)
+
+
+def apply_islemler(cursor, islem_ids, sign=1):
+    """apply_islem for several transactions with one read and one upsert per month"""
+    islem_ids = list(islem_ids)
+    if not islem_ids:
+        return
+    cursor.execute(f'''
+        SELECT {", ".join(SOURCE_FIELDS)} FROM islemler WHERE id IN ({", ".join("?" * len(islem_ids))})
+    ''', islem_ids)
+    totals = {}
+    for row in cursor.fetchall():
+        islem = dict(zip(SOURCE_FIELDS, row))
+        deltas = islem_deltas(islem)
+        if deltas is None:
+            continue
+        month = totals.setdefault(islem_month(islem), dict.fromkeys(ROLLUP_COLUMNS, 0))
+        for column, value in deltas.items():
+            month[column] += sign * value
+    if totals:
+        upsert_rollups(cursor, [(yil, ay, deltas) for (yil, ay), deltas in totals.items()])
+
+
+def metrics_from_rollup(row):
+    """Dashboard metrics for one rollup row (or the sum of several)"""
+    row = row or dict.fromkeys(ROLLUP_COLUMNS, 0)
+    nakit, kart, mail = row['nakit_tutar'], row['kart_tutar'], row['mail_order_tutar']
+    return {
+        'sales_count': row['satis_adet'],
+        'purchase_count': row['alis_adet'],
+        'sales_volume': round(row['satis_miktar'], 3),
+        'purchase_volume': round(row['alis_miktar'], 3),
+        'sales_revenue': round(row['satis_ciro'], 2),
+        'purchase_amount': round(row['alis_tutar'], 2),
+        'total_profit': round(row['kar_tutari'], 2),
+        'avg_profitability': round(row['kar_orani_toplam'] / row['kar_orani_adet'], 4) if row['kar_orani_adet'] else 0,
+        'cash_total': round(nakit, 2),
+        'card_total': round(kart, 2),
+        'mail_order_total': round(mail, 2),
+        'cash_count': row['nakit_adet'],
+        'card_count': row['kart_adet'],
+        'mail_order_count': row['mail_order_adet'],
+        'payment_total': round(nakit + kart + mail, 2),
+    }
@@ -0,0 +1,212 @@
+"""Sale photo manifest (sale_media) and its downscaled variants.
+
+A photo is recorded when it is stored: size, pixel dimensions and a SHA-256
+of the original, so listing a sale's photos is one indexed query instead of
+a directory scan. The bytes live in the content-addressed blob store
+(blob_store.py); a sale_media row is the reference that links a blob to a
+sale under the filename its URL uses. A background job then stores a small
+thumbnail and a screen-sized preview the same way; until they exist (or when
+Pillow is not installed) listings point at the original.
+"""
+import io
+import os
+import struct
+
+from blob_store import register_blob, release_blobs
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+# variant -> longest side in pixels
+VARIANTS = (('thumb', 320), ('preview', 1280))
+VARIANT_QUALITY = 80
+
+MEDIA_FIELDS = '''id, islem_id, filename, size, width, height, mimetype, sha256,
+                  thumb_filename, thumb_sha256, preview_filename, preview_sha256,
+                  variants_status, created_at'''
+BLOB_COLUMNS = ('sha256', 'thumb_sha256', 'preview_sha256')
+
+
+def image_info(data):
+    """(mimetype, width, height) read from the image header; dimensions may be None"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'image/png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'image/gif', width, height
+    if data[:2] == b'\xff\xd8':
+        # Walk the JPEG segments up to the first start-of-frame marker
+        offset = 2
+        while offset + 9 < len(data):
+            if data[offset] != 0xFF:
+                offset += 1
+                continue
+            marker = data[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                offset += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                return 'image/jpeg', width, height
+            offset += 2 + length
+        return 'image/jpeg', None, None
+    return 'application/octet-stream', None, None
+
+
+def add_media(cursor, store, islem_id, filename, data):
+    """Store a photo and link it to a sale; returns the sale_media id.
+
+    The same image sent again for the same sale returns the existing row.
+    The caller commits.
+    """
+    mimetype, width, height = image_info(data)
+    sha256 = register_blob(cursor, store, data, mimetype)
+    cursor.execute('SELECT id FROM sale_media WHERE islem_id = ? AND sha256 = ?', (islem_id, sha256))
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    cursor.execute(f'SELECT id, {", ".join(BLOB_COLUMNS)} FROM sale_media WHERE islem_id = ? AND filename = ?',
+                   (islem_id, filename))
+    old = cursor.fetchone()
+    if old is None:
+        cursor.execute('''
+            INSERT INTO sale_media (islem_id, filename, size, width, height, mimetype, sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (islem_id, filename, len(data), width, height, mimetype, sha256))
+        return cursor.lastrowid
+    # Same name, different bytes: the row now points at the new blob and its variants are redone
+    cursor.execute('''
+        UPDATE sale_media
+        SET size = ?, width = ?, height = ?, mimetype = ?, sha256 = ?,
+            thumb_filename = NULL, thumb_sha256 = NULL, preview_filename = NULL, preview_sha256 = NULL,
+            variants_status = 'pending'
+        WHERE id = ?
+    ''', (len(data), width, height, mimetype, sha256, old[0]))
+    release_blobs(cursor, old[1:])
+    return old[0]
+
+
+def delete_media(cursor, islem_ids):
+    """Unlink the photos of some sales; their blobs become GC candidates"""
+    islem_ids = list(islem_ids)
+    if not islem_ids:
+        return 0
+    placeholders = ', '.join('?' * len(islem_ids))
+    cursor.execute(f'SELECT {", ".join(BLOB_COLUMNS)} FROM sale_media WHERE islem_id IN ({placeholders})', islem_ids)
+    hashes = [sha256 for row in cursor.fetchall() for sha256 in row]
+    cursor.execute(f'DELETE FROM sale_media WHERE islem_id IN ({placeholders})', islem_ids)
+    deleted = cursor.rowcount
+    release_blobs(cursor, hashes)
+    return deleted
+
+
+def import_legacy_media(cursor, store, media_root):
+    """Move photos from the old MEDIA_ROOT/sales/<islem_id>/ layout into the blob store.
+
+    Old thumbnail/preview files are left for remove_legacy_media and the
+    variants redone. Returns the ids of the rows that need variants; the
+    caller commits, then calls remove_legacy_media.
+    """
+    sales_root = os.path.join(media_root, 'sales')
+    if not os.path.isdir(sales_root):
+        return []
+    pending = []
+    for entry in os.scandir(sales_root):
+        if not entry.is_dir() or not entry.name.isdigit():
+            continue
+        islem_id = int(entry.name)
+        for file_entry in os.scandir(entry.path):
+            name = file_entry.name
+            if name.lower().endswith(IMAGE_EXTENSIONS) and not is_variant_name(name):
+                with open(file_entry.path, 'rb') as f:
+                    media_id = add_media(cursor, store, islem_id, name, f.read())
+                cursor.execute('''
+                    UPDATE sale_media
+                    SET thumb_filename = NULL, preview_filename = NULL, variants_status = 'pending'
+                    WHERE id = ? AND thumb_sha256 IS NULL
+                ''', (media_id,))
+                pending.append(media_id)
+    return sorted(set(pending))
+
+
+def remove_legacy_media(media_root):
+    """Delete the old per-sale photo files once their import is committed"""
+    sales_root = os.path.join(media_root, 'sales')
+    if not os.path.isdir(sales_root):
+        return
+    for entry in os.scandir(sales_root):
+        if entry.is_dir() and entry.name.isdigit():
+            for file_entry in os.scandir(entry.path):
+                if file_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    os.unlink(file_entry.path)
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass  # something else lives there; leave it
+
+
+def variant_name(filename, variant):
+    return f'{os.path.splitext(filename)[0]}.{variant}.jpg'
+
+
+def is_variant_name(filename):
+    return any(filename.endswith(f'.{variant}.jpg') for variant, _ in VARIANTS)
+
+
+def make_variants(data):
+    """Downscaled JPEG variants of an original: {variant: bytes}, or None without Pillow"""
+    if Image is None:
+        return None
+    original = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+    variants = {}
+    for variant, longest_side in VARIANTS:
+        image = original.copy()
+        image.thumbnail((longest_side, longest_side))
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=VARIANT_QUALITY, optimize=True, progressive=True)
+        variants[variant] = out.getvalue()
+    return variants
+
+
+def store_variants(cursor, store, media_id, filename, variants):
+    """Store variants made by make_variants and point the row at them; the caller commits"""
+    if variants is None:
+        cursor.execute("UPDATE sale_media SET variants_status = 'unavailable' WHERE id = ?", (media_id,))
+        return
+    cursor.execute('SELECT thumb_sha256, preview_sha256 FROM sale_media WHERE id = ?', (media_id,))
+    old = cursor.fetchone()
+    hashes = {variant: register_blob(cursor, store, data, 'image/jpeg') for variant, data in variants.items()}
+    cursor.execute('''
+        UPDATE sale_media
+        SET thumb_filename = ?, thumb_sha256 = ?, preview_filename = ?, preview_sha256 = ?,
+            variants_status = 'done'
+        WHERE id = ?
+    ''', (variant_name(filename, 'thumb'), hashes['thumb'],
+          variant_name(filename, 'preview'), hashes['preview'], media_id))
+    if old:
+        release_blobs(cursor, [h for h in old if h not in hashes.values()])
+
+
+def list_media(cursor, islem_id):
+    cursor.execute(f'SELECT {MEDIA_FIELDS} FROM sale_media WHERE islem_id = ? ORDER BY filename', (islem_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def find_media(cursor, islem_id, filename):
+    """(row, variant) for a served filename; variant is None for the original"""
+    cursor.execute(f'''
+        SELECT {MEDIA_FIELDS} FROM sale_media
+        WHERE islem_id = ? AND ? IN (filename, thumb_filename, preview_filename)
+    ''', (islem_id, filename))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    for variant, _ in VARIANTS:
+        if row[f'{variant}_filename'] == filename:
+            return dict(row), variant
+    return dict(row), None
@@ -0,0 +1,251 @@
+"""Opt-in slow query log.
+
+With a threshold set, the pool's cursors are TracingCursors. A statement is
+timed from its execute through its fetches and ends when its rows are
+exhausted, when the next statement starts on the same thread, or when the
+request's response is closed. Statements that took longer than the threshold
+are printed and grouped by their SQL text. Each group keeps its count,
+cumulative and maximum time, the routes that ran it, and the parameters, rows
+returned and VM steps of its slowest run. It also keeps an EXPLAIN QUERY PLAN,
+taken once, when the group is first seen. The plan is taken on a read-only
+connection of its own, outside the pool, that does not wait for locks: it runs
+inside the cursor calls of the statement being measured, so it must neither
+fail nor stall them. When it cannot be taken the group records why instead.
+
+The sqlite3 module does not expose sqlite3_stmt_status, so rows scanned are
+approximated by the number of virtual machine instructions run, counted with
+a progress handler every PROGRESS_STEPS instructions. It grows with the rows
+a statement visits, so a full scan stands out against an index lookup that
+returns as many rows.
+"""
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+from metrics import InstrumentedCursor, current_request
+
+PROGRESS_STEPS = 100
+EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+_local = threading.local()
+
+
+def normalize_sql(sql):
+    return ' '.join(sql.split())
+
+
+def _describe(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, str) and len(value) > 200:
+        return value[:200] + '…'
+    return value
+
+
+def describe_parameters(parameters):
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: _describe(value) for key, value in parameters.items()}
+    return [_describe(value) for value in parameters]
+
+
+def read_only_connection(path):
+    """A plain connection to the database at path that can only read and never waits for a lock"""
+    return sqlite3.connect(f'file:{pathname2url(path)}?mode=ro', uri=True, timeout=0)
+
+
+def _count_steps(conn):
+    def tick():
+        conn._vm_ticks += 1
+        return 0
+    conn._vm_ticks = 0
+    conn.set_progress_handler(tick, PROGRESS_STEPS)
+
+
+class _Statement:
+    __slots__ = ('cursor', 'sql', 'parameters', 'route', 'elapsed', 'rows', 'ticks_started', 'ticks')
+
+    def __init__(self, cursor, sql, parameters):
+        stats = current_request()
+        conn = cursor.connection
+        self.cursor = cursor
+        self.sql = sql
+        self.parameters = parameters
+        self.route = stats.route if stats is not None else None
+        self.elapsed = 0.0
+        self.rows = 0
+        self.ticks_started = conn._vm_ticks
+        self.ticks = 0
+
+
+class TracingCursor(InstrumentedCursor):
+    log = None  # set on the per-log subclass made by SlowQueryLog
+
+    def _begin(self, sql, parameters):
+        self.log.finish_thread()
+        if not hasattr(self.connection, '_vm_ticks'):
+            _count_steps(self.connection)
+        _local.statement = _Statement(self, sql, parameters)
+        return time.perf_counter()
+
+    def _charge(self, started, rows=0, done=False):
+        statement = getattr(_local, 'statement', None)
+        if statement is None or statement.cursor is not self:
+            return
+        statement.elapsed += time.perf_counter() - started
+        statement.rows += rows
+        statement.ticks = self.connection._vm_ticks - statement.ticks_started
+        if done:
+            self.log.finish_thread()
+
+    def execute(self, sql, parameters=()):
+        started = self._begin(sql, parameters)
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            # Statements that return no rows are complete once executed
+            self._charge(started, done=self.description is None)
+
+    def executemany(self, sql, seq_of_parameters):
+        # The first parameter set stands for the batch in the log and the EXPLAIN
+        seq_of_parameters = iter(seq_of_parameters)
+        first = next(seq_of_parameters, None)
+        if first is not None:
+            seq_of_parameters = itertools.chain([first], seq_of_parameters)
+        started = self._begin(sql, first)
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._charge(started, done=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._charge(started, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._charge(started, len(rows), done=len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._charge(started, len(rows), done=True)
+        return rows
+
+    def close(self):
+        self.log.finish_thread(self)
+        super().close()
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, connect, max_statements=200):
+        self.threshold_ms = threshold_ms
+        self.enabled = threshold_ms > 0
+        self.connect = connect
+        self.max_statements = max_statements
+        self.cursor_factory = type('TracingCursor', (TracingCursor,), {'log': self})
+        self._lock = threading.Lock()
+        self._statements = {}  # normalized SQL -> entry
+
+    def finish_thread(self, cursor=None):
+        """End the statement being timed on this thread (only if it belongs to cursor, when given)"""
+        statement = getattr(_local, 'statement', None)
+        if statement is None or (cursor is not None and statement.cursor is not cursor):
+            return
+        _local.statement = None
+        if statement.elapsed * 1000 >= self.threshold_ms:
+            self.record(statement)
+
+    def record(self, statement):
+        key = normalize_sql(statement.sql)
+        elapsed_ms = statement.elapsed * 1000
+        vm_steps = statement.ticks * PROGRESS_STEPS
+        route = statement.route or '(background)'
+        print(f"[SLOW SQL] {elapsed_ms:.1f} ms route={route} rows={statement.rows} "
+              f"vm_steps~{vm_steps}: {key[:300]}")
+        with self._lock:
+            known = key in self._statements
+        # Outside the lock: the plan is only taken the first time a statement is seen
+        plan = None if known else self.explain(statement.sql, statement.parameters)
+        # One locked block creates the entry and adds the run, so report() never sees
+        # an entry with count 0 and eviction cannot drop the run in between
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    cheapest = min(self._statements, key=lambda k: self._statements[k]['total_ms'])
+                    del self._statements[cheapest]
+                entry = self._statements[key] = {
+                    'sql': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'routes': {},
+                    'slowest': None, 'plan': plan, 'first_seen': time.time(),
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['routes'][route] = entry['routes'].get(route, 0) + 1
+            entry['last_seen'] = time.time()
+            if elapsed_ms >= entry['max_ms']:
+                entry['max_ms'] = elapsed_ms
+                entry['slowest'] = {
+                    'parameters': describe_parameters(statement.parameters),
+                    'route': route,
+                    'rows_returned': statement.rows,
+                    'vm_steps': vm_steps,
+                }
+
+    def explain(self, sql, parameters):
+        if not EXPLAINABLE.match(sql):
+            return None
+        # Anything going wrong here would surface in the statement being measured
+        try:
+            conn = self.connect()
+        except Exception as e:
+            return [f'(EXPLAIN unavailable: {e})']
+        try:
+            # A plain cursor, so the EXPLAIN itself is neither traced nor counted
+            cursor = conn.cursor(sqlite3.Cursor)
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters if parameters is not None else ())
+            rows = cursor.fetchall()
+        except Exception as e:
+            return [f'(EXPLAIN failed: {e})']
+        finally:
+            conn.close()
+        # Indent each step under its parent, as the sqlite3 shell does
+        depth = {0: -1}
+        plan = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            plan.append('  ' * depth[node_id] + detail)
+        return plan
+
+    def report(self, limit=50):
+        with self._lock:
+            entries = sorted(self._statements.values(), key=lambda e: e['total_ms'], reverse=True)[:limit]
+            statements = [{
+                **entry,
+                'routes': dict(entry['routes']),
+                'total_ms': round(entry['total_ms'], 3),
+                'max_ms': round(entry['max_ms'], 3),
+                'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+            } for entry in entries]
+            distinct = len(self._statements)
+        return {
+            'pid': os.getpid(),
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'distinct_statements': distinct,
+            'statements': statements,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
@@ -0,0 +1,113 @@
+"""Serving the built SPA (dist/) from an in-memory manifest.
+
+The manifest is built once at startup: one entry per file with its mimetype,
+a strong ETag from the content hash, its precompressed .br / .gz siblings
+(written by build.py) and, for files up to MEMORY_MAX_SIZE, the bytes
+themselves. A request is then a dictionary lookup: no os.path.exists and, for
+the files held in memory, no open or stat. Vite's fingerprinted assets
+(assets/name-<hash>.ext) never change under the same name and are sent with
+an immutable year-long max-age; everything else, index.html included, is
+revalidated with its ETag. Unknown paths get index.html so client-side
+routes work on reload.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, send_file
+
+MEMORY_MAX_SIZE = 512 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Suffix of a precompressed sibling -> Content-Encoding, in order of preference
+PRECOMPRESSED = (('.br', 'br'), ('.gz', 'gzip'))
+FINGERPRINTED = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+
+
+class StaticFile:
+    __slots__ = ('path', 'mimetype', 'etag', 'body', 'immutable')
+
+    def __init__(self, path, mimetype, immutable):
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(content).hexdigest()
+        self.body = content if len(content) <= MEMORY_MAX_SIZE else None
+        self.immutable = immutable
+
+
+class StaticManifest:
+    def __init__(self, root, index='index.html'):
+        self.root = root
+        self.index = index
+        self.files = {}     # relative path -> StaticFile
+        self.variants = {}  # relative path -> {encoding: StaticFile}
+        self.scan()
+
+    def scan(self):
+        files, variants = {}, {}
+        if self.root and os.path.isdir(self.root):
+            names = []
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    full = os.path.join(dirpath, filename)
+                    names.append(os.path.relpath(full, self.root).replace(os.sep, '/'))
+            present = set(names)
+            for name in names:
+                suffix = next((s for s, _ in PRECOMPRESSED if name.endswith(s)), None)
+                if suffix and name[:-len(suffix)] in present:
+                    continue
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                immutable = bool(FINGERPRINTED.match(name))
+                files[name] = StaticFile(os.path.join(self.root, name), mimetype, immutable)
+                for suffix, encoding in PRECOMPRESSED:
+                    if name + suffix in present:
+                        variants.setdefault(name, {})[encoding] = StaticFile(
+                            os.path.join(self.root, name + suffix), mimetype, immutable)
+        self.files, self.variants = files, variants
+        return len(files)
+
+    def lookup(self, path):
+        """Entry name for a request path; unknown paths fall back to index.html"""
+        if path in self.files:
+            return path
+        return self.index if self.index in self.files else None
+
+    def response(self, path, request):
+        name = self.lookup(path)
+        if name is None:
+            return Response('Not Found', status=404, mimetype='text/plain')
+        entry = self.files[name]
+        encoding = None
+        variants = self.variants.get(name)
+        if variants:
+            encoding = request.accept_encodings.best_match([e for _, e in PRECOMPRESSED if e in variants])
+        served = variants[encoding] if encoding else entry
+
+        # The ETag names the representation: the same file gzip'ed is a different one
+        etag = entry.etag + (f'-{encoding}' if encoding else '')
+        if served.body is not None:
+            response = Response(served.body, mimetype=entry.mimetype)
+            response.set_etag(etag)
+            response.make_conditional(request, accept_ranges=True, complete_length=len(served.body))
+        else:
+            response = send_file(served.path, mimetype=entry.mimetype, etag=etag)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if entry.immutable else REVALIDATE_CACHE_CONTROL
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if variants:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def stats(self):
+        return {
+            'root': self.root,
+            'files': len(self.files),
+            'precompressed': sum(len(v) for v in self.variants.values()),
+            'immutable': sum(1 for entry in self.files.values() if entry.immutable),
+            'in_memory_bytes': sum(len(entry.body) for entry in self.files.values() if entry.body is not None)
+                               + sum(len(variant.body) for variants in self.variants.values()
+                                     for variant in variants.values() if variant.body is not None),
+        }
@@ -0,0 +1,264 @@
+"""Durable background jobs for the Telegram bot.
+
+The webhook only updates chat state and enqueues a job, then answers Telegram
+right away. A small pool of worker threads in each process claims jobs from
+the telegram_jobs table, so slow getFile / download / sendMessage calls never
+hold a request thread, and jobs left behind by a crash or restart are picked
+up again. Jobs of the same chat run one at a time, in the order they arrived.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+
+
+class TelegramError(Exception):
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """Bot API client; each worker thread reuses one keep-alive session"""
+
+    def __init__(self, token, api_base='https://api.telegram.org', timeout=10.0, download_timeout=15.0):
+        self.token = token
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.download_timeout = download_timeout
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return bool(self.token)
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def call(self, method, **params):
+        try:
+            response = self._session().post(
+                f'{self.api_base}/bot{self.token}/{method}', json=params, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise TelegramError(f'{method}: {e}')
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code == 429:
+            retry_after = (body.get('parameters') or {}).get('retry_after')
+            raise TelegramError(f'{method}: rate limited', retry_after=retry_after)
+        if response.status_code >= 400 or not body.get('ok'):
+            # 4xx means the request itself is bad (e.g. an expired file_id); retrying will not help
+            raise TelegramError(
+                f"{method}: {response.status_code} {body.get('description', '')}".strip(),
+                retryable=response.status_code >= 500,
+            )
+        return body.get('result')
+
+    def send_message(self, chat_id, text):
+        return self.call('sendMessage', chat_id=chat_id, text=text)
+
+    def get_file_path(self, file_id):
+        file_path = (self.call('getFile', file_id=file_id) or {}).get('file_path')
+        if not file_path:
+            raise TelegramError('getFile: no file_path', retryable=False)
+        return file_path
+
+    def download_file(self, file_path):
+        try:
+            response = self._session().get(
+                f'{self.api_base}/file/bot{self.token}/{file_path}', timeout=self.download_timeout
+            )
+        except requests.RequestException as e:
+            raise TelegramError(f'download: {e}')
+        if response.status_code != 200:
+            raise TelegramError(f'download: {response.status_code}', retryable=response.status_code >= 500)
+        return response.content
+
+
+class JobQueue:
+    def __init__(self, get_connection, workers=2, max_attempts=5, backoff_base=2.0, backoff_max=300.0,
+                 lease=120.0, poll_interval=1.0):
+        self.get_connection = get_connection
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease  # a running job whose worker died is retried after this many seconds
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._stats = {'processed': 0, 'retried': 0, 'failed': 0}
+
+    def register(self, kind, handler, on_failure=None):
+        """handler(payload) does the work; on_failure(payload) runs once when a job gives up"""
+        self.handlers[kind] = (handler, on_failure)
+
+    def ensure_started(self):
+        # Started lazily so each gunicorn worker runs its own threads after fork
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            if self._pid != os.getpid():
+                self._threads = []
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run, name=f'telegram-jobs-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def seen(self, update_id):
+        """Whether a job for this Telegram update_id was already enqueued"""
+        if update_id is None:
+            return False
+        conn = self.get_connection()
+        try:
+            return conn.execute('SELECT 1 FROM telegram_jobs WHERE update_id = ?', (update_id,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def enqueue(self, kind, payload, chat_id=None, update_id=None):
+        """Store a job; returns its id, or None when update_id was already queued"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO telegram_jobs (update_id, chat_id, kind, payload, run_after)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (update_id, chat_id, kind, json.dumps(payload), time.time()))
+            conn.commit()
+            job_id = cursor.lastrowid if cursor.rowcount else None
+        finally:
+            conn.close()
+        self.ensure_started()
+        self._wake.set()
+        return job_id
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[TELEGRAM JOBS] claim error: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._execute(*job)
+
+    def _claim(self):
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            # Cheap read first so idle workers never take the write lock
+            ready = '''
+                ((j.status = 'pending' AND j.run_after <= :now) OR (j.status = 'running' AND j.locked_until < :now))
+                AND NOT EXISTS (
+                    SELECT 1 FROM telegram_jobs e
+                    WHERE e.chat_id = j.chat_id AND e.id < j.id AND e.status IN ('pending', 'running')
+                )
+            '''
+            params = {'now': now, 'lease': self.lease}
+            if not conn.execute(f'SELECT 1 FROM telegram_jobs j WHERE {ready} LIMIT 1', params).fetchone():
+                return None
+            # Re-checked inside the UPDATE, so two workers never claim the same job
+            rows = conn.execute(f'''
+                UPDATE telegram_jobs
+                SET status = 'running', attempts = attempts + 1, locked_until = :now + :lease,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = (SELECT j.id FROM telegram_jobs j WHERE {ready} ORDER BY j.id LIMIT 1)
+                RETURNING id, kind, payload, attempts
+            ''', params).fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        if not rows:
+            return None
+        job_id, kind, payload, attempts = rows[0]
+        return job_id, kind, json.loads(payload), attempts
+
+    def _execute(self, job_id, kind, payload, attempts):
+        handler, on_failure = self.handlers.get(kind, (None, None))
+        try:
+            if handler is None:
+                raise TelegramError(f'unknown job kind {kind}', retryable=False)
+            handler(payload)
+        except Exception as e:
+            retryable = getattr(e, 'retryable', True)
+            if retryable and attempts < self.max_attempts:
+                delay = getattr(e, 'retry_after', None) or min(self.backoff_max, self.backoff_base ** attempts)
+                delay *= random.uniform(1.0, 1.25)
+                self._finish(job_id, 'pending', error=str(e), run_after=time.time() + delay)
+                self._count('retried')
+                return
+            print(f"[TELEGRAM JOBS] job {job_id} ({kind}) failed after {attempts} attempts: {e}")
+            self._finish(job_id, 'failed', error=str(e))
+            self._count('failed')
+            if on_failure:
+                try:
+                    on_failure(payload)
+                except Exception as failure_error:
+                    print(f"[TELEGRAM JOBS] on_failure error: {failure_error}")
+            return
+        self._finish(job_id, 'done')
+        self._count('processed')
+
+    def _finish(self, job_id, status, error=None, run_after=None):
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                UPDATE telegram_jobs
+                SET status = ?, last_error = COALESCE(?, last_error), run_after = COALESCE(?, run_after),
+                    locked_until = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, error, run_after, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        # A finished job may unblock the next one of the same chat
+        self._wake.set()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        conn = self.get_connection()
+        try:
+            by_status = dict(conn.execute('SELECT status, COUNT(*) FROM telegram_jobs GROUP BY status').fetchall())
+        finally:
+            conn.close()
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'pid': self._pid,
+            'workers_alive': sum(t.is_alive() for t in self._threads),
+            'jobs': by_status,
+        })
+        return stats
+
+
+def prune_jobs(cursor, keep_days=7):
+    """Drop finished jobs older than keep_days"""
+    cursor.execute('''
+        DELETE FROM telegram_jobs
+        WHERE status IN ('done', 'failed') AND updated_at < datetime('now', ?)
+    ''', (f'-{int(keep_days)} days',))
+    return cursor.rowcount
@@ -4,11 +4,21 @@ Build script for Tukkan deployment
 This script builds the React frontend and prepares the app for deployment
 """
 
+import gzip
 import os
 import subprocess
 import sys
 import shutil
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # .br siblings are skipped; the backend serves .gz instead
+
+# Text assets worth precompressing; images and fonts are already compressed
+PRECOMPRESS_EXTENSIONS = ('.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.map', '.xml', '.ico')
+PRECOMPRESS_MIN_SIZE = 1024
+
 def run_command(command, cwd=None):
     """Run a command and handle errors"""
     print(f"Running: {command}")
@@ -21,6 +31,32 @@ def run_command(command, cwd=None):
         print(f"Error output: {e.stderr}")
         return False
 
+def precompress(dist_path):
+    """Write .gz (and .br when brotli is installed) siblings next to the text assets in dist/.
+
+    The backend picks them up at startup and serves them to clients that accept
+    the encoding, so nothing is compressed per request.
+    """
+    written = 0
+    for dirpath, _, filenames in os.walk(dist_path):
+        for filename in filenames:
+            if not filename.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                content = f.read()
+            if len(content) < PRECOMPRESS_MIN_SIZE:
+                continue
+            variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(content, quality=11)))
+            for suffix, compressed in variants:
+                if len(compressed) < len(content):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+    return written
+
 def main():
     """Main build process"""
     print("🏗️  Building Tukkan for production deployment...")
@@ -51,6 +87,9 @@ def main():
         print("❌ index.html not found in dist/ directory")
         sys.exit(1)
     
+    print("\n🗜️  Precompressing static assets...")
+    print(f"   {precompress(dist_path)} compressed files written")
+    
     print("\n📋 Installing backend dependencies...")
     backend_path = os.path.join(project_root, 'backend')
     if not run_command("pip install -r requirements.txt", cwd=backend_path):
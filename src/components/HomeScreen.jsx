@@ -7,6 +7,7 @@ import Envanter from './Envanter';
 import Islemler from './Islemler';
 import Yonetici from './Yonetici';
 import { API_ENDPOINTS } from '../config/api.js';
+import { subscribeToChanges } from '../config/events.js';
 
 function HomeScreen() {
   const [currentPage, setCurrentPage] = useState('home');
@@ -53,10 +54,19 @@ function HomeScreen() {
 
   const loadDeliveries = async () => {
     try {
-      const res = await fetch(API_ENDPOINTS.ISLEMLER);
-      if (!res.ok) return setDeliveries([]);
-      const txs = await res.json();
-      const sales = (txs || []).filter(t => t.islem_tipi === 'satis');
+      // Every sale with a delivery date, however old, page by page: a ready flag is
+      // only cleared once its sale is really gone from this list
+      const sales = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ islem_tipi: 'satis', teslim: '1', fields: 'musteri,aciklama', limit: '500' });
+        if (cursor) params.set('cursor', cursor);
+        const res = await fetch(`${API_ENDPOINTS.ISLEMLER}?${params}`);
+        if (!res.ok) return;
+        const page = await res.json();
+        sales.push(...(page.items || []));
+        cursor = page.next_cursor;
+      } while (cursor);
       const extractDeliveryDate = (description) => {
         if (!description) return '';
         const m = description.match(/Teslim: (\d{4}-\d{2}-\d{2})/);
@@ -350,10 +360,10 @@ function HomeScreen() {
   // Fetch transactions data from backend
   const fetchTransactions = async () => {
     try {
-      const response = await fetch(API_ENDPOINTS.ISLEMLER);
+      const response = await fetch(`${API_ENDPOINTS.ISLEMLER}?limit=50`);
       if (response.ok) {
-        const data = await response.json();
-        setTransactions(data);
+        const page = await response.json();
+        setTransactions(page.items || []);
       } else {
         console.error('Failed to fetch transactions:', response.status);
       }
@@ -434,15 +444,15 @@ function HomeScreen() {
 
     useEffect(() => {
     loadOverduePayments();
-    
-    // Check for updates periodically
-    const paymentInterval = setInterval(loadOverduePayments, 2000);
     loadDeliveries();
-    const deliveryInterval = setInterval(loadDeliveries, 3000);
+    
+    // Reload when the server reports changes instead of polling
+    const unsubscribePayments = subscribeToChanges(['islemler', 'odeme_plani', 'taksit_detaylari'], loadOverduePayments);
+    const unsubscribeDeliveries = subscribeToChanges(['islemler'], loadDeliveries);
 
     return () => {
-      clearInterval(paymentInterval);
-      clearInterval(deliveryInterval);
+      unsubscribePayments();
+      unsubscribeDeliveries();
     };
   }, []); // Load once on component mount
 
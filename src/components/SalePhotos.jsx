@@ -110,7 +110,8 @@ const SalePhotos = ({ saleId }) => {
             return (
               <div key={photo.filename || index} style={{ position: 'relative' }}>
                 <img
-                  src={`https://tukkan-production.up.railway.app${photo.url}`}
+                  src={`https://tukkan-production.up.railway.app${photo.thumb_url || photo.url}`}
+                  loading="lazy"
                   alt={`Sale ${saleId} - ${photo.filename}`}
                   style={{
                     width: '100%',
@@ -94,15 +94,13 @@ function UrunSatis({ onBackToHome, onNavigate, inventoryItems, setInventoryItems
   const handleUndoLastTransaction = async () => {
     try {
       // Get the most recent transaction
-      const response = await fetch(API_ENDPOINTS.ISLEMLER);
+      const response = await fetch(`${API_ENDPOINTS.ISLEMLER}?islem_tipi=satis&limit=1`);
       if (!response.ok) {
         throw new Error('İşlemler yüklenemedi');
       }
       
-      const allTransactions = await response.json();
-      const lastTransaction = allTransactions
-        .filter(t => t.islem_tipi === 'satis')
-        .sort((a, b) => new Date(b.created_at) - new Date(a.created_at))[0];
+      const page = await response.json();
+      const lastTransaction = (page.items || [])[0];
       
       if (!lastTransaction) {
         setUndoNotification({
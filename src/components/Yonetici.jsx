@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { API_ENDPOINTS } from '../config/api.js';
+import { subscribeToChanges } from '../config/events.js';
 
 function Yonetici({ onBackToHome, onNavigate }) {
   // User management states
@@ -119,10 +120,9 @@ function Yonetici({ onBackToHome, onNavigate }) {
     loadAcikBorclar();
   }, []);
 
-  // Reload açık borçlar periodically to catch new purchases
+  // Reload açık borçlar when the server reports changes (e.g. new purchases)
   React.useEffect(() => {
-    const interval = setInterval(loadAcikBorclar, 3000); // Reload every 3 seconds
-    return () => clearInterval(interval);
+    return subscribeToChanges(['acik_borclar'], loadAcikBorclar);
   }, []);
 
   // Load beklenen odemeler from backend on component mount and when time simulation changes
@@ -1765,21 +1765,31 @@ function Yonetici({ onBackToHome, onNavigate }) {
 
 
 
-  // Add state for transactions and inventory
-  const [transactions, setTransactions] = useState([]);
+  // Add state for business metrics and inventory
+  const [businessMetrics, setBusinessMetrics] = useState(null);
   const [inventory, setInventory] = useState([]);
 
-  // Load transactions and inventory data for financial calculations
+  // Load server-side metrics (monthly rollups) for the selected year
   React.useEffect(() => {
-    const loadFinancialData = async () => {
+    const loadBusinessMetrics = async () => {
       try {
-        // Load transactions
-        const transactionsResponse = await fetch(API_ENDPOINTS.ISLEMLER);
-        if (transactionsResponse.ok) {
-          const transactionsData = await transactionsResponse.json();
-          setTransactions(transactionsData);
+        const response = await fetch(`${API_ENDPOINTS.METRICS}?year=${selectedYear}`);
+        if (response.ok) {
+          setBusinessMetrics(await response.json());
         }
-        
+      } catch (error) {
+        console.warn('Could not load business metrics:', error);
+      }
+    };
+
+    loadBusinessMetrics();
+    return subscribeToChanges(['islemler'], loadBusinessMetrics);
+  }, [selectedYear]);
+
+  // Load inventory data for financial calculations
+  React.useEffect(() => {
+    const loadFinancialData = async () => {
+      try {
         // Load inventory
         const inventoryResponse = await fetch(API_ENDPOINTS.ENVANTER);
         if (inventoryResponse.ok) {
@@ -1850,166 +1860,39 @@ function Yonetici({ onBackToHome, onNavigate }) {
   // Each section maintains its own year selection to avoid conflicts
 
   const renderFinansallar = () => {
-    // Calculate business metrics
-    const calculateBusinessMetrics = (year, month = null) => {
-      const salesTransactions = transactions.filter(t => {
-        const transactionDate = new Date(t.created_at);
-        const transactionYear = transactionDate.getFullYear();
-        const transactionMonth = transactionDate.getMonth() + 1;
-        
-        if (month) {
-          return t.islem_tipi === 'satis' && transactionYear === year && transactionMonth === month;
-        }
-        return t.islem_tipi === 'satis' && transactionYear === year;
-      });
-      
-      const purchaseTransactions = transactions.filter(t => {
-        const transactionDate = new Date(t.created_at);
-        const transactionYear = transactionDate.getFullYear();
-        const transactionMonth = transactionDate.getMonth() + 1;
-        
-        if (month) {
-          return t.islem_tipi === 'alis' && transactionYear === year && transactionMonth === month;
-        }
-        return t.islem_tipi === 'alis' && transactionYear === year;
-      });
-
-      // Calculate profitability directly from işlemler kar column
-      let totalProfit = 0;
-      let totalSalesRevenue = 0;
-      let totalProfitMargin = 0;
-      let validProfitTransactions = 0;
-      
-      salesTransactions.forEach(sale => {
-        const saleRevenue = sale.toplam_tutar;
-        totalSalesRevenue += saleRevenue;
-        
-        // Use the kar (profit) data that's already calculated in the işlemler table
-        // Note: The kar column contains profit percentage, so we use it directly
-        if (sale.kar !== undefined && sale.kar !== null && saleRevenue > 0) {
-          const profitMargin = parseFloat(sale.kar) || 0;
-          totalProfitMargin += profitMargin;
-          validProfitTransactions++;
-          
-          // Calculate actual profit amount from the profit margin
-          const transactionProfit = (saleRevenue * profitMargin) / 100;
-          totalProfit += transactionProfit;
-        }
-      });
-
-      // Average profitability is the average of all transaction profit margins from kar column
-      const avgProfitability = validProfitTransactions > 0 ? (totalProfitMargin / validProfitTransactions) : 0;
-
-      // Calculate volumes
-      const salesVolume = salesTransactions.reduce((sum, t) => sum + t.miktar, 0);
-      const purchaseVolume = purchaseTransactions.reduce((sum, t) => sum + t.miktar, 0);
+    // Business metrics come precomputed per month from /api/metrics
+    const getMetricsBucket = (year, month = null) => {
+      if (!businessMetrics || businessMetrics.year !== year) {
+        return null;
+      }
+      return month ? businessMetrics.months[month] : businessMetrics.total;
+    };
 
+    const calculateBusinessMetrics = (year, month = null) => {
+      const bucket = getMetricsBucket(year, month);
       return {
-        salesCount: salesTransactions.length,
-        purchaseCount: purchaseTransactions.length,
-        salesVolume,
-        purchaseVolume,
-        avgProfitability,
-        totalSalesRevenue,
-        totalProfit,
-        salesTransactions // Add this for payment type analysis
+        salesCount: bucket?.sales_count || 0,
+        purchaseCount: bucket?.purchase_count || 0,
+        salesVolume: bucket?.sales_volume || 0,
+        purchaseVolume: bucket?.purchase_volume || 0,
+        avgProfitability: bucket?.avg_profitability || 0,
+        totalSalesRevenue: bucket?.sales_revenue || 0,
+        totalProfit: bucket?.total_profit || 0
       };
     };
 
-    // Calculate payment type breakdown (cash vs card vs mail order)
+    // Payment type breakdown (cash vs card vs mail order)
     const calculatePaymentTypeBreakdown = (year, month = null) => {
-      const salesTransactions = transactions.filter(t => {
-        const transactionDate = new Date(t.created_at);
-        const transactionYear = transactionDate.getFullYear();
-        const transactionMonth = transactionDate.getMonth() + 1;
-        
-        if (month) {
-          return t.islem_tipi === 'satis' && transactionYear === year && transactionMonth === month;
-        }
-        return t.islem_tipi === 'satis' && transactionYear === year;
-      });
-
-      let cashTotal = 0;
-      let cardTotal = 0;
-      let mailOrderTotal = 0;
-      let cashCount = 0;
-      let cardCount = 0;
-      let mailOrderCount = 0;
-
-      salesTransactions.forEach(sale => {
-        const pesinAmount = sale.pesin_miktar || 0;
-        const taksitAmount = sale.taksit_miktar || 0;
-        
-        // Check payment types from description for detailed breakdown
-        const description = sale.aciklama || '';
-        const isTaksitKart = description.includes('Taksit_Odeme_Tipi: kart');
-        const isPesinKart = description.includes('Pesin_Odeme_Tipi: kart');
-        const isMailOrder = description.includes('Mail_Order: true');
-        
-        // Determine payment types based on overall payment type and description
-        const paymentType = sale.odeme_tipi || 'nakit';
-        
-        if (isMailOrder) {
-          // Mail order transactions
-          mailOrderTotal += sale.toplam_tutar;
-          mailOrderCount++;
-        } else if (paymentType === 'kart' || paymentType === 'kredi') {
-          // Full card payment
-          cardTotal += sale.toplam_tutar;
-          cardCount++;
-        } else if (paymentType === 'nakit') {
-          // Full cash payment
-          cashTotal += sale.toplam_tutar;
-          cashCount++;
-        } else if (paymentType === 'taksit') {
-          // Only installment payment - check if it's kart or nakit
-          if (isTaksitKart) {
-            cardTotal += sale.toplam_tutar;
-            cardCount++;
-          } else {
-            cashTotal += sale.toplam_tutar;
-            cashCount++;
-          }
-        } else if (paymentType === 'pesin+taksit') {
-          // Mixed payment - check individual parts using description
-          
-          // Handle peşin portion
-          if (pesinAmount > 0) {
-            if (isPesinKart) {
-              cardTotal += pesinAmount;
-              cardCount++;
-            } else {
-              cashTotal += pesinAmount;
-              cashCount++;
-            }
-          }
-          
-          // Handle taksit portion
-          if (taksitAmount > 0) {
-            if (isTaksitKart) {
-              cardTotal += taksitAmount;
-              cardCount++;
-            } else {
-              cashTotal += taksitAmount;
-              cashCount++;
-            }
-          }
-        } else {
-          // Default to cash for any other payment types
-          cashTotal += sale.toplam_tutar;
-          cashCount++;
-        }
-      });
-
+      const bucket = getMetricsBucket(year, month);
       return {
-        cashTotal,
-        cardTotal,
-        mailOrderTotal,
-        cashCount,
-        cardCount,
-        mailOrderCount,
-        totalAmount: cashTotal + cardTotal + mailOrderTotal,
-        totalCount: salesTransactions.length
+        cashTotal: bucket?.cash_total || 0,
+        cardTotal: bucket?.card_total || 0,
+        mailOrderTotal: bucket?.mail_order_total || 0,
+        cashCount: bucket?.cash_count || 0,
+        cardCount: bucket?.card_count || 0,
+        mailOrderCount: bucket?.mail_order_count || 0,
+        totalAmount: bucket?.payment_total || 0,
+        totalCount: bucket?.sales_count || 0
       };
     };
 
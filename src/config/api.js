@@ -36,12 +36,14 @@ export const API_ENDPOINTS = {
   BEKLENEN_ODEMELER: `${API_BASE_URL}/api/beklenen-odemeler`,
   PLANLANAN_ODEMELER: `${API_BASE_URL}/api/planlanan-odemeler`,
   NAKIT_AKISI: `${API_BASE_URL}/api/nakit-akisi`,
+  METRICS: `${API_BASE_URL}/api/metrics`,  // Monthly sales/purchase rollups, ?year=YYYY
   
   // Employee endpoints
   CALISANLAR: `${API_BASE_URL}/api/calisanlar`,
   
   // Other endpoints
   HEALTH: `${API_BASE_URL}/api/health`,
+  EVENTS: `${API_BASE_URL}/api/events`,  // Server-Sent Events change stream
   
   // Media endpoints
   SALE_MEDIA: `${API_BASE_URL}/api/sales`,  // Use with buildApiUrl for /api/sales/{id}/media
@@ -0,0 +1,54 @@
+import { API_ENDPOINTS } from './api.js';
+
+// One EventSource per tab, shared by every subscriber: each open stream holds a
+// server thread, so components filter the shared stream instead of opening their own.
+const listeners = new Set();
+let source = null;
+
+const openSource = () => {
+  // Unfiltered: change events are tiny and every table someone listens to is covered
+  source = new EventSource(API_ENDPOINTS.EVENTS);
+  source.addEventListener('change', (e) => {
+    let table = null;
+    try { table = JSON.parse(e.data).table; } catch {}
+    listeners.forEach(listener => listener(table));
+  });
+  // A reset (replay impossible, or the server is full and sends us back to polling)
+  // concerns everyone
+  source.addEventListener('reset', () => listeners.forEach(listener => listener(null)));
+};
+
+// Subscribe to server-sent change notifications for the given tables.
+// `onChange` is called (debounced) whenever one of the tables changes, and also
+// after a `reset` event, when the server could not replay what we missed.
+// Falls back to interval polling when EventSource is not available.
+export const subscribeToChanges = (tables, onChange, { debounceMs = 250, fallbackIntervalMs = 3000 } = {}) => {
+  if (typeof window === 'undefined' || typeof window.EventSource === 'undefined') {
+    const interval = setInterval(onChange, fallbackIntervalMs);
+    return () => clearInterval(interval);
+  }
+
+  let timer = null;
+  const watched = new Set(tables);
+  const listener = (table) => {
+    if (table !== null && !watched.has(table)) return;
+    if (timer) return;
+    timer = setTimeout(() => {
+      timer = null;
+      onChange();
+    }, debounceMs);
+  };
+
+  listeners.add(listener);
+  // EventSource reconnects on its own and sends Last-Event-ID for replay
+  if (!source) openSource();
+
+  return () => {
+    if (timer) clearTimeout(timer);
+    listeners.delete(listener);
+    if (listeners.size === 0 && source) {
+      source.close();
+      source = null;
+    }
+  };
+};